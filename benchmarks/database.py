@@ -0,0 +1,101 @@
+"""
+Compare the default sqlite engine with the tuned engine profile of `setup_engine`.
+
+Writes are measured the way `save()` stores results, one transaction per build.
+Reads are measured with `get_rebuild_data`, as used by the status and HTML commands.
+Both run on fresh copies of the given database, the original is never modified.
+
+Usage: python benchmarks/database.py [--writes N] [--reads N] [repro.db]
+"""
+
+import argparse
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+from unittest.mock import patch
+
+from sqlalchemy.orm import sessionmaker
+from sqlmodel import Session, SQLModel, create_engine
+
+from repror.internals.db import (
+    Build,
+    BuildState,
+    create_sqlite_engine,
+    get_rebuild_data,
+    update_latest_builds,
+)
+from repror.internals.migrations import migrate
+
+
+def default_engine(path: Path, read_only: bool = False):
+    return create_engine(f"sqlite:///{path}")
+
+
+def tuned_engine(path: Path, read_only: bool = False):
+    return create_sqlite_engine(str(path), read_only)
+
+
+def time_writes(engine, writes: int) -> float:
+    """Save `writes` builds in separate transactions and return the builds per second."""
+    start = time.perf_counter()
+    for index in range(writes):
+        with Session(engine) as session:
+            build = Build(
+                recipe_name=f"benchmark-{index % 100}",
+                state=BuildState.SUCCESS,
+                build_tool_hash="benchmark",
+                recipe_hash="benchmark",
+                platform_name="benchmark",
+                platform_version="benchmark",
+                build_hash="benchmark",
+                timestamp=datetime.now(),
+            )
+            session.add(build)
+            session.flush()
+            update_latest_builds(session, [build.id])
+            session.commit()
+    return writes / (time.perf_counter() - start)
+
+
+def time_reads(engine, reads: int) -> float:
+    """Query the latest builds `reads` times and return the queries per second."""
+    session = sessionmaker(bind=engine, class_=Session, expire_on_commit=False)
+    start = time.perf_counter()
+    with patch("repror.internals.db.get_session", side_effect=session):
+        for _ in range(reads):
+            get_rebuild_data()
+    return reads / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("database", nargs="?", default="repro.db", type=Path)
+    parser.add_argument("--writes", type=int, default=500)
+    parser.add_argument("--reads", type=int, default=50)
+    args = parser.parse_args()
+
+    if not args.database.exists():
+        sys.exit(
+            f"{args.database} does not exist, download it with `gh release download database`"
+        )
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for name, make_engine in [("default", default_engine), ("tuned", tuned_engine)]:
+            copy = Path(tmp_dir) / f"{name}.db"
+            shutil.copyfile(args.database, copy)
+            engine = make_engine(copy)
+            # Bring the copy to the current schema, like `setup_engine` does
+            SQLModel.metadata.create_all(engine)
+            migrate(engine)
+
+            writes = time_writes(engine, args.writes)
+            engine.dispose()
+            reads = time_reads(make_engine(copy, read_only=True), args.reads)
+            print(f"{name:<8} {writes:8.1f} writes/s {reads:8.1f} reads/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+"""
+Measure the cold start time of the repror CLI.
+
+Every CI job invokes repror a couple of times, so the time it takes to start
+the interpreter and import the CLI is paid over and over again.
+
+Usage: python benchmarks/startup.py [--runs N] [-- repror arguments]
+"""
+
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+
+
+def time_command(command: list[str], runs: int) -> list[float]:
+    """Run the command `runs` times and return the wall time of each run."""
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(command, check=True, capture_output=True)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("repror_args", nargs="*", default=["--help"])
+    args = parser.parse_args()
+
+    baseline = time_command([sys.executable, "-c", "pass"], args.runs)
+    repror = time_command(
+        [sys.executable, "-m", "repror.repror", *args.repror_args], args.runs
+    )
+
+    print(f"python startup:          {statistics.median(baseline) * 1000:7.1f} ms")
+    print(
+        f"repror {' '.join(args.repror_args):<16} {statistics.median(repror) * 1000:7.1f} ms"
+    )
+    print(
+        f"import overhead:         {(statistics.median(repror) - statistics.median(baseline)) * 1000:7.1f} ms"
+    )
+
+
+if __name__ == "__main__":
+    main()
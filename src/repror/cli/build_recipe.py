@@ -1,17 +1,38 @@
+from collections import deque
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    Future,
+    ThreadPoolExecutor,
+    as_completed,
+    wait,
+)
 import os
 import shutil
-from typing import Optional
+from typing import Literal, Optional
 import platform
 from pathlib import Path
 
-from repror.cli.utils import build_to_table
+from repror.cli.rebuild_recipe import (
+    prepare_rebuild_artifact_dirs,
+    rebuild_package,
+    record_rebuild_result,
+)
+from repror.cli.utils import build_to_table, failures_to_table
 from repror.internals.build import (
     BuildInfo,
     BuildResult,
     build_recipe,
 )
 from repror.internals.config import load_all_recipes
-from repror.internals.db import get_latest_builds, save, Recipe, RemoteRecipe
+from repror.internals.db import (
+    Build,
+    BuildState,
+    get_latest_build_with_rebuild,
+    get_latest_builds,
+    save,
+    Recipe,
+    RemoteRecipe,
+)
 from repror.internals.rattler_build import rattler_build_hash
 from repror.internals.build import BuildStatus
 from repror.internals.patcher import save_patch
@@ -47,7 +68,7 @@ def recipes_for_names(
 def _build_recipe(
     recipe: Recipe | RemoteRecipe, tmp_dir: Path, build_dir: Path, build_info: BuildInfo
 ) -> BuildResult:
-    # make output dir per package
+    # make output dir per package, so that concurrent builds never share one
     package_output_dir = build_dir / recipe.name
     if package_output_dir.exists():
         shutil.rmtree(package_output_dir)
@@ -55,23 +76,19 @@ def _build_recipe(
     return build_recipe(recipe, package_output_dir, build_info)
 
 
-def build_recipes(
+def _plan_builds(
     recipes: list[Recipe | RemoteRecipe],
     tmp_dir: Path,
+    build_info: BuildInfo,
     force: bool = False,
-    patch: bool = False,
-    actions_url: Optional[str] = None,
-):
+) -> list[tuple[Recipe | RemoteRecipe, Path, Path, BuildInfo]]:
     """
-    Build recipes using rattler-build
+    Find the recipes that still need to be built and print an overview table
     """
-    platform_name, platform_version = platform.system().lower(), platform.release()
-
     build_dir = Path("build_outputs")
     build_dir.mkdir(exist_ok=True)
 
     os.makedirs("build_info", exist_ok=True)
-    rattler_hash = rattler_build_hash()
 
     to_build = []
 
@@ -81,17 +98,12 @@ def build_recipes(
 
     latest_builds = get_latest_builds(
         recipes_to_find,
-        rattler_hash,
-        platform_name,
-        platform_version,
+        build_info.rattler_build_hash,
+        build_info.platform,
+        build_info.platform_version,
     )
 
     for recipe in recipes:
-        build_info = BuildInfo(
-            rattler_build_hash=rattler_hash,
-            platform=platform_name,
-            platform_version=platform_version,
-        )
         recipe_build = latest_builds.get(recipe.name)
 
         if recipe_build and not force:
@@ -104,25 +116,181 @@ def build_recipes(
     sort = {BuildStatus.ToBuild: 0, BuildStatus.AlreadyBuilt: 1}
     recipe_status = sorted(recipe_status, key=lambda status: sort.get(status[1]) or 1)
     table = Table("Name", "Status", title="Recipes to build")
-    for recipe, status in recipe_status:
-        table.add_row(recipe, status)
+    for name, status in recipe_status:
+        table.add_row(name, status)
 
     print(table)
-    for recipe, tmp_dir, build_dir, build_info in to_build:
-        build_result = _build_recipe(recipe, tmp_dir, build_dir, build_info)
-        print(build_to_table(build_result.build))
-
-        if actions_url:
-            build_result.build.actions_url = actions_url
-
-        failure = build_result.failed
-        if patch:
-            print(f"Saving patch for {build_result.build.recipe_name}")
-            save_patch(build_result.build)
-
-        # We need to save the rebuild result to the database
-        # even though we are using patches because we might invoke
-        # the process again before the patch being applied
-        save(build_result.build)
-        if failure:
-            raise ValueError(f"Build failed for {recipe.name}")
+    return to_build
+
+
+def _current_build_info() -> BuildInfo:
+    platform_name, platform_version = platform.system().lower(), platform.release()
+    return BuildInfo(
+        rattler_build_hash=rattler_build_hash(),
+        platform=platform_name,
+        platform_version=platform_version,
+    )
+
+
+def build_recipes(
+    recipes: list[Recipe | RemoteRecipe],
+    tmp_dir: Path,
+    force: bool = False,
+    patch: bool = False,
+    actions_url: Optional[str] = None,
+    jobs: int = 1,
+):
+    """
+    Build recipes using rattler-build, running up to `jobs` builds at the same time.
+    Failures do not abort the batch, they are collected and reported at the end.
+    """
+    to_build = _plan_builds(recipes, tmp_dir, _current_build_info(), force)
+
+    # Builds are independent rattler-build invocations, each writing to its own
+    # output directory, so we can run them concurrently. The results are handled
+    # on this thread only, which keeps the database writes serialized.
+    failures: list[tuple[str, str]] = []
+    with ThreadPoolExecutor(max_workers=max(jobs, 1)) as executor:
+        futures = {
+            executor.submit(_build_recipe, *build_args): build_args[0]
+            for build_args in to_build
+        }
+        for future in as_completed(futures):
+            recipe = futures[future]
+            try:
+                build_result = future.result()
+            except Exception as e:
+                failures.append((recipe.name, str(e)))
+                continue
+
+            record_build_result(build_result, patch, actions_url)
+            if build_result.failed:
+                failures.append((recipe.name, "Build failed"))
+
+    if failures:
+        print(failures_to_table(failures, title="Failed builds"))
+        raise ValueError(f"Build failed for {', '.join(name for name, _ in failures)}")
+
+
+def build_and_rebuild_recipes(
+    recipes: list[Recipe | RemoteRecipe],
+    tmp_dir: Path,
+    force: bool = False,
+    patch: bool = False,
+    actions_url: Optional[str] = None,
+    jobs: int = 1,
+):
+    """
+    Build and rebuild recipes as a pipeline. The rebuild of a recipe is queued as soon
+    as its build succeeds, so rebuilds of early recipes overlap with the builds of later ones.
+    At most `jobs` builds and rebuilds run at once. Failures of either stage are collected and reported at the end.
+    """
+    build_info = _current_build_info()
+    to_build = _plan_builds(recipes, tmp_dir, build_info, force)
+    prepare_rebuild_artifact_dirs(build_info.platform)
+
+    # Recipes that do not need a build can go to the rebuild stage straight away
+    to_build_names = {recipe.name for recipe, *_ in to_build}
+    already_built = [recipe for recipe in recipes if recipe.name not in to_build_names]
+    latest_build_with_rebuild = (
+        get_latest_build_with_rebuild(
+            [(recipe.name, recipe.content_hash) for recipe in already_built],
+            build_info.rattler_build_hash,
+            build_info.platform,
+            build_info.platform_version,
+        )
+        if already_built
+        else {}
+    )
+
+    failures: list[tuple[str, str]] = []
+    workers = max(jobs, 1)
+    # Builds and rebuilds share the workers, so at most `jobs` of them run at once.
+    # Tasks are only submitted when a worker is free, so a ready rebuild goes first
+    # instead of queueing behind all builds.
+    builds = deque(to_build)
+    rebuilds: deque[tuple[Recipe, Build]] = deque()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending: dict[Future, tuple[Literal["build", "rebuild"], Recipe]] = {}
+
+        def submit_ready():
+            while len(pending) < workers and (rebuilds or builds):
+                if rebuilds:
+                    recipe, build = rebuilds.popleft()
+                    future = executor.submit(
+                        rebuild_package, build, recipe, tmp_dir, build_info
+                    )
+                    pending[future] = ("rebuild", recipe)
+                else:
+                    build_args = builds.popleft()
+                    future = executor.submit(_build_recipe, *build_args)
+                    pending[future] = ("build", build_args[0])
+
+        for recipe in already_built:
+            latest_build, latest_rebuild = latest_build_with_rebuild.get(
+                recipe.name, (None, None)
+            )
+            if not latest_build:
+                failures.append((recipe.name, "No build found. Cannot rebuild."))
+            elif latest_build.state == BuildState.FAIL:
+                failures.append((recipe.name, "Build failed. Cannot rebuild."))
+            elif latest_rebuild and not force:
+                print(
+                    f"Found latest rebuild for {recipe.name}. Skipping rebuilding it again"
+                )
+            else:
+                rebuilds.append((recipe, latest_build))
+        submit_ready()
+
+        # Results are handled on this thread only, which keeps the database
+        # writes serialized and makes sure a build is saved before its rebuild starts
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage, recipe = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    failures.append((recipe.name, f"{stage}: {e}"))
+                    continue
+
+                if isinstance(result, BuildResult):
+                    record_build_result(result, patch, actions_url)
+                    if result.failed:
+                        failures.append((recipe.name, "Build failed"))
+                    else:
+                        rebuilds.append((recipe, result.build))
+                else:
+                    record_rebuild_result(result, patch, actions_url)
+                    if result.failed:
+                        failures.append((recipe.name, "Rebuild failed"))
+                    else:
+                        print(f"[bold green]Done: '{recipe.name}' [/bold green]")
+            submit_ready()
+
+    if failures:
+        print(failures_to_table(failures, title="Failed builds and rebuilds"))
+        raise ValueError(
+            f"Build or rebuild failed for {', '.join(name for name, _ in failures)}"
+        )
+
+
+def record_build_result(
+    build_result: BuildResult, patch: bool = False, actions_url: Optional[str] = None
+):
+    """
+    Print and store the result of a single build
+    """
+    print(build_to_table(build_result.build))
+
+    if actions_url:
+        build_result.build.actions_url = actions_url
+
+    if patch:
+        print(f"Saving patch for {build_result.build.recipe_name}")
+        save_patch(build_result.build)
+
+    # We need to save the rebuild result to the database
+    # even though we are using patches because we might invoke
+    # the process again before the patch being applied
+    save(build_result.build)
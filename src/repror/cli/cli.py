@@ -1,32 +1,24 @@
+import importlib
 import os
 import platform
+import sys
 import tempfile
 import logging
 from pathlib import Path
 from typing import Annotated, Optional
 
+import click
 import typer
+from dotenv import load_dotenv
+from typer.core import TyperGroup
 
-from rich.spinner import Spinner
-from rich.live import Live
-
-from repror.internals.config import load_config
-from repror.internals.db import get_rebuild_data, setup_engine
 from repror.internals.print import print
-from repror.internals import patch_database
-from repror.internals.rattler_build import rattler_build_hash
 
-# Different CLI commands
-from . import build_recipe as build
-from . import generate_recipes as generate
-from . import generate_html as html
-from . import setup_rattler_build as setup
-from . import rebuild_recipe as rebuild
-from . import v1_sampler
-from .utils import pixi_root_cli, platform_name, reproducible_table
+from ..internals.options import PatchFormat, global_options
 
-from ..internals.options import global_options
-from ..internals.config import load_all_recipes
+# The modules implementing the different CLI commands are imported in the commands
+# themselves, so that a command only pays for the imports it actually needs.
+# This keeps the startup time of e.g. `repror --help` and `generate-recipes` low.
 
 
 def _print_status(msg: str) -> None:
@@ -38,18 +30,85 @@ def _print_status(msg: str) -> None:
     console.print(msg)
 
 
-app = typer.Typer(no_args_is_help=True, pretty_exceptions_enable=False)
+class LazyTyperGroup(TyperGroup):
+    """
+    Typer group that imports the typer apps of its sub groups only when they are invoked.
+    Listing them, e.g. in the help output, only needs their name and help text.
+    """
 
-# Set up logging by reading the LOG_LEVEL environment variable
-logging.basicConfig(level=os.environ.get("LOG_LEVEL", "INFO").upper())
+    # Name of the sub group -> (module:attribute of the typer app, help text)
+    lazy_subgroups: dict[str, tuple[str, str]] = {
+        "v1": (
+            "repror.cli.v1_sampler:app",
+            "Commands for V1 recipe package sampling and rebuilding",
+        ),
+    }
+
+    def list_commands(self, ctx: click.Context) -> list[str]:
+        return super().list_commands(ctx) + sorted(self.lazy_subgroups)
+
+    def get_command(self, ctx: click.Context, cmd_name: str) -> Optional[click.Command]:
+        if cmd_name in self.lazy_subgroups:
+            _, help = self.lazy_subgroups[cmd_name]
+            return click.Group(cmd_name, help=help)
+        return super().get_command(ctx, cmd_name)
+
+    def resolve_command(self, ctx: click.Context, args: list[str]):
+        cmd_name = args[0] if args else None
+        if cmd_name in self.lazy_subgroups:
+            return cmd_name, self._load_subgroup(cmd_name), args[1:]
+        return super().resolve_command(ctx, args)
+
+    def _load_subgroup(self, cmd_name: str) -> click.Command:
+        import_path, help = self.lazy_subgroups[cmd_name]
+        module_name, attribute = import_path.split(":")
+        sub_app: typer.Typer = getattr(importlib.import_module(module_name), attribute)
+        # Unlike `get_command`, this does not add the completion options,
+        # which only the top level command has
+        group = typer.main.get_group(sub_app)
+        group.name = cmd_name
+        group.help = help
+        return group
+
+
+app = typer.Typer(
+    cls=LazyTyperGroup, no_args_is_help=True, pretty_exceptions_enable=False
+)
 
 
 @app.callback()
 def main(
     skip_setup_rattler_build: bool = False,
     in_memory_sql: bool = False,
+    read_only: Annotated[
+        bool,
+        typer.Option(
+            help="Open the database read-only, e.g. for generate-html and status"
+        ),
+    ] = False,
     no_output: bool = False,
     config_path: str = "config.yaml",
+    patch_format: Annotated[
+        PatchFormat,
+        typer.Option(help="Format of the patches written with --patch"),
+    ] = PatchFormat.JSON,
+    log_dir: Annotated[
+        Optional[Path],
+        typer.Option(
+            help="Keep the complete output of builds and rebuilds in this directory, gzip compressed"
+        ),
+    ] = None,
+    command_timeout: Annotated[
+        Optional[float],
+        typer.Option(
+            min=1,
+            help="Kill builds and rebuilds that are still running after this many seconds",
+        ),
+    ] = None,
+    profile_import: Annotated[
+        bool,
+        typer.Option(help="Report where the startup time of the command is spent"),
+    ] = False,
 ):
     """
     \bRepror is a tool to:
@@ -57,15 +116,40 @@ def main(
     - Manage a local rattler-build environment for custom builds
     - Rewrite the reproducible-builds README.md file with update statistics
     """
+    if profile_import:
+        from repror.internals.import_profile import profile_imports
+
+        args = [arg for arg in sys.argv[1:] if arg != "--profile-import"]
+        exit_code, report = profile_imports(args)
+        print(report)
+        raise typer.Exit(exit_code)
+
+    from repror.internals.db import setup_engine
+    from repror.internals.migrations import DatabaseNotMigratedError
+
+    # Load the environment from a .env file, e.g. the REPROR_UPDATE_TOKEN
+    load_dotenv()
+    # Set up logging by reading the LOG_LEVEL environment variable
+    logging.basicConfig(level=os.environ.get("LOG_LEVEL", "INFO").upper())
+
     global_options.no_output = no_output
     global_options.config_path = config_path
+    global_options.patch_format = patch_format
+    global_options.log_dir = log_dir
+    global_options.command_timeout = command_timeout
     if skip_setup_rattler_build:
         _print_status("[dim yellow]Will skip setting up rattler-build[/dim yellow]")
         global_options.skip_setup_rattler_build = True
     if in_memory_sql:
         _print_status("[yellow]Will use in-memory SQLite database[/yellow]")
         global_options.in_memory_sql = True
-    setup_engine(in_memory_sql)
+    if read_only:
+        global_options.read_only = True
+    try:
+        setup_engine(in_memory_sql, read_only)
+    except DatabaseNotMigratedError as e:
+        print(f"[red]{e}[/red]")
+        raise typer.Exit(1)
 
 
 @app.command()
@@ -75,6 +159,9 @@ def generate_recipes(
     ] = False,
 ):
     """Generate list of recipes from the configuration file. By default it will print only the ones that are not built yet."""
+    from repror.internals.rattler_build import rattler_build_hash
+    from . import generate_recipes as generate
+
     generate.generate_recipes(rattler_build_hash=rattler_build_hash(), all_=all_)
 
 
@@ -83,6 +170,12 @@ def _check_local_rattler_build():
     if global_options.skip_setup_rattler_build:
         return
 
+    from rich.spinner import Spinner
+    from rich.live import Live
+    from repror.internals.config import load_config
+    from . import setup_rattler_build as setup
+    from .utils import pixi_root_cli
+
     spinner_type = "simpleDots" if platform.system() == "Windows" else "dots"
     live_update_message = (
         "Rattler build setup complete ({outcome})"
@@ -105,8 +198,28 @@ def build_recipe(
     patch: Annotated[bool, typer.Option()] = False,
     run_rebuild: Annotated[bool, typer.Option("--rebuild")] = False,
     actions_url: Annotated[Optional[str], typer.Option()] = None,
+    jobs: Annotated[
+        int,
+        typer.Option(
+            "--jobs",
+            "-j",
+            min=1,
+            help="Number of recipes to build at once. With --pipeline, builds and rebuilds share these jobs",
+        ),
+    ] = 1,
+    pipeline: Annotated[
+        bool,
+        typer.Option(
+            help="With --rebuild, start rebuilding a recipe as soon as its build succeeds"
+        ),
+    ] = False,
 ):
     """Build recipe for specified recipe name."""
+    from repror.internals.db import get_rebuild_data
+    from . import build_recipe as build
+    from . import rebuild_recipe as rebuild
+    from .utils import platform_name, reproducible_table
+
     with tempfile.TemporaryDirectory() as tmp_dir:
         if not rattler_build_exe:
             _check_local_rattler_build()
@@ -116,12 +229,21 @@ def build_recipe(
             recipe_names, global_options.config_path
         )
 
-        build.build_recipes(recipes_to_build, Path(tmp_dir), force, patch, actions_url)
-        if run_rebuild:
-            print("Rebuilding recipes...")
-            rebuild.rebuild_recipe(
-                recipes_to_build, Path(tmp_dir), force, patch, actions_url
+        if run_rebuild and pipeline:
+            build.build_and_rebuild_recipes(
+                recipes_to_build, Path(tmp_dir), force, patch, actions_url, jobs
+            )
+        else:
+            build.build_recipes(
+                recipes_to_build, Path(tmp_dir), force, patch, actions_url, jobs
             )
+            if run_rebuild:
+                print("Rebuilding recipes...")
+                rebuild.rebuild_recipe(
+                    recipes_to_build, Path(tmp_dir), force, patch, actions_url
+                )
+
+        if run_rebuild:
             print("Verifying if rebuilds are reproducible...")
             builds = get_rebuild_data(recipe_names, platform_name())
             print(
@@ -142,6 +264,9 @@ def rebuild_recipe(
     actions_url: Annotated[Optional[str], typer.Option()] = None,
 ):
     """Rebuild recipe from a string in the form of url::branch::path."""
+    from . import build_recipe as build
+    from . import rebuild_recipe as rebuild
+
     with tempfile.TemporaryDirectory() as tmp_dir:
         if not rattler_build_exe:
             _check_local_rattler_build()
@@ -158,6 +283,9 @@ def rebuild_recipe(
 @app.command()
 def merge_patches(update_remote: Annotated[bool, typer.Option()] = False):
     """Merge database patches after CI jobs run to the database."""
+    from repror.internals import patch_database
+    from repror.internals.config import load_all_recipes
+
     num_builds_patches = patch_database.patch_builds_to_db()
 
     if num_builds_patches > 0:
@@ -178,10 +306,17 @@ def merge_patches(update_remote: Annotated[bool, typer.Option()] = False):
 def generate_html(
     update_remote: Annotated[Optional[bool], typer.Option()] = None,
     remote_branch: Annotated[Optional[str], typer.Option()] = None,
+    days: Annotated[
+        Optional[int],
+        typer.Option(help="Number of days of history to show in the graphs"),
+    ] = None,
 ):
     """Generate the HTML file with the statistics of the reproducible builds."""
+    from . import generate_html as html
+    from .utils import pixi_root_cli
+
     html.rerender_html(
-        root_folder=pixi_root_cli(), update_remote=update_remote or False
+        root_folder=pixi_root_cli(), update_remote=update_remote or False, days=days
     )
 
 
@@ -197,14 +332,10 @@ def status(
     platform: Annotated[str, typer.Option()] = platform.system().lower(),
 ):
     """Check if recipe name[s] is reproducible for your platform, by verifying it's build and rebuild hash."""
+    from repror.internals.db import get_rebuild_data
+    from . import build_recipe as build
+    from .utils import reproducible_table
+
     recipe_names = [recipe.name for recipe in build.recipes_for_names(recipe_names)]
     builds = get_rebuild_data(recipe_names, platform)
     print(reproducible_table(recipe_names, builds, platform))
-
-
-# Add v1 sampler subcommands
-app.add_typer(
-    v1_sampler.app,
-    name="v1",
-    help="Commands for V1 recipe package sampling and rebuilding",
-)
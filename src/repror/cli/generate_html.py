@@ -12,16 +12,22 @@ from jinja2 import Environment, FileSystemLoader
 
 from repror.internals.db import (
     BuildState,
+    SuccessfulBuildsAndRebuilds,
     get_rebuild_data,
-    get_total_successful_builds_and_rebuilds,
+    get_successful_builds_and_rebuilds_series,
     get_v1_rebuild_data,
     get_v1_rebuild_stats,
-    get_v1_rebuild_stats_before,
+    get_v1_rebuild_stats_series,
 )
-from repror.internals.git import github_api
+from repror.cli.utils import format_duration, format_size
+from repror.internals.git import get_github_api
 from repror.internals.print import print
 from repror.internals.config import load_all_recipes
 
+# Default number of days shown in the graphs of the pages
+INDEX_HISTORY_DAYS = 10
+V1_HISTORY_DAYS = 14
+
 
 class StatisticData(BaseModel):
     build_state: BuildState
@@ -31,6 +37,10 @@ class StatisticData(BaseModel):
     reason: Optional[str] = None
     time: str
     actions_url: Optional[str] = None
+    # Wall time in seconds of the build and the rebuild, and their peak memory
+    build_time: Optional[float] = None
+    rebuild_time: Optional[float] = None
+    max_rss: Optional[int] = None
 
     @property
     def is_success(self):
@@ -100,6 +110,13 @@ def interpolate_color(percentage: float):
     return (r, g, b)
 
 
+def daily_timestamps(days: int) -> list[datetime]:
+    """Get the end of each of the last `days` days, including today"""
+    start = datetime.now() - timedelta(days=days - 1)
+    end_of_day = datetime(start.year, start.month, start.day, 23, 59, 59)
+    return [end_of_day + timedelta(days=i) for i in range(0, days)]
+
+
 def get_docs_dir(root_folder: Path):
     """Get the docs directory path. By default get the local docs directory."""
     docs = os.getenv("REPRO_DOCS_DIR", "docs.local")
@@ -117,6 +134,8 @@ def create_jinja_env() -> Environment:
         loader=FileSystemLoader(searchpath=Path(__file__).parent / "templates")
     )
     env.filters["platform_fa"] = platform_fa
+    env.filters["duration"] = format_duration
+    env.filters["filesize"] = format_size
     return env
 
 
@@ -124,6 +143,7 @@ def render_index_html(
     env: Environment,
     docs_folder: Path,
     config_path: Path = Path("config.yaml"),
+    days: int = INDEX_HISTORY_DAYS,
 ) -> str:
     """Render the main index.html page with recipe build data."""
     builds = get_rebuild_data()
@@ -131,22 +151,19 @@ def render_index_html(
 
     # Statistics for graph
     counts_per_platform = {}
-    # Get the last 10 days
-    start = datetime.now() - timedelta(days=9)
-    end_of_day = datetime(start.year, start.month, start.day, 23, 59, 59)
-    timestamps = [end_of_day + timedelta(days=i) for i in range(0, 10)]
+    # Get the last days
+    timestamps = daily_timestamps(days)
+    series = get_successful_builds_and_rebuilds_series(timestamps)
     by_platform = defaultdict(list)
 
     for build in builds:
         # Do it in the loop so that we do this only once per platform
         # and we dont have to hardcode the platforms
         if build.platform_name not in counts_per_platform:
-            counts = [
-                get_total_successful_builds_and_rebuilds(
-                    build.platform_name, before_time=time
-                )
-                for time in timestamps
-            ]
+            counts = series.get(
+                build.platform_name,
+                [SuccessfulBuildsAndRebuilds(0, 0, 0) for _ in timestamps],
+            )
             counts_per_platform[build.platform_name] = {
                 # Total successful builds
                 "builds": [count.builds for count in counts],
@@ -166,6 +183,8 @@ def render_index_html(
                     time=str(build.timestamp),
                     reason=remove_ansi_codes(build.reason) if build.reason else None,
                     actions_url=build.actions_url,
+                    build_time=build.wall_time,
+                    max_rss=build.max_rss,
                 )
             )
             continue
@@ -183,6 +202,12 @@ def render_index_html(
                 if rebuild
                 else None,
                 actions_url=build.actions_url,
+                build_time=build.wall_time,
+                rebuild_time=rebuild.wall_time if rebuild else None,
+                max_rss=max(
+                    filter(None, [build.max_rss, rebuild.max_rss if rebuild else None]),
+                    default=None,
+                ),
             )
         )
 
@@ -207,17 +232,17 @@ def render_index_html(
     return html_content
 
 
-def render_v1_html(env: Environment, docs_folder: Path) -> str:
+def render_v1_html(
+    env: Environment, docs_folder: Path, days: int = V1_HISTORY_DAYS
+) -> str:
     """Render the V1 conda-forge rebuilds page."""
     rebuilds = get_v1_rebuild_data()
     stats = get_v1_rebuild_stats()
 
-    # Generate trend data for the last 14 days
-    start = datetime.now() - timedelta(days=13)
-    end_of_day = datetime(start.year, start.month, start.day, 23, 59, 59)
-    timestamps = [end_of_day + timedelta(days=i) for i in range(0, 14)]
+    # Generate trend data for the last days
+    timestamps = daily_timestamps(days)
 
-    trend_stats = [get_v1_rebuild_stats_before(time) for time in timestamps]
+    trend_stats = get_v1_rebuild_stats_series(timestamps)
     trend_data = {
         "dates": [time.strftime("%Y-%m-%d") for time in timestamps],
         "total": [s.total for s in trend_stats],
@@ -247,18 +272,21 @@ def rerender_html(
     root_folder: Path,
     update_remote: bool = False,
     config_path: Path = Path("config.yaml"),
+    days: Optional[int] = None,
 ):
-    """Render all HTML pages."""
+    """Render all HTML pages, `days` overrides the default history shown in the graphs."""
     docs_folder = get_docs_dir(root_folder)
     print(f"Generating into : {docs_folder}")
 
     env = create_jinja_env()
 
     # Render the main index page
-    index_content = render_index_html(env, docs_folder, config_path)
+    index_content = render_index_html(
+        env, docs_folder, config_path, days=days or INDEX_HISTORY_DAYS
+    )
 
     # Render the V1 page
-    render_v1_html(env, docs_folder)
+    render_v1_html(env, docs_folder, days=days or V1_HISTORY_DAYS)
 
     panel = Panel(
         f"Generated HTML in {docs_folder}.\nRun [bold]pixi r serve-html[/bold] to view",
@@ -268,6 +296,7 @@ def rerender_html(
     print(panel)
 
     if update_remote:
+        github_api = get_github_api()
         # Update the index.html using GitHub API
         print(":running: Updating index.html with new data")
         github_api.update_obj(
@@ -28,6 +28,33 @@ def rebuild_package(
     return _rebuild_package(previous_build, recipe, output_dir, build_info)
 
 
+def prepare_rebuild_artifact_dirs(platform_name: str):
+    """Create the directories where build and rebuild artifacts are collected for CI"""
+    Path(f"ci_artifacts/{platform_name}/build").mkdir(exist_ok=True, parents=True)
+    Path(f"ci_artifacts/{platform_name}/rebuild").mkdir(exist_ok=True, parents=True)
+
+
+def record_rebuild_result(
+    rebuild_result: RebuildResult,
+    patch: bool = False,
+    actions_url: Optional[str] = None,
+):
+    """
+    Print and store the result of a single rebuild
+    """
+    print(rebuild_to_table(rebuild_result.rebuild))
+
+    if actions_url:
+        rebuild_result.rebuild.actions_url = actions_url
+    if patch:
+        save_patch(rebuild_result.rebuild)
+
+    # We need to save the rebuild result to the database
+    # even though we are using patches because we might invoke
+    # the process again before the patch being applied
+    save(rebuild_result.rebuild)
+
+
 def rebuild_recipe(
     recipes: list[Recipe],
     tmp_dir: Path,
@@ -37,8 +64,7 @@ def rebuild_recipe(
 ):
     platform_name, platform_version = platform.system().lower(), platform.release()
 
-    Path(f"ci_artifacts/{platform_name}/build").mkdir(exist_ok=True, parents=True)
-    Path(f"ci_artifacts/{platform_name}/rebuild").mkdir(exist_ok=True, parents=True)
+    prepare_rebuild_artifact_dirs(platform_name)
 
     recipes_to_find = []
 
@@ -77,18 +103,7 @@ def rebuild_recipe(
             print("Found latest rebuild. Skipping rebuilding it again")
             continue
         rebuild_result = rebuild_package(latest_build, recipe, tmp_dir, build_info)
-        print(rebuild_to_table(rebuild_result.rebuild))
-
-        failure = rebuild_result.failed
-        if actions_url:
-            rebuild_result.rebuild.actions_url = actions_url
-        if patch:
-            save_patch(rebuild_result.rebuild)
-
-        # We need to save the rebuild result to the database
-        # even though we are using patches because we might invoke
-        # the process again before the patch being applied
-        save(rebuild_result.rebuild)
-        if failure:
+        record_rebuild_result(rebuild_result, patch, actions_url)
+        if rebuild_result.failed:
             raise ValueError(f"Rebuild failed for {recipe.name}")
         print(f"[bold green]Done: '{recipe.name}' [/bold green]")
@@ -1,9 +1,9 @@
 import platform
-from typing import Sequence
+from typing import Optional, Sequence
 from rich.table import Table
 from rich.text import Text
 from ..internals.db import Build, Rebuild
-from ..internals.commands import pixi_root
+from ..internals.commands import ResourceUsage, pixi_root
 from pathlib import Path
 
 
@@ -19,6 +19,43 @@ def pixi_root_cli():
     return root_folder
 
 
+def format_duration(seconds: Optional[float]) -> str:
+    """Format a duration in seconds like 1h 02m, 3m 04s or 5.6s"""
+    if seconds is None:
+        return ""
+    if seconds < 60:
+        return f"{seconds:.1f}s"
+    minutes, seconds = divmod(round(seconds), 60)
+    if minutes < 60:
+        return f"{minutes}m {seconds:02d}s"
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}h {minutes:02d}m"
+
+
+def format_size(size: Optional[int]) -> str:
+    """Format a size in bytes with a binary unit, like 12.3 MiB"""
+    if size is None:
+        return ""
+    value = float(size)
+    for unit in ["B", "KiB", "MiB", "GiB"]:
+        if value < 1024 or unit == "GiB":
+            break
+        value /= 1024
+    return f"{value:.0f} {unit}" if unit == "B" else f"{value:.1f} {unit}"
+
+
+def format_resource_usage(build: Build | Rebuild) -> list[str]:
+    """Formats the wall time, CPU time and peak memory of a build or rebuild"""
+    usage = ResourceUsage.from_row(build)
+    if usage is None:
+        return ["", "", ""]
+    return [
+        format_duration(usage.wall_time),
+        format_duration(usage.cpu_time),
+        format_size(usage.max_rss),
+    ]
+
+
 def build_to_table(build: Build) -> Table:
     """Converts a Build instance to a rich table"""
     cols = [
@@ -27,6 +64,10 @@ def build_to_table(build: Build) -> Table:
         "Build Location",
         "Failure Reason",
         "Timestamp",
+        "Wall Time",
+        "CPU Time",
+        "Peak Memory",
+        "Artifact Size",
         "Actions URL",
     ]
     table = Table(*cols, title=f"Build Details ({build.recipe_name})")
@@ -36,6 +77,8 @@ def build_to_table(build: Build) -> Table:
         build.build_loc,
         Text.from_ansi(build.reason or ""),
         str(build.timestamp),
+        *format_resource_usage(build),
+        format_size(build.artifact_size),
         build.actions_url,
     )
     return table
@@ -47,6 +90,9 @@ def rebuild_to_table(rebuild: Rebuild) -> Table:
         "Build Status",
         "Failure Reason",
         "Timestamp",
+        "Wall Time",
+        "CPU Time",
+        "Peak Memory",
         "Actions URL",
     ]
     table = Table(*cols, title=f"Re-build Details ({rebuild.recipe_name})")
@@ -54,11 +100,20 @@ def rebuild_to_table(rebuild: Rebuild) -> Table:
         rebuild.state.value,
         Text.from_ansi(rebuild.reason or ""),
         str(rebuild.timestamp),
+        *format_resource_usage(rebuild),
         rebuild.actions_url,
     )
     return table
 
 
+def failures_to_table(failures: list[tuple[str, str]], title: str) -> Table:
+    """Converts a list of (recipe name, reason) failures to a rich table"""
+    table = Table("Name", "Reason", title=title)
+    for name, reason in failures:
+        table.add_row(name, Text.from_ansi(reason))
+    return table
+
+
 def reproducible_table(
     recipe_names: list[str], builds: Sequence[Build], platform: str
 ) -> Table:
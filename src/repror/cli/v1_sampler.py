@@ -10,13 +10,16 @@ import json
 import logging
 import platform as plat
 import random
+import shutil
 import subprocess
 import tempfile
+import threading
 import zipfile
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
 from dataclasses import dataclass, field
 from datetime import datetime
 from pathlib import Path
-from typing import Annotated, Optional
+from typing import Annotated, Iterator, Literal, Optional
 
 import tomllib
 import typer
@@ -28,13 +31,21 @@ from repror.internals.db import (
     V1Rebuild,
     save,
 )
+from repror.internals.repodata import (
+    RepodataIndex,
+    fetch_repodata as fetch_cached_repodata,
+)
 from repror.internals.patcher import save_v1_patch
 from repror.internals.commands import (
+    HASH_CHUNK_SIZE,
+    calculate_digest,
     calculate_hash,
     find_conda_file,
     run_streaming_command,
     StreamingCmdOutput,
 )
+from repror.internals.build import command_log_path, failure_reason
+from repror.internals.options import global_options
 from repror.internals.rattler_build import get_rattler_build
 from repror.internals.print import print
 from .utils import platform_name, platform_version
@@ -340,50 +351,25 @@ def fetch_feedstock_stats(url: str = FEEDSTOCK_STATS_URL) -> FeedstockStats:
     return stats
 
 
-def fetch_repodata(subdir: str) -> dict:
-    """Fetch the repodata.json for a given subdir."""
+def fetch_repodata(subdir: str) -> RepodataIndex:
+    """Fetch the repodata.json for a given subdir, indexed by package name."""
     # Use repodata.json (not current_repodata.json) for more complete data
     url = f"{CONDA_FORGE_BASE}/{subdir}/repodata.json"
     _print_status(f"[dim]Fetching repodata from {url}[/dim]")
-
-    try:
-        req = Request(url, headers={"User-Agent": "repror/1.0"})
-        with urlopen(req, timeout=120) as response:
-            return json.loads(response.read().decode("utf-8"))
-    except URLError as e:
-        raise RuntimeError(f"Failed to fetch repodata: {e}") from e
+    # Cached on disk and revalidated with a conditional request
+    return fetch_cached_repodata(url)
 
 
 def find_package_in_repodata(
-    package_name: str, repodata: dict, subdir: str
+    package_name: str, repodata: RepodataIndex, subdir: str
 ) -> Optional[PackageInfo]:
     """Find the latest version of a package in the repodata."""
-    packages = repodata.get("packages.conda", {})
-
-    # Find all matching packages (prefer .conda over .tar.bz2)
-    matching = []
-    for filename, info in packages.items():
-        if info.get("name") == package_name:
-            matching.append((filename, info))
-
-    if not matching:
-        # Try packages (tar.bz2)
-        packages_tar = repodata.get("packages", {})
-        for filename, info in packages_tar.items():
-            if info.get("name") == package_name:
-                matching.append((filename, info))
-
-    if not matching:
+    # Prefers .conda over .tar.bz2, and compares versions like conda does
+    latest = repodata.latest(package_name)
+    if not latest:
         return None
 
-    # Sort by build_number and version to get the latest
-    def sort_key(item):
-        filename, info = item
-        return (info.get("version", "0"), info.get("build_number", 0))
-
-    matching.sort(key=sort_key, reverse=True)
-
-    filename, info = matching[0]
+    filename, info = latest.filename, latest.info
     url = f"{CONDA_FORGE_BASE}/{subdir}/{filename}"
 
     return PackageInfo(
@@ -402,7 +388,7 @@ def find_package_in_repodata(
 
 def find_recent_v1_packages(
     v1_packages: list[str],
-    repodata: dict,
+    repodata: RepodataIndex,
     subdir: str,
     max_age_days: int = 10,
 ) -> list[PackageInfo]:
@@ -410,7 +396,7 @@ def find_recent_v1_packages(
 
     Args:
         v1_packages: List of V1 package names
-        repodata: Repodata dictionary
+        repodata: Repodata index
         subdir: Conda subdir
         max_age_days: Maximum age of packages in days
 
@@ -423,19 +409,18 @@ def find_recent_v1_packages(
     max_age_ms = max_age_days * 24 * 60 * 60 * 1000
     cutoff_ms = now_ms - max_age_ms
 
-    packages = repodata.get("packages.conda", {})
     v1_set = set(v1_packages)
 
     recent_packages: list[PackageInfo] = []
 
-    for filename, info in packages.items():
+    # The index only returns the packages built since the cutoff
+    for record in repodata.recent(cutoff_ms):
+        filename, info = record.filename, record.info
         name = info.get("name")
         if name not in v1_set:
             continue
 
-        timestamp = info.get("timestamp")
-        if timestamp is None or timestamp < cutoff_ms:
-            continue
+        timestamp = info["timestamp"]
 
         url = f"{CONDA_FORGE_BASE}/{subdir}/{filename}"
         pkg_info = PackageInfo(
@@ -554,14 +539,8 @@ def download_package(pkg_info: PackageInfo, dest_dir: Path) -> Optional[Path]:
         req = Request(pkg_info.url, headers={"User-Agent": "repror/1.0"})
         with urlopen(req, timeout=300) as response:
             with open(dest_file, "wb") as f:
-                f.write(response.read())
-
-        # Verify hash if available
-        if pkg_info.sha256:
-            actual_hash = calculate_hash(dest_file)
-            if actual_hash != pkg_info.sha256:
-                print(f"[red]Hash mismatch for {pkg_info.filename}[/red]")
-                return None
+                # Stream to disk, packages can be several GB large
+                shutil.copyfileobj(response, f, HASH_CHUNK_SIZE)
 
         return dest_file
     except Exception as e:
@@ -594,7 +573,11 @@ def rebuild_package(
         str(output_dir),
     ]
 
-    return run_streaming_command(command=rebuild_command)
+    return run_streaming_command(
+        command=rebuild_command,
+        log_path=command_log_path(f"{package_file.name}-rebuild"),
+        timeout=global_options.command_timeout,
+    )
 
 
 def sample_v1_packages(
@@ -619,12 +602,148 @@ def sample_v1_packages(
     return sampled
 
 
+# Results of concurrent rebuilds are written one at a time
+_save_lock = threading.Lock()
+_install_lock = threading.Lock()
+
+
 def _save_v1_result(v1_rebuild: V1Rebuild, patch: bool = False):
     """Save V1 rebuild result to database or patch file."""
-    if patch:
-        save_v1_patch(v1_rebuild)
-    else:
-        save(v1_rebuild)
+    with _save_lock:
+        if patch:
+            save_v1_patch(v1_rebuild)
+        else:
+            save(v1_rebuild)
+
+
+@dataclass
+class DownloadedPackage:
+    """An original package that was downloaded and inspected, ready to be rebuilt."""
+
+    pkg_info: PackageInfo
+    original_file: Path
+    original_hash: str
+    build_info: OriginalBuildInfo
+
+
+def download_v1_package(
+    pkg_info: PackageInfo, work_dir: Path
+) -> Optional[DownloadedPackage]:
+    """Download a package and find out how it was originally built.
+
+    Nothing is saved here, so this can run for upcoming packages while others rebuild.
+
+    Returns:
+        DownloadedPackage, or None if the download failed
+    """
+    # A folder per task, the same package can be in the pipeline more than once
+    (work_dir / "downloads").mkdir(parents=True, exist_ok=True)
+    download_dir = Path(
+        tempfile.mkdtemp(prefix=f"{pkg_info.name}-", dir=work_dir / "downloads")
+    )
+
+    original_file = download_package(pkg_info, download_dir)
+    if original_file is None:
+        return None
+
+    # Verify the download against the repodata, in the same pass as the hash we keep
+    digest = calculate_digest(original_file)
+    if (pkg_info.sha256 and digest.sha256 != pkg_info.sha256) or (
+        pkg_info.size and digest.size != pkg_info.size
+    ):
+        print(f"[red]Hash or size mismatch for {pkg_info.filename}[/red]")
+        original_file.unlink()
+        return None
+
+    return DownloadedPackage(
+        pkg_info=pkg_info,
+        original_file=original_file,
+        original_hash=digest.sha256,
+        build_info=extract_build_info_from_conda(original_file),
+    )
+
+
+def _save_failed_download(
+    pkg_info: PackageInfo,
+    platform: str,
+    plat_version: str,
+    actions_url: Optional[str] = None,
+    patch: bool = False,
+) -> V1RebuildResult:
+    """Save and return the result of a package that could not be downloaded."""
+    # We don't know the build tool of a package we could not download
+    v1_rebuild = V1Rebuild(
+        package_name=pkg_info.name,
+        version=pkg_info.version,
+        subdir=pkg_info.subdir,
+        build_string=pkg_info.build,
+        original_url=pkg_info.url,
+        original_hash=pkg_info.sha256,
+        state=BuildState.FAIL,
+        reason="Failed to download package",
+        platform_name=platform,
+        platform_version=plat_version,
+        build_tool_hash="unknown",
+        timestamp=datetime.now(),
+        actions_url=actions_url,
+    )
+    _save_v1_result(v1_rebuild, patch)
+
+    return V1RebuildResult(
+        package_name=pkg_info.name,
+        version=pkg_info.version,
+        original_url=pkg_info.url,
+        download_success=False,
+        rebuild_success=False,
+        reproducible=False,
+        error_message="Failed to download package",
+    )
+
+
+def _save_failed_rebuild(
+    downloaded: DownloadedPackage,
+    reason: str,
+    platform: str,
+    plat_version: str,
+    actions_url: Optional[str] = None,
+    patch: bool = False,
+) -> V1RebuildResult:
+    """Save and return the result of a downloaded package whose rebuild raised."""
+    import hashlib
+
+    pkg_info = downloaded.pkg_info
+    build_info = downloaded.build_info
+    v1_rebuild = V1Rebuild(
+        package_name=pkg_info.name,
+        version=pkg_info.version,
+        subdir=pkg_info.subdir,
+        build_string=pkg_info.build,
+        original_url=pkg_info.url,
+        original_hash=downloaded.original_hash,
+        state=BuildState.FAIL,
+        reason=reason,
+        platform_name=platform,
+        platform_version=plat_version,
+        build_tool_hash=hashlib.sha256(
+            f"rattler-build {build_info.build_tool_version or 'unknown'}".encode()
+        ).hexdigest(),
+        original_build_tool=build_info.build_tool,
+        original_build_tool_version=build_info.build_tool_version,
+        timestamp=datetime.now(),
+        actions_url=actions_url,
+    )
+    _save_v1_result(v1_rebuild, patch)
+
+    return V1RebuildResult(
+        package_name=pkg_info.name,
+        version=pkg_info.version,
+        original_url=pkg_info.url,
+        download_success=True,
+        rebuild_success=False,
+        reproducible=False,
+        original_hash=downloaded.original_hash,
+        error_message=reason,
+    )
 
 
 def rebuild_v1_package(
@@ -651,48 +770,36 @@ def rebuild_v1_package(
     Returns:
         V1RebuildResult if the package was processed, None if skipped (e.g., conda-build package)
     """
-    import hashlib
-
     print(f"[bold blue]Processing {pkg_info.name} {pkg_info.version}[/bold blue]")
 
-    # Download the original package
-    download_dir = work_dir / "downloads"
-    download_dir.mkdir(exist_ok=True)
-
-    original_file = download_package(pkg_info, download_dir)
-    if original_file is None:
-        # Save failed download - we don't know the build tool yet
-        v1_rebuild = V1Rebuild(
-            package_name=pkg_info.name,
-            version=pkg_info.version,
-            subdir=pkg_info.subdir,
-            build_string=pkg_info.build,
-            original_url=pkg_info.url,
-            original_hash=pkg_info.sha256,
-            state=BuildState.FAIL,
-            reason="Failed to download package",
-            platform_name=platform,
-            platform_version=plat_version,
-            build_tool_hash="unknown",
-            timestamp=datetime.now(),
-            actions_url=actions_url,
+    downloaded = download_v1_package(pkg_info, work_dir)
+    if downloaded is None:
+        return _save_failed_download(
+            pkg_info, platform, plat_version, actions_url, patch
         )
-        _save_v1_result(v1_rebuild, patch)
+    return rebuild_downloaded_v1_package(
+        downloaded, work_dir, platform, plat_version, actions_url, patch
+    )
 
-        return V1RebuildResult(
-            package_name=pkg_info.name,
-            version=pkg_info.version,
-            original_url=pkg_info.url,
-            download_success=False,
-            rebuild_success=False,
-            reproducible=False,
-            error_message="Failed to download package",
-        )
 
-    original_hash = calculate_hash(original_file)
+def rebuild_downloaded_v1_package(
+    downloaded: DownloadedPackage,
+    work_dir: Path,
+    platform: str,
+    plat_version: str,
+    actions_url: Optional[str] = None,
+    patch: bool = False,
+) -> Optional[V1RebuildResult]:
+    """Rebuild a downloaded V1 package and save the result.
+
+    See `rebuild_v1_package` for the arguments and the return value.
+    """
+    import hashlib
 
-    # Extract build tool info from the original package
-    build_info = extract_build_info_from_conda(original_file)
+    pkg_info = downloaded.pkg_info
+    original_file = downloaded.original_file
+    original_hash = downloaded.original_hash
+    build_info = downloaded.build_info
     print(
         f"[dim]Original build tool: {build_info.build_tool} {build_info.build_tool_version or ''}[/dim]"
     )
@@ -707,9 +814,11 @@ def rebuild_v1_package(
     # Install the matching rattler-build version
     rattler_build_path: Optional[Path] = None
     if build_info.build_tool_version:
-        rattler_build_path = install_rattler_build_version(
-            build_info.build_tool_version
-        )
+        # Concurrent rebuilds would otherwise race on the pixi global manifest
+        with _install_lock:
+            rattler_build_path = install_rattler_build_version(
+                build_info.build_tool_version
+            )
         if rattler_build_path is None:
             # Failed to install matching version
             v1_rebuild = V1Rebuild(
@@ -753,8 +862,11 @@ def rebuild_v1_package(
     ).hexdigest()
 
     # Rebuild the package
-    rebuild_dir = work_dir / "rebuild" / pkg_info.name
-    rebuild_dir.mkdir(parents=True, exist_ok=True)
+    # A folder per task, so concurrent rebuilds of the same package do not collide
+    (work_dir / "rebuild").mkdir(parents=True, exist_ok=True)
+    rebuild_dir = Path(
+        tempfile.mkdtemp(prefix=f"{pkg_info.name}-", dir=work_dir / "rebuild")
+    )
 
     output = rebuild_package(original_file, rebuild_dir, rattler_build_path)
 
@@ -784,7 +896,10 @@ def rebuild_v1_package(
             original_url=pkg_info.url,
             original_hash=original_hash,
             state=BuildState.FAIL,
-            reason=output.stderr[-1000:] if output.stderr else output.stdout[-1000:],
+            reason=failure_reason(
+                output,
+                output.stderr[-1000:] if output.stderr else output.stdout[-1000:],
+            ),
             platform_name=platform,
             platform_version=plat_version,
             build_tool_hash=build_tool_hash,
@@ -878,6 +993,95 @@ def rebuild_v1_package(
     )
 
 
+def rebuild_v1_packages(
+    packages: list[PackageInfo],
+    work_dir: Path,
+    platform: str,
+    plat_version: str,
+    actions_url: Optional[str] = None,
+    patch: bool = False,
+    download_jobs: int = 2,
+    rebuild_jobs: int = 1,
+) -> Iterator[tuple[PackageInfo, Optional[V1RebuildResult]]]:
+    """Download and rebuild packages as a pipeline, yielding the results as they finish.
+
+    Up to `download_jobs` upcoming packages are downloaded and inspected while up to
+    `rebuild_jobs` packages rebuild, so downloads no longer wait for rebuilds and the
+    other way round. Downloads run ahead of the rebuilds by at most `download_jobs`
+    packages, and a download is removed once its package is rebuilt, which bounds
+    the disk space used by the downloads.
+    """
+    download_jobs = max(download_jobs, 1)
+    rebuild_jobs = max(rebuild_jobs, 1)
+    # Packages that are downloading, waiting for a rebuild or rebuilding
+    window = download_jobs + rebuild_jobs
+    to_download = iter(packages)
+    started = 0
+
+    def rebuild(
+        pkg_info: PackageInfo, downloaded: Optional[DownloadedPackage]
+    ) -> Optional[V1RebuildResult]:
+        if downloaded is None:
+            return _save_failed_download(
+                pkg_info, platform, plat_version, actions_url, patch
+            )
+        try:
+            return rebuild_downloaded_v1_package(
+                downloaded, work_dir, platform, plat_version, actions_url, patch
+            )
+        except Exception as e:
+            logger.warning(f"Rebuild of {pkg_info.filename} raised: {e}")
+            return _save_failed_rebuild(
+                downloaded,
+                f"Rebuild failed: {e}",
+                platform,
+                plat_version,
+                actions_url,
+                patch,
+            )
+        finally:
+            downloaded.original_file.unlink(missing_ok=True)
+
+    with (
+        ThreadPoolExecutor(max_workers=download_jobs) as downloaders,
+        ThreadPoolExecutor(max_workers=rebuild_jobs) as rebuilders,
+    ):
+        pending: dict[Future, tuple[Literal["download", "rebuild"], PackageInfo]] = {}
+
+        def queue_downloads():
+            while len(pending) < window:
+                pkg_info = next(to_download, None)
+                if pkg_info is None:
+                    return
+                future = downloaders.submit(download_v1_package, pkg_info, work_dir)
+                pending[future] = ("download", pkg_info)
+
+        queue_downloads()
+        # The rebuilds print from their own threads, so with more than one
+        # rebuild job the output of concurrent rebuilds is interleaved.
+        # Failed rebuilds are saved by the rebuild stage itself.
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage, pkg_info = pending.pop(future)
+                if stage == "download":
+                    try:
+                        downloaded = future.result()
+                    except Exception as e:
+                        logger.warning(f"Failed to download {pkg_info.url}: {e}")
+                        downloaded = None
+                    started += 1
+                    print(
+                        f"\n[bold]({started}/{len(packages)}) {pkg_info.name} {pkg_info.version}[/bold]"
+                    )
+                    future = rebuilders.submit(rebuild, pkg_info, downloaded)
+                    pending[future] = ("rebuild", pkg_info)
+                    continue
+
+                yield pkg_info, future.result()
+            queue_downloads()
+
+
 def run_v1_sample(
     sample_size: int = 10,
     seed: Optional[int] = None,
@@ -885,6 +1089,8 @@ def run_v1_sample(
     specific_packages: Optional[list[str]] = None,
     subdir: Optional[str] = None,
     patch: bool = False,
+    download_jobs: int = 2,
+    rebuild_jobs: int = 1,
 ) -> list[V1RebuildResult]:
     """
     Main function to sample and rebuild V1 packages from conda-forge.
@@ -896,6 +1102,8 @@ def run_v1_sample(
         specific_packages: Optional list of specific package names to process
         subdir: Optional conda subdir (e.g., 'linux-64', 'osx-arm64')
         patch: If True, save to patch files instead of database (for CI)
+        download_jobs: Number of packages to download ahead of the rebuilds at once
+        rebuild_jobs: Number of packages to rebuild at once
 
     Returns:
         List of V1RebuildResult objects
@@ -915,9 +1123,7 @@ def run_v1_sample(
     # Fetch repodata
     print("[dim]Fetching conda-forge repodata (this may take a moment)...[/dim]")
     repodata = fetch_repodata(subdir)
-    print(
-        f"[dim]Repodata contains {len(repodata.get('packages.conda', {}))} .conda packages[/dim]"
-    )
+    print(f"[dim]Repodata contains {repodata.count()} .conda packages[/dim]")
 
     # Determine packages to process
     if specific_packages:
@@ -973,14 +1179,16 @@ def run_v1_sample(
     with tempfile.TemporaryDirectory() as tmp_dir:
         work_dir = Path(tmp_dir)
 
-        for i, pkg_info in enumerate(packages_found, 1):
-            print(
-                f"\n[bold]({i}/{len(packages_found)}) {pkg_info.name} {pkg_info.version}[/bold]"
-            )
-            result = rebuild_v1_package(
-                pkg_info, work_dir, platform, plat_version, actions_url, patch
-            )
-
+        for pkg_info, result in rebuild_v1_packages(
+            packages_found,
+            work_dir,
+            platform,
+            plat_version,
+            actions_url,
+            patch,
+            download_jobs,
+            rebuild_jobs,
+        ):
             # None means package was skipped (e.g., conda-build package)
             if result is None:
                 skipped_count += 1
@@ -1092,6 +1300,22 @@ def sample(
     patch: Annotated[
         bool, typer.Option(help="Save to patch files instead of database (for CI)")
     ] = False,
+    download_jobs: Annotated[
+        int,
+        typer.Option(
+            "--download-jobs",
+            min=1,
+            help="Number of packages to download ahead of the rebuilds at once",
+        ),
+    ] = 2,
+    rebuild_jobs: Annotated[
+        int,
+        typer.Option(
+            "--rebuild-jobs",
+            min=1,
+            help="Number of packages to rebuild at once, their output is interleaved",
+        ),
+    ] = 1,
 ):
     """
     Sample and rebuild V1 recipe packages from conda-forge.
@@ -1106,6 +1330,8 @@ def sample(
         specific_packages=packages,
         subdir=subdir,
         patch=patch,
+        download_jobs=download_jobs,
+        rebuild_jobs=rebuild_jobs,
     )
     print_summary(results)
 
@@ -1227,9 +1453,7 @@ def list_v1(
     if subdir:
         print(f"[dim]Checking availability in {subdir}...[/dim]")
         repodata = fetch_repodata(subdir)
-        available_names = {
-            info.get("name") for info in repodata.get("packages.conda", {}).values()
-        }
+        available_names = repodata.names("packages.conda")
         packages = [p for p in packages if p in available_names]
         print(f"[dim]{len(packages)} V1 packages available in {subdir}[/dim]")
 
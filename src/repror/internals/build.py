@@ -1,12 +1,15 @@
+from dataclasses import asdict
 from enum import Enum
 from pathlib import Path
 import shutil
+import time
 from subprocess import CalledProcessError
 from typing import Optional
 
 from pydantic import BaseModel, ConfigDict
 
 from repror.internals.db import Build, BuildState, Rebuild, Recipe, RemoteRecipe
+from repror.internals.options import global_options
 from repror.internals.rattler_build import get_rattler_build
 from repror.internals.commands import (
     calculate_hash,
@@ -56,6 +59,14 @@ class RebuildResult(BaseModel):
         return self.rebuild.state == BuildState.FAIL
 
 
+def command_log_path(name: str) -> Optional[Path]:
+    """Where to keep the complete output of a command, if `--log-dir` is given."""
+    if global_options.log_dir is None:
+        return None
+    global_options.log_dir.mkdir(parents=True, exist_ok=True)
+    return global_options.log_dir / f"{name}.log.gz"
+
+
 def build_conda_package(
     recipe: Recipe | RemoteRecipe, output_dir: Path
 ) -> StreamingCmdOutput:
@@ -69,7 +80,11 @@ def build_conda_package(
             "--output-dir",
             output_dir,
         ]
-        return run_streaming_command(command=build_command)
+        return run_streaming_command(
+            command=build_command,
+            log_path=command_log_path(f"{recipe.name}-build"),
+            timeout=global_options.command_timeout,
+        )
 
 
 def rebuild_conda_package(conda_file: Path, output_dir: Path) -> StreamingCmdOutput:
@@ -84,7 +99,21 @@ def rebuild_conda_package(conda_file: Path, output_dir: Path) -> StreamingCmdOut
         output_dir,
     ]
 
-    return run_streaming_command(command=re_build_command)
+    return run_streaming_command(
+        command=re_build_command,
+        log_path=command_log_path(f"{conda_file.name}-rebuild"),
+        timeout=global_options.command_timeout,
+    )
+
+
+def resource_usage_fields(output: StreamingCmdOutput) -> dict:
+    """The resource usage of the command, as the columns of `Build` and `Rebuild`"""
+    return asdict(output.resource_usage) if output.resource_usage else {}
+
+
+def failure_reason(output: StreamingCmdOutput, tail: str) -> str:
+    """The reason stored for a failed command, with `tail` the end of its output"""
+    return ("Timed out\n" if output.timed_out else "") + tail
 
 
 def build_recipe(
@@ -109,29 +138,35 @@ def build_recipe(
             platform_name=build_info.platform,
             platform_version=build_info.platform_version,
             # TODO: capture reason later
-            reason=output.stderr[-1000:],
+            reason=failure_reason(output, output.stderr[-1000:]),
+            **resource_usage_fields(output),
         )
         return BuildResult(
             build=failed_build,
             exception=None,
         )
 
+    artifact_start = time.monotonic()
     # let's record first hash
     conda_file = find_conda_file(output_dir)
 
     # move to artifacts
     # so we could upload it in github action
     new_file_loc = move_file(conda_file, Path("artifacts"))
+    build_hash = calculate_hash(new_file_loc)
 
     build = Build(
         recipe_name=recipe.name,
         state=BuildState.SUCCESS,
-        build_hash=calculate_hash(new_file_loc),
+        build_hash=build_hash,
         build_tool_hash=build_info.rattler_build_hash,
         recipe_hash=recipe.content_hash,
         platform_name=build_info.platform,
         platform_version=build_info.platform_version,
         build_loc=str(new_file_loc),
+        artifact_size=new_file_loc.stat().st_size,
+        artifact_time=time.monotonic() - artifact_start,
+        **resource_usage_fields(output),
     )
 
     return BuildResult(build=build, exception=None)
@@ -159,22 +194,28 @@ def _rebuild_package(
             build_id=build.id,
             state=BuildState.FAIL,
             # Catch this later
-            reason=output.stdout[-1000:],
+            reason=failure_reason(output, output.stdout[-1000:]),
             build=build,
+            **resource_usage_fields(output),
         )
         return RebuildResult(rebuild=failed_build, exception=None)
 
+    artifact_start = time.monotonic()
     conda_file = find_conda_file(output_dir)
     shutil.copyfile(
         conda_file,
         f"ci_artifacts/{build_info.platform}/rebuild/{Path(conda_file).name}",
     )
+    rebuild_hash = calculate_hash(conda_file)
 
     rebuild = Rebuild(
         build_id=build.id,
         state=BuildState.SUCCESS,
-        rebuild_hash=calculate_hash(conda_file),
+        rebuild_hash=rebuild_hash,
         build=build,
+        artifact_size=conda_file.stat().st_size,
+        artifact_time=time.monotonic() - artifact_start,
+        **resource_usage_fields(output),
     )
 
     return RebuildResult(rebuild=rebuild)
@@ -0,0 +1,70 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Generator, Iterable
+
+logger = logging.getLogger(__name__)
+
+# Name of the sqlite database that holds the small caches
+CACHE_DB = "cache.db"
+
+
+def cache_dir() -> Path:
+    """Get the directory for persistent caches, can be set with REPRO_CACHE_DIR."""
+    directory = os.getenv("REPRO_CACHE_DIR")
+    if directory:
+        return Path(directory)
+    return Path.home() / ".cache" / "repror"
+
+
+# Connections are reused per thread, sqlite connections can not be shared between threads
+_connections = threading.local()
+
+
+def _connect(path: Path) -> sqlite3.Connection:
+    connections: dict[Path, sqlite3.Connection] = _connections.__dict__.setdefault(
+        "by_path", {}
+    )
+    if path not in connections:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        connection = sqlite3.connect(path, timeout=30)
+        # The cache can always be recomputed, so trade durability for speed
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=OFF")
+        connections[path] = connection
+    return connections[path]
+
+
+@contextmanager
+def cache_db(schema: str) -> Generator[sqlite3.Connection, None, None]:
+    """
+    Open the cache database in a transaction, making sure the given schema exists.
+    """
+    path = cache_dir() / CACHE_DB
+    connection = _connect(path)
+    with connection:
+        schemas: set[tuple[Path, str]] = _connections.__dict__.setdefault(
+            "schemas", set()
+        )
+        if (path, schema) not in schemas:
+            connection.executescript(schema)
+            schemas.add((path, schema))
+        yield connection
+
+
+def stat_signature(root: Path, paths: Iterable[Path]) -> str:
+    """
+    Compute a signature of the (path, size, mtime, inode) of the given paths.
+    The signature changes when any file is added, removed, moved or modified.
+    """
+    hasher = hashlib.sha256()
+    for path in paths:
+        stat = path.stat()
+        hasher.update(
+            f"{path.relative_to(root)}\0{stat.st_size}\0{stat.st_mtime_ns}\0{stat.st_ino}\n".encode()
+        )
+    return hasher.hexdigest()
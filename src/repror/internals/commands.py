@@ -1,14 +1,21 @@
 from dataclasses import dataclass
-from typing import Optional
+from typing import IO, Any, Optional, TextIO
 
+import asyncio
+import codecs
+import contextlib
 import glob
+import gzip
 import hashlib
 import os
 import shutil
+import signal
 import subprocess
+import sys
+import threading
+import time
 from pathlib import Path
 from subprocess import CompletedProcess
-import io
 from enum import Enum
 
 
@@ -32,11 +39,166 @@ class StreamType(Enum):
         return self == StreamType.STDERR
 
 
+@dataclass
+class ResourceUsage:
+    """Resources used by a finished child process."""
+
+    # Seconds between starting the process and reaping it
+    wall_time: float
+    # User and system CPU seconds, not known on Windows
+    user_time: Optional[float] = None
+    system_time: Optional[float] = None
+    # Peak resident set size in bytes, not known on Windows
+    max_rss: Optional[int] = None
+
+    @property
+    def cpu_time(self) -> Optional[float]:
+        if self.user_time is None or self.system_time is None:
+            return None
+        return self.user_time + self.system_time
+
+    @classmethod
+    def from_rusage(cls, wall_time: float, rusage: Any) -> "ResourceUsage":
+        """Convert the `resource.struct_rusage` of `os.wait4`, if there is one."""
+        if rusage is None:
+            return cls(wall_time=wall_time)
+        # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+        max_rss = (
+            rusage.ru_maxrss if sys.platform == "darwin" else rusage.ru_maxrss * 1024
+        )
+        return cls(
+            wall_time=wall_time,
+            user_time=rusage.ru_utime,
+            system_time=rusage.ru_stime,
+            max_rss=max_rss,
+        )
+
+    @classmethod
+    def from_row(cls, row: Any) -> Optional["ResourceUsage"]:
+        """Read the resource usage columns of a `Build` or `Rebuild`, if it was recorded."""
+        if row.wall_time is None:
+            return None
+        return cls(
+            wall_time=row.wall_time,
+            user_time=row.user_time,
+            system_time=row.system_time,
+            max_rss=row.max_rss,
+        )
+
+
 @dataclass
 class StreamingCmdOutput:
     stdout: str
     stderr: str
     return_code: int
+    resource_usage: Optional[ResourceUsage] = None
+    # The command was killed because it ran longer than the timeout
+    timed_out: bool = False
+
+
+# Size of the output tail kept of each stream, callers only look at the end of it
+OUTPUT_TAIL_SIZE = 64 * 1024
+# Size of the chunks read from the pipes of the child process
+OUTPUT_CHUNK_SIZE = 64 * 1024
+
+
+class OutputTail:
+    """Keeps the last `size` bytes written to it, so memory stays bounded."""
+
+    def __init__(self, size: int = OUTPUT_TAIL_SIZE):
+        self.size = size
+        self._buffer = bytearray()
+
+    def write(self, chunk: bytes):
+        self._buffer += chunk
+        # Trim only when twice the size is reached, so trimming is amortized
+        if len(self._buffer) > 2 * self.size:
+            del self._buffer[: -self.size]
+
+    def getvalue(self) -> str:
+        return self._buffer[-self.size :].decode("utf-8", errors="replace")
+
+
+class _LineEcho:
+    """Prints complete lines of a stream with a prefix, so concurrent output stays readable."""
+
+    def __init__(
+        self, prefix: str, echo: TextIO, lock: Optional[threading.Lock] = None
+    ):
+        self.prefix = prefix
+        self.echo = echo
+        # Needed when threads of both streams print to the same echo
+        self.lock = lock or contextlib.nullcontext()
+        self._decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self._pending = ""
+
+    def write(self, chunk: bytes):
+        *lines, self._pending = (self._pending + self._decoder.decode(chunk)).split(
+            "\n"
+        )
+        # Do not keep an endless line in memory, print it in pieces
+        if len(self._pending) > OUTPUT_CHUNK_SIZE:
+            lines.append(self._pending)
+            self._pending = ""
+        if lines:
+            with self.lock:
+                self.echo.write("".join(f"{self.prefix}{line}\n" for line in lines))
+                self.echo.flush()
+
+    def close(self):
+        if self._pending:
+            self.write(b"\n")
+
+
+class _LineLog:
+    """Writes whole lines of a stream to a log shared by both streams, so their lines do not mix."""
+
+    def __init__(self, log_file: IO[bytes], lock: Optional[threading.Lock] = None):
+        self.log_file = log_file
+        # Needed when threads of both streams write to the log
+        self.lock = lock or contextlib.nullcontext()
+        self._pending = b""
+
+    def write(self, chunk: bytes):
+        data = self._pending + chunk
+        end = data.rfind(b"\n") + 1
+        # Do not keep an endless line in memory, write it in pieces
+        if len(data) - end > OUTPUT_CHUNK_SIZE:
+            end = len(data)
+        self._pending = data[end:]
+        if end:
+            with self.lock:
+                self.log_file.write(data[:end])
+
+    def close(self):
+        if self._pending:
+            with self.lock:
+                self.log_file.write(self._pending)
+            self._pending = b""
+
+
+def _drain_stream(
+    stream: IO[bytes],
+    tail: OutputTail,
+    echo: _LineEcho,
+    log: Optional[_LineLog],
+):
+    """Read a pipe until it is closed, so the child never blocks on a full pipe."""
+    while chunk := stream.read1(OUTPUT_CHUNK_SIZE):  # type: ignore[attr-defined]
+        tail.write(chunk)
+        if log:
+            log.write(chunk)
+        echo.write(chunk)
+    echo.close()
+    if log:
+        log.close()
+    stream.close()
+
+
+def _kill_process_group(pgid: int):
+    """Kill a process group, this also kills what the command started."""
+    with contextlib.suppress(ProcessLookupError):
+        os.killpg(pgid, signal.SIGKILL)
 
 
 def run_streaming_command(
@@ -44,63 +206,279 @@ def run_streaming_command(
     cwd: Optional[str | bytes | os.PathLike[str] | os.PathLike[bytes]] = None,
     env: Optional[list[str]] = None,
     stream_type: StreamType = StreamType.STDERR,
+    tail_size: int = OUTPUT_TAIL_SIZE,
+    log_path: Optional[Path] = None,
+    timeout: Optional[float] = None,
 ) -> StreamingCmdOutput:
-    """Run a specific command and stream the output."""
-
-    # Current stream to capture as a string
-    main_output = io.StringIO()
-
-    # We can only capture of stdout or stderr, not both
-    # Otherwise it will block
-    # See: https://stackoverflow.com/questions/18421757/live-output-from-subprocess-command
-    if stream_type.is_stderr:
-        kwargs = {"stderr": subprocess.PIPE}
-    else:
-        kwargs = {"stdout": subprocess.PIPE}
-
-    with subprocess.Popen(args=command, cwd=cwd, env=env, **kwargs) as process:
-        main_stream, other_stream = (
-            (process.stderr, process.stdout)
-            if stream_type.is_stderr
-            else (process.stdout, process.stderr)
+    """
+    Run a specific command and stream the output.
+
+    Both stdout and stderr are drained at the same time by reader threads,
+    and only the last `tail_size` bytes of each are returned. Both are printed
+    line by line as they come in, the stream given by `stream_type` to stdout
+    and the other one to where it belongs. When `log_path` is given,
+    the complete output of both streams is also written to it, gzip compressed.
+    With a `timeout` in seconds, the command runs in its own process group,
+    which is killed when the command is still running after the timeout.
+    """
+    tails = {
+        StreamType.STDOUT: OutputTail(tail_size),
+        StreamType.STDERR: OutputTail(tail_size),
+    }
+    echo_lock = threading.Lock()
+    echoes = {
+        stream: _LineEcho(
+            "",
+            sys.stdout if stream == stream_type or stream.is_stdout else sys.stderr,
+            echo_lock,
         )
-        if main_stream:
-            # Print stderr or stdout as it comes in
-            for line in io.TextIOWrapper(
-                main_stream, encoding="utf-8"
-            ):  # or another encoding
-                print(line, end="")
-                main_output.write(line)
-
-        # Also print the other output if there is any
-        other_output = ""
-        if other_stream:
-            other_output = other_output.join(other_stream.readlines())
-            print(other_output)
-
-    if stream_type.is_stderr:
-        return StreamingCmdOutput(
-            stdout=other_output,
-            stderr=main_output.getvalue(),
-            return_code=process.returncode,
+        for stream in StreamType
+    }
+    log_lock = threading.Lock()
+    # Without a timeout the command stays in our process group, so it gets Ctrl-C too
+    new_session = timeout is not None and os.name == "posix"
+    start = time.monotonic()
+    with contextlib.ExitStack() as stack:
+        log_file = stack.enter_context(gzip.open(log_path, "wb")) if log_path else None
+        process = stack.enter_context(
+            subprocess.Popen(
+                args=command,
+                cwd=cwd,
+                env=env,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                start_new_session=new_session,
+            )
         )
+        readers = [
+            threading.Thread(
+                target=_drain_stream,
+                args=(
+                    process.stdout if stream.is_stdout else process.stderr,
+                    tails[stream],
+                    echoes[stream],
+                    _LineLog(log_file, log_lock) if log_file else None,
+                ),
+                daemon=True,
+            )
+            for stream in StreamType
+        ]
+        for reader in readers:
+            reader.start()
+        # The pipes are closed when the command exits. It is only reaped after this,
+        # so killing it can not hit another process that got its pid
+        deadline = start + timeout if timeout is not None else None
+        for reader in readers:
+            reader.join(
+                None if deadline is None else max(deadline - time.monotonic(), 0)
+            )
+        timed_out = any(reader.is_alive() for reader in readers)
+        if timed_out:
+            if new_session:
+                _kill_process_group(process.pid)
+            else:
+                process.kill()
+            for reader in readers:
+                reader.join()
+        if hasattr(os, "wait4"):
+            # Reap the process ourselves, wait4 also reports the resources it used
+            _, status, rusage = os.wait4(process.pid, 0)
+            process.returncode = os.waitstatus_to_exitcode(status)
+        else:
+            process.wait()
+            rusage = None
+
+    return StreamingCmdOutput(
+        stdout=tails[StreamType.STDOUT].getvalue(),
+        stderr=tails[StreamType.STDERR].getvalue(),
+        return_code=process.returncode,
+        resource_usage=ResourceUsage.from_rusage(time.monotonic() - start, rusage),
+        timed_out=timed_out,
+    )
+
+
+async def _drain_reader(
+    reader: asyncio.StreamReader,
+    tail: OutputTail,
+    echo: Optional[_LineEcho],
+    log: Optional[_LineLog],
+):
+    while chunk := await reader.read(OUTPUT_CHUNK_SIZE):
+        tail.write(chunk)
+        if log:
+            log.write(chunk)
+        if echo:
+            echo.write(chunk)
+    if echo:
+        echo.close()
+    if log:
+        log.close()
+
+
+async def _connect_pipe(pipe: IO[bytes]) -> asyncio.StreamReader:
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader(limit=OUTPUT_CHUNK_SIZE, loop=loop)
+    await loop.connect_read_pipe(
+        lambda: asyncio.StreamReaderProtocol(reader, loop=loop), pipe
+    )
+    return reader
+
+
+async def _wait4(pid: int) -> tuple[int, Any]:
+    """Reap the process with wait4, which also reports the resources it used."""
+    loop = asyncio.get_running_loop()
+    if hasattr(os, "pidfd_open"):
+        # The pidfd becomes readable when the process exits, no thread is needed
+        pidfd = os.pidfd_open(pid)
+        exited = loop.create_future()
+        loop.add_reader(pidfd, lambda: exited.done() or exited.set_result(None))
+        try:
+            await exited
+        finally:
+            loop.remove_reader(pidfd)
+            os.close(pidfd)
+        _, status, rusage = os.wait4(pid, 0)
     else:
-        return StreamingCmdOutput(
-            stdout=main_output.getvalue(),
-            stderr=other_output,
-            return_code=process.returncode,
+        _, status, rusage = await loop.run_in_executor(None, os.wait4, pid, 0)
+    return os.waitstatus_to_exitcode(status), rusage
+
+
+async def run_async_command(
+    command: list[str],
+    cwd: Optional[str | os.PathLike[str]] = None,
+    env: Optional[dict[str, str]] = None,
+    prefix: Optional[str] = None,
+    timeout: Optional[float] = None,
+    tail_size: int = OUTPUT_TAIL_SIZE,
+    log_path: Optional[Path] = None,
+    silent: bool = False,
+) -> StreamingCmdOutput:
+    """
+    Run a command from the event loop, the async counterpart of `run_streaming_command`.
+
+    Both streams are printed line by line as they come in, prefixed with `prefix`
+    when given, so that many commands can run next to each other, unless `silent`.
+    The command runs in its own process group, which is killed when the
+    `timeout` in seconds is exceeded or when the awaiting task is cancelled.
+    """
+    tails = {
+        StreamType.STDOUT: OutputTail(tail_size),
+        StreamType.STDERR: OutputTail(tail_size),
+    }
+    start = time.monotonic()
+    with contextlib.ExitStack() as stack:
+        log_file = stack.enter_context(gzip.open(log_path, "wb")) if log_path else None
+        if os.name == "posix":
+            process = subprocess.Popen(
+                args=command,
+                cwd=cwd,
+                env=env,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                start_new_session=True,
+            )
+            assert process.stdout and process.stderr
+            readers = [
+                await _connect_pipe(process.stdout),
+                await _connect_pipe(process.stderr),
+            ]
+            wait = _wait4(process.pid)
+
+            def kill():
+                # The session id is the pid
+                _kill_process_group(process.pid)
+        else:
+            # Popen pipes can not be used by the proactor event loop on Windows
+            async_process = await asyncio.create_subprocess_exec(
+                *command,
+                cwd=cwd,
+                env=env,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+                creationflags=subprocess.CREATE_NEW_PROCESS_GROUP,  # type: ignore[attr-defined]
+            )
+            assert async_process.stdout and async_process.stderr
+            readers = [async_process.stdout, async_process.stderr]
+
+            async def wait_process() -> tuple[int, Any]:
+                return await async_process.wait(), None
+
+            wait = wait_process()
+
+            def kill():
+                with contextlib.suppress(ProcessLookupError):
+                    async_process.kill()
+
+        echo = [
+            _LineEcho(prefix or "", sys.stdout) if not silent else None for _ in readers
+        ]
+        # Both readers run on the event loop, so the log needs no lock
+        logs = [_LineLog(log_file) if log_file else None for _ in readers]
+        work = asyncio.gather(
+            _drain_reader(readers[0], tails[StreamType.STDOUT], echo[0], logs[0]),
+            _drain_reader(readers[1], tails[StreamType.STDERR], echo[1], logs[1]),
+            wait,
         )
+        try:
+            done, _ = await asyncio.wait({work}, timeout=timeout)
+            timed_out = not done
+            if timed_out:
+                kill()
+            *_, (return_code, rusage) = await work
+        except asyncio.CancelledError:
+            # Do not leave the process running, and still reap it
+            kill()
+            await work
+            raise
+
+    return StreamingCmdOutput(
+        stdout=tails[StreamType.STDOUT].getvalue(),
+        stderr=tails[StreamType.STDERR].getvalue(),
+        return_code=return_code,
+        resource_usage=ResourceUsage.from_rusage(time.monotonic() - start, rusage),
+        timed_out=timed_out,
+    )
+
+
+# Size of the chunks read when hashing files, this bounds the memory used for hashing
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+@dataclass
+class FileDigest:
+    """Digests and size of a file, in the same format as used in repodata."""
 
+    sha256: str
+    md5: str
+    size: int
 
-def calculate_hash(conda_file: Path):
+
+def _hash_file(path: Path, *hashers) -> int:
+    """Feed the file to all hashers in fixed size chunks and return the file size."""
+    size = 0
+    buffer = bytearray(HASH_CHUNK_SIZE)
+    view = memoryview(buffer)
+    with path.open(mode="rb") as f:
+        while read := f.readinto(buffer):
+            chunk = view[:read]
+            for hasher in hashers:
+                hasher.update(chunk)
+            size += read
+    return size
+
+
+def calculate_hash(conda_file: Path) -> str:
     """Calculate the SHA-256 hash of a conda file."""
-    with conda_file.open(mode="rb") as f:
-        # Read the entire file
-        data = f.read()
-        # Calculate the SHA-256 hash
-        build_hash = hashlib.sha256(data).hexdigest()
+    sha256 = hashlib.sha256()
+    _hash_file(conda_file, sha256)
+    return sha256.hexdigest()
+
 
-    return build_hash
+def calculate_digest(conda_file: Path) -> FileDigest:
+    """Calculate the SHA-256 and MD5 hash and the size of a conda file, in a single pass."""
+    sha256, md5 = hashlib.sha256(), hashlib.md5()
+    size = _hash_file(conda_file, sha256, md5)
+    return FileDigest(sha256=sha256.hexdigest(), md5=md5.hexdigest(), size=size)
 
 
 def find_conda_file(build_folder: Path) -> Path:
@@ -8,9 +8,11 @@ from pydantic import BaseModel, Field
 
 from multiprocessing.pool import ThreadPool
 from repror.internals.db import Recipe as RecipeDB, RemoteRecipe, get_recipe, save
+from repror.internals.options import global_options
 from repror.internals.recipe import (
+    SafeLoader,
     get_recipe_name,
-    load_recipe_config,
+    load_recipe_manifests,
     load_remote_recipe_config,
     recipe_files_hash,
 )
@@ -49,7 +51,7 @@ class ConfigYaml(BaseModel):
 @lru_cache
 def load_config(config_path: str = "config.yaml") -> ConfigYaml:
     with open(config_path, "r", encoding="utf8") as file:
-        return ConfigYaml.model_validate(yaml.safe_load(file))
+        return ConfigYaml.model_validate(yaml.load(file, Loader=SafeLoader))
 
 
 def save_config(data: ConfigYaml, config_path: str = "config.yaml"):
@@ -114,25 +116,24 @@ def load_all_recipes(config_path: str = "config.yaml") -> LoadedRecipes:
                     for repo, recipes in recipes_to_fetch.items()
                 ],
             )
-            saved_recipes = len(
-                [
-                    save(recipe)
-                    for repo_recipes in remote_recipes
-                    for recipe in repo_recipes
-                ]
-            )
+            # A read-only database can not store them, they are fetched again next time
+            if not global_options.read_only:
+                saved_recipes = len(
+                    [
+                        save(recipe)
+                        for repo_recipes in remote_recipes
+                        for recipe in repo_recipes
+                    ]
+                )
             [recipes.extend(recipe_list) for recipe_list in remote_recipes]
 
-    for local in config.local:
-        local_config = load_recipe_config(local.path)
-        local_path = Path(local.path)
-        recipe_name = get_recipe_name(local_config)
-        recipe_content_hash = recipe_files_hash(local_path.parent)
+    manifests = load_recipe_manifests([Path(local.path) for local in config.local])
+    for local, manifest in zip(config.local, manifests):
         recipe = RecipeDB(
-            name=recipe_name,
+            name=manifest.name,
             path=local.path,
-            raw_config=local_path.read_text(encoding="utf8"),
-            content_hash=recipe_content_hash,
+            raw_config=manifest.raw_config,
+            content_hash=manifest.content_hash,
         )
         recipes.append(recipe)
 
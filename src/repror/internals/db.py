@@ -3,15 +3,29 @@ from dataclasses import dataclass
 from datetime import datetime
 from enum import Enum
 import hashlib
+import json
 import logging
 import os
 from pathlib import Path
 import tempfile
 from typing import Generator, Literal as Lit, Optional
 from pydantic import BaseModel
-from sqlalchemy import func, text
+from sqlalchemy import (
+    Connection,
+    Engine,
+    Index,
+    event,
+    case,
+    func,
+    literal_column,
+    text,
+    true,
+    tuple_,
+)
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from typing import Sequence
-from sqlalchemy.orm import sessionmaker, scoped_session
+from sqlalchemy.orm import aliased, sessionmaker, scoped_session
+from sqlalchemy.orm.attributes import set_committed_value
 from sqlmodel import (
     Field,
     Relationship,
@@ -25,6 +39,7 @@ from sqlmodel import (
     col,
 )
 
+from repror.internals.migrations import check_migrated, migrate
 from repror.internals.recipe import clone_remote_recipe
 
 
@@ -62,15 +77,76 @@ class BuildState(str, Enum):
 
 
 def create_db_and_tables():
-    """Create the database and tables, if they don't exist."""
+    """Create the database and tables, if they don't exist, and migrate existing ones."""
     global engine
     assert engine  # This should not fail
     SQLModel.metadata.create_all(engine)
+    migrate(engine)
+
+
+# Pragmas set on every connection to a database file.
+# In WAL mode readers do not block the writer and the other way around,
+# and with synchronous=NORMAL a commit no longer waits for an fsync.
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    # Wait for other processes holding a lock instead of failing right away
+    "busy_timeout": 30_000,
+    # Negative sizes are in KiB, so this is 64 MiB
+    "cache_size": -64_000,
+    "mmap_size": 256 * 1024 * 1024,
+    "temp_store": "MEMORY",
+}
+# Journal mode and synchronous can not be changed on a read-only connection
+READ_ONLY_PRAGMAS = {
+    "query_only": "ON",
+    "busy_timeout": SQLITE_PRAGMAS["busy_timeout"],
+    "cache_size": SQLITE_PRAGMAS["cache_size"],
+    "mmap_size": SQLITE_PRAGMAS["mmap_size"],
+    "temp_store": SQLITE_PRAGMAS["temp_store"],
+}
+
+
+def create_sqlite_engine(sqlite_file_name: str, read_only: bool = False) -> Engine:
+    """Create an engine for the sqlite database file, tuned with `SQLITE_PRAGMAS`."""
+    if read_only:
+        sqlite_url = f"sqlite:///file:{sqlite_file_name}?mode=ro&uri=true"
+        pragmas = READ_ONLY_PRAGMAS
+    else:
+        sqlite_url = f"sqlite:///{sqlite_file_name}"
+        pragmas = SQLITE_PRAGMAS
+    sqlite_engine = create_engine(sqlite_url, echo=False)
 
+    @event.listens_for(sqlite_engine, "connect")
+    def set_pragmas(dbapi_connection, _connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
 
-def setup_engine(in_memory: bool = False):
-    """Setup the sqlite engine."""
-    _print_status(f"Setting up engine with in_memory={in_memory}")
+    return sqlite_engine
+
+
+def checkpoint_database():
+    """
+    Copy all transactions from the write-ahead log into the database file,
+    so the file can be copied or uploaded on its own.
+    """
+    if engine is None or engine.url.database in (None, "", ":memory:"):
+        return
+    with engine.connect() as connection:
+        connection.exec_driver_sql("PRAGMA wal_checkpoint(TRUNCATE)")
+
+
+def setup_engine(in_memory: bool = False, read_only: bool = False):
+    """
+    Setup the sqlite engine, a read-only engine does not create or migrate tables.
+    Opening a database that misses migrations read-only raises a `DatabaseNotMigratedError`.
+    """
+    _print_status(
+        f"Setting up engine with in_memory={in_memory}"
+        + (", read_only=True" if read_only else "")
+    )
     global engine, __Session
     if engine:
         # Engine is already set, skip initialization
@@ -91,13 +167,17 @@ def setup_engine(in_memory: bool = False):
 
         # Setup the engine
         # We assume that the database is in the same directory as the project
-        sqlite_url = f"sqlite:///{sqlite_file_name}"
-        engine = create_engine(sqlite_url, echo=False)
+        sqlite_engine = create_sqlite_engine(sqlite_file_name, read_only)
+        if read_only:
+            # The tables are neither created nor migrated on a read-only engine
+            check_migrated(sqlite_engine)
+        engine = sqlite_engine
 
     __Session.configure(
         bind=engine,
     )
-    create_db_and_tables()
+    if not read_only or in_memory:
+        create_db_and_tables()
 
 
 def setup_local_db() -> sessionmaker[SqlModelSession]:
@@ -106,6 +186,7 @@ def setup_local_db() -> sessionmaker[SqlModelSession]:
     session = sessionmaker(class_=SqlModelSession, expire_on_commit=False)
     session.configure(bind=engine)
     SQLModel.metadata.create_all(engine)
+    migrate(engine)
     return session
 
 
@@ -117,6 +198,25 @@ def get_session() -> SqlModelSession:
 
 
 class Build(SQLModel, table=True):
+    __table_args__ = (
+        # Lookup of the latest build of a recipe version,
+        # see `get_latest_builds` and `get_latest_build_with_rebuild`
+        Index(
+            "ix_build_recipe_lookup",
+            "recipe_name",
+            "recipe_hash",
+            "build_tool_hash",
+            "platform_name",
+            "platform_version",
+            "timestamp",
+        ),
+        # Latest build per (platform, recipe),
+        # see `get_rebuild_data` and `get_total_successful_builds_and_rebuilds`
+        Index("ix_build_platform_recipe", "platform_name", "recipe_name", "timestamp"),
+        # Builds per day, see `get_successful_builds_and_rebuilds_series`
+        Index("ix_build_timestamp", "timestamp"),
+    )
+
     id: int | None = Field(default=None, primary_key=True)
     recipe_name: str
     state: BuildState
@@ -134,10 +234,24 @@ class Build(SQLModel, table=True):
         },
     )
     actions_url: Optional[str] = None
+    # Resources used by the rattler-build process, see `ResourceUsage`
+    wall_time: Optional[float] = None
+    user_time: Optional[float] = None
+    system_time: Optional[float] = None
+    max_rss: Optional[int] = None
+    # Size in bytes of the produced package
+    artifact_size: Optional[int] = None
+    # Seconds spent finding, moving and hashing the produced package
+    artifact_time: Optional[float] = None
     rebuilds: list["Rebuild"] = Relationship(back_populates="build")
 
 
 class Rebuild(SQLModel, table=True):
+    __table_args__ = (
+        # Rebuilds are always looked up by their build, and often counted by state
+        Index("ix_rebuild_build_state", "build_id", "state"),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
     build_id: int = Field(foreign_key="build.id")
     state: BuildState
@@ -150,6 +264,15 @@ class Rebuild(SQLModel, table=True):
         },
     )
     actions_url: Optional[str] = None
+    # Resources used by the rattler-build process, see `ResourceUsage`
+    wall_time: Optional[float] = None
+    user_time: Optional[float] = None
+    system_time: Optional[float] = None
+    max_rss: Optional[int] = None
+    # Size in bytes of the produced package
+    artifact_size: Optional[int] = None
+    # Seconds spent finding, moving and hashing the produced package
+    artifact_time: Optional[float] = None
     build: Build = Relationship(back_populates="rebuilds")
 
     @property
@@ -161,6 +284,21 @@ class Rebuild(SQLModel, table=True):
         return self.build.recipe_name
 
 
+class LatestBuild(SQLModel, table=True):
+    """
+    Pointer to the latest build of every recipe per platform,
+    maintained by `update_latest_builds` whenever builds are inserted.
+    """
+
+    __tablename__ = "latest_build"
+
+    platform_name: str = Field(primary_key=True)
+    recipe_name: str = Field(primary_key=True)
+    build_id: int = Field(foreign_key="build.id")
+    # Timestamp of the build, to compare it with new builds
+    timestamp: Optional[datetime] = None
+
+
 class Recipe(BaseModel):
     name: str
     path: str
@@ -195,6 +333,11 @@ class V1Rebuild(SQLModel, table=True):
     """Database model for V1 package rebuild attempts from conda-forge."""
 
     __tablename__ = "v1_rebuild"
+    __table_args__ = (
+        # Statistics are computed per platform and over time
+        Index("ix_v1_rebuild_platform_timestamp", "platform_name", "timestamp"),
+        Index("ix_v1_rebuild_timestamp", "timestamp"),
+    )
 
     id: Optional[int] = Field(default=None, primary_key=True)
     package_name: str
@@ -236,6 +379,26 @@ class V1Rebuild(SQLModel, table=True):
         return self.original_build_tool == "rattler-build"
 
 
+class PatchLedger(SQLModel, table=True):
+    """
+    Digests of the patches merged into the database,
+    so merging the same patches again does not insert duplicates.
+    """
+
+    __tablename__ = "patch_ledger"
+
+    # sha256 of the canonical JSON of the patch, see `patcher.patch_digest`
+    digest: str = Field(primary_key=True)
+    # "build" for build and rebuild patches, "v1" for V1 rebuild patches
+    kind: str
+    merged_at: Optional[datetime] = Field(
+        default=None,
+        sa_column_kwargs={
+            "server_default": text("CURRENT_TIMESTAMP"),
+        },
+    )
+
+
 def get_latest_builds(
     recipe_names_and_hash: list[tuple[str, str]],
     build_tool_hash: str,
@@ -277,6 +440,26 @@ def get_latest_builds(
         return {build.recipe_name: build for build in builds}
 
 
+def _latest_rebuild_id():
+    """Correlated subquery with the id of the newest rebuild of the selected build"""
+    newer_rebuild = aliased(Rebuild)
+    return (
+        select(func.max(newer_rebuild.id))
+        .where(newer_rebuild.build_id == Build.id)
+        .scalar_subquery()
+    )
+
+
+def _attach_latest_rebuild(build: Build, rebuild: Optional[Rebuild]):
+    """
+    Populate `build.rebuilds` with only its newest rebuild, as loaded by a join,
+    so accessing it does not issue a query per build.
+    """
+    set_committed_value(build, "rebuilds", [rebuild] if rebuild else [])
+    if rebuild:
+        set_committed_value(rebuild, "build", build)
+
+
 def get_latest_build_with_rebuild(
     recipe_names_and_hash: list[tuple[str, str]],
     build_tool_hash: str,
@@ -303,7 +486,7 @@ def get_latest_build_with_rebuild(
         ).subquery()
 
         statement = (
-            select(Build)
+            select(Build, Rebuild)
             .join(
                 subquery,
                 and_(
@@ -312,20 +495,56 @@ def get_latest_build_with_rebuild(
                     Build.timestamp == subquery.c.max_timestamp,
                 ),
             )
+            .outerjoin(Rebuild, col(Rebuild.id) == _latest_rebuild_id())
             .order_by(col(Build.timestamp).desc())
         )
-        builds = session.exec(statement).fetchall()
+        builds_with_rebuild = session.exec(statement).fetchall()
 
+        for build, rebuild in builds_with_rebuild:
+            _attach_latest_rebuild(build, rebuild)
         return {
-            build.recipe_name: (build, build.rebuilds[-1] if build.rebuilds else None)
-            for build in builds
+            build.recipe_name: (build, rebuild)
+            for build, rebuild in builds_with_rebuild
         }
 
 
+def update_latest_builds(
+    session: SqlModelSession | Connection, build_ids: Optional[Sequence[int]] = None
+):
+    """
+    Point `latest_build` to the given builds, unless a newer build of the same recipe
+    and platform exists. Without ids all builds are considered, rebuilding the table.
+    """
+    candidates = select(
+        Build.platform_name, Build.recipe_name, Build.id, Build.timestamp
+    ).where(col(Build.id).in_(build_ids) if build_ids is not None else true())
+    upsert = sqlite_insert(LatestBuild).from_select(
+        ["platform_name", "recipe_name", "build_id", "timestamp"], candidates
+    )
+    # Builds are ordered by timestamp and then by id, for builds with the same timestamp
+    newer = tuple_(upsert.excluded.timestamp, upsert.excluded.build_id) >= tuple_(
+        LatestBuild.timestamp, LatestBuild.build_id
+    )
+    session.execute(
+        upsert.on_conflict_do_update(
+            index_elements=["platform_name", "recipe_name"],
+            set_={
+                "build_id": upsert.excluded.build_id,
+                "timestamp": upsert.excluded.timestamp,
+            },
+            where=newer,
+        )
+    )
+
+
 # Function to save the build, rebuild or recipe in the database
 def save(build: Build | Rebuild | Recipe):
     with get_session() as session:
         session.add(build)
+        if isinstance(build, Build):
+            # Assigns the id and the timestamp to the build
+            session.flush()
+            update_latest_builds(session, [build.id])
         session.commit()
 
 
@@ -334,30 +553,32 @@ def get_rebuild_data(
     recipe_names: Optional[list[str]] = None,
     platform: Optional[str] = None,
 ) -> Sequence[Build]:
+    """
+    Get the latest build per platform and recipe,
+    with `rebuilds` containing only the newest rebuild of each build.
+    """
     with get_session() as session:
-        # Subquery to get the latest build per platform
-        latest_build_subquery = (
-            select(Build, func.max(Build.timestamp).label("latest_timestamp"))
-            .group_by(Build.platform_name)
-            .group_by(Build.recipe_name)
+        # Latest build per platform, joined with its newest rebuild
+        latest_builds_query = (
+            select(Build, Rebuild)
+            .join(LatestBuild, col(LatestBuild.build_id) == Build.id)
+            .outerjoin(Rebuild, col(Rebuild.id) == _latest_rebuild_id())
             .order_by(col(Build.timestamp).desc())
         )
         if platform:
-            latest_build_subquery = latest_build_subquery.where(
-                Build.platform_name == platform
+            latest_builds_query = latest_builds_query.where(
+                LatestBuild.platform_name == platform
             )
 
         if recipe_names:
-            latest_build_subquery = latest_build_subquery.where(
-                or_(col(Build.recipe_name).in_(recipe_names))
+            latest_builds_query = latest_builds_query.where(
+                col(LatestBuild.recipe_name).in_(recipe_names)
             )
 
-        # Main query to get the latest builds
-        all_group_builds = session.exec(latest_build_subquery).all()
-        latest_builds = [build for build, _ in all_group_builds]
-
-        [build.rebuilds for build in latest_builds]
-        return latest_builds
+        latest_builds = session.exec(latest_builds_query).all()
+        for build, rebuild in latest_builds:
+            _attach_latest_rebuild(build, rebuild)
+        return [build for build, _ in latest_builds]
 
 
 # Function to query the database and return recipe data
@@ -388,50 +609,131 @@ class SuccessfulBuildsAndRebuilds:
     total_builds: int
 
 
-def get_total_successful_builds_and_rebuilds(
-    platform_name: Lit["linux", "darwin", "windows"] | str,
-    before_time: datetime,
-) -> SuccessfulBuildsAndRebuilds:
-    """Query to get the total number of successful builds and rebuilds before the given timestamp."""
-    with get_session() as session:
-        # Subquery to find the latest build for each unique recipe_name before the given timestamp
-        select_matching_builds = (
-            select(
-                Build.id,
-            )
-            .where(
-                col(Build.platform_name) == platform_name,
-                col(Build.timestamp) <= before_time,
+def _days_table(timestamps: Sequence[datetime]):
+    """
+    Table valued function with a single `value` column containing the given timestamps.
+    They are passed as a single JSON parameter, so the number of days is not limited
+    by the number of bound parameters or compound selects sqlite supports.
+    """
+    # Same format in which sqlalchemy stores datetimes in sqlite, so they compare correctly
+    values = [time.isoformat(sep=" ", timespec="microseconds") for time in timestamps]
+    return func.json_each(json.dumps(values)).table_valued("value").alias("days")
+
+
+def get_successful_builds_and_rebuilds_series(
+    timestamps: Sequence[datetime],
+) -> dict[str, list[SuccessfulBuildsAndRebuilds]]:
+    """
+    Get the number of successful builds and rebuilds before each of the given timestamps,
+    for every platform, in a single query.
+    Only the latest build of every recipe before a timestamp is taken into account.
+    """
+    if not timestamps:
+        return {}
+    days = _days_table(timestamps)
+    # Every build is counted from the first day at or after its creation,
+    # so each day selects the range after the previous day using the timestamp index
+    bounds = select(
+        days.c.value.label("day"),
+        func.coalesce(func.lag(days.c.value).over(order_by=days.c.value), "").label(
+            "previous_day"
+        ),
+    ).subquery()
+    successful_rebuilds = (
+        select(Rebuild.build_id, func.count().label("count"))
+        .where(Rebuild.state == BuildState.SUCCESS)
+        .group_by(col(Rebuild.build_id))
+        .subquery()
+    )
+    builds = (
+        select(
+            bounds.c.day,
+            Build.platform_name,
+            case((Build.state == BuildState.SUCCESS, 1), else_=0).label("successful"),
+            func.coalesce(successful_rebuilds.c.count, 0).label("rebuilds"),
+        )
+        .add_columns(
+            # The previous build of the same recipe, which this build replaces
+            *(
+                func.lag(column, 1, 0)
+                .over(
+                    partition_by=(Build.platform_name, Build.recipe_name),
+                    order_by=(col(Build.timestamp), col(Build.id)),
+                )
+                .label(f"replaced_{name}")
+                for name, column in [
+                    ("build", literal_column("1")),
+                    (
+                        "successful",
+                        case((Build.state == BuildState.SUCCESS, 1), else_=0),
+                    ),
+                    ("rebuilds", func.coalesce(successful_rebuilds.c.count, 0)),
+                ]
             )
-            .group_by(Build.recipe_name)
         )
-        subquery = select_matching_builds.subquery()
-        # Query to get the total number of successful builds
-        successful_builds_query = (
-            select(func.count(col(Build.id)))
-            .join(subquery, (col(Build.id) == subquery.c.id))
-            .where(Build.state == BuildState.SUCCESS)
+        .select_from(bounds)
+        .join(
+            Build,
+            and_(
+                col(Build.timestamp) <= bounds.c.day,
+                col(Build.timestamp) > bounds.c.previous_day,
+            ),
         )
+        .outerjoin(successful_rebuilds, successful_rebuilds.c.build_id == Build.id)
+    ).subquery()
+    # How the counts change every day
+    changes = (
+        select(
+            builds.c.day,
+            builds.c.platform_name,
+            func.sum(builds.c.successful - builds.c.replaced_successful).label(
+                "successful"
+            ),
+            func.sum(builds.c.rebuilds - builds.c.replaced_rebuilds).label("rebuilds"),
+            func.sum(1 - builds.c.replaced_build).label("total"),
+        ).group_by(builds.c.day, builds.c.platform_name)
+    ).subquery()
+    # Accumulate the changes over the days
+    statement = select(
+        changes.c.day,
+        changes.c.platform_name,
+        *(
+            func.sum(changes.c[name]).over(
+                partition_by=changes.c.platform_name, order_by=changes.c.day
+            )
+            for name in ["successful", "rebuilds", "total"]
+        ),
+    )
 
-        # Query to get the total number of successful rebuilds for the selected builds
-        successful_rebuilds_query = select(func.count(col(Rebuild.id))).where(
-            col(Rebuild.build_id).in_(select(subquery)),
-            Rebuild.state == BuildState.SUCCESS,
-        )
+    with get_session() as session:
+        rows = session.exec(statement).all()
 
-        total_builds_query = select(func.count(col(Build.id))).join(
-            subquery, (col(Build.id) == subquery.c.id)
+    cumulative: dict[str, dict[str, SuccessfulBuildsAndRebuilds]] = {}
+    for day, platform_name, builds, rebuilds, total_builds in rows:
+        cumulative.setdefault(platform_name, {})[day] = SuccessfulBuildsAndRebuilds(
+            builds, rebuilds, total_builds=total_builds
         )
 
-        # Execute the queries and count the results
-        successful_builds_count = session.exec(successful_builds_query).one()
-        successful_rebuilds_count = session.exec(successful_rebuilds_query).one()
-        total_builds: int = session.exec(total_builds_query).one()
-        return SuccessfulBuildsAndRebuilds(
-            successful_builds_count,
-            successful_rebuilds_count,
-            total_builds=total_builds,
-        )
+    # Days without new builds carry over the counts of the day before
+    series: dict[str, list[SuccessfulBuildsAndRebuilds]] = {}
+    for platform_name, per_day in cumulative.items():
+        previous = SuccessfulBuildsAndRebuilds(0, 0, 0)
+        series[platform_name] = []
+        for time in timestamps:
+            previous = per_day.get(
+                time.isoformat(sep=" ", timespec="microseconds"), previous
+            )
+            series[platform_name].append(previous)
+    return series
+
+
+def get_total_successful_builds_and_rebuilds(
+    platform_name: Lit["linux", "darwin", "windows"] | str,
+    before_time: datetime,
+) -> SuccessfulBuildsAndRebuilds:
+    """Query to get the total number of successful builds and rebuilds before the given timestamp."""
+    series = get_successful_builds_and_rebuilds_series([before_time])
+    return series.get(platform_name, [SuccessfulBuildsAndRebuilds(0, 0, 0)])[0]
 
 
 @dataclass
@@ -491,29 +793,78 @@ def get_v1_rebuild_stats(platform: Optional[str] = None) -> V1RebuildStats:
         )
 
 
-def get_v1_rebuild_stats_before(before_time: datetime) -> V1RebuildStats:
-    """Get V1 rebuild statistics for records created before the given timestamp."""
-    with get_session() as session:
-        base_query = select(func.count(V1Rebuild.id)).where(
-            col(V1Rebuild.timestamp) <= before_time
+def get_v1_rebuild_stats_series(timestamps: Sequence[datetime]) -> list[V1RebuildStats]:
+    """
+    Get V1 rebuild statistics for the records created before each of the given timestamps,
+    which must be sorted, in a single query.
+    """
+    if not timestamps:
+        return []
+    days = _days_table(timestamps)
+    # Every rebuild is counted from the first day at or after its creation,
+    # so each day selects the range after the previous day using the timestamp index
+    bounds = select(
+        days.c.value.label("day"),
+        func.coalesce(func.lag(days.c.value).over(order_by=days.c.value), "").label(
+            "previous_day"
+        ),
+    ).subquery()
+    per_day = (
+        select(
+            bounds.c.day,
+            func.count().label("total"),
+            func.sum(case((V1Rebuild.state == BuildState.SUCCESS, 1), else_=0)).label(
+                "successful"
+            ),
+            func.sum(
+                case(
+                    (
+                        and_(
+                            V1Rebuild.state == BuildState.SUCCESS,
+                            V1Rebuild.original_hash == V1Rebuild.rebuild_hash,
+                        ),
+                        1,
+                    ),
+                    else_=0,
+                )
+            ).label("reproducible"),
         )
-
-        total = session.exec(base_query).one()
-
-        successful_query = base_query.where(V1Rebuild.state == BuildState.SUCCESS)
-        successful = session.exec(successful_query).one()
-
-        reproducible_query = base_query.where(
-            V1Rebuild.state == BuildState.SUCCESS,
-            V1Rebuild.original_hash == V1Rebuild.rebuild_hash,
+        .select_from(bounds)
+        .join(
+            V1Rebuild,
+            and_(
+                col(V1Rebuild.timestamp) <= bounds.c.day,
+                col(V1Rebuild.timestamp) > bounds.c.previous_day,
+            ),
         )
-        reproducible = session.exec(reproducible_query).one()
+        .group_by(bounds.c.day)
+    ).subquery()
+    # Accumulate the counts over the days
+    statement = select(
+        per_day.c.day,
+        func.sum(per_day.c.total).over(order_by=per_day.c.day),
+        func.sum(per_day.c.successful).over(order_by=per_day.c.day),
+        func.sum(per_day.c.reproducible).over(order_by=per_day.c.day),
+    )
 
-        failed = total - successful
+    with get_session() as session:
+        rows = session.exec(statement).all()
 
-        return V1RebuildStats(
+    cumulative = {
+        day: V1RebuildStats(
             total=total,
             successful=successful,
             reproducible=reproducible,
-            failed=failed,
+            failed=total - successful,
+        )
+        for day, total, successful, reproducible in rows
+    }
+    # Days without new rebuilds carry over the totals of the day before
+    stats = []
+    previous = V1RebuildStats(total=0, successful=0, reproducible=0, failed=0)
+    for time in timestamps:
+        previous = cumulative.get(
+            time.isoformat(sep=" ", timespec="microseconds"), previous
         )
+        stats.append(previous)
+    return stats
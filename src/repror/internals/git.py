@@ -1,3 +1,4 @@
+from functools import lru_cache
 from pathlib import Path
 from subprocess import CompletedProcess
 
@@ -5,15 +6,11 @@ import base64
 import os
 import re
 import subprocess
+import tarfile
 from typing import Optional
 
-import requests
 from .commands import StreamType, run_command, run_streaming_command
 
-from dotenv import load_dotenv
-
-load_dotenv()
-
 
 class GithubAPI:
     """
@@ -78,6 +75,9 @@ class GithubAPI:
         remote_branch: Optional[str] = None,
     ):
         """Update or create a file in a GitHub repository and commit the changes."""
+        # Imported here, only the commands that update the remote need it
+        import requests
+
         url = f"https://api.github.com/repos/{self.owner}/contents/{file_path}"
         headers = {
             "Authorization": f"Bearer {self.token}",
@@ -118,7 +118,13 @@ class GithubAPI:
         response.raise_for_status()
 
 
-github_api = GithubAPI()
+@lru_cache
+def get_github_api() -> GithubAPI:
+    """
+    Get the GitHub API client. It is created on first use,
+    because it needs to query git for the remote and the branch.
+    """
+    return GithubAPI()
 
 
 def clone_repo(repo_url, clone_dir) -> int:
@@ -143,6 +149,62 @@ def clone_no_checkout(repo_url: str, clone_dir: Path) -> int:
     ).return_code
 
 
+def clone_bare(repo_url: str, mirror_dir: Path) -> CompletedProcess:
+    """Clone a bare repository, which only contains the git objects and refs."""
+    return run_command(
+        ["git", "clone", "--bare", "--quiet", repo_url, str(mirror_dir)], silent=True
+    )
+
+
+def fetch_all(mirror_dir: Path) -> CompletedProcess:
+    """Fetch all branches and tags of a bare repository from its origin."""
+    return run_command(
+        [
+            "git",
+            "fetch",
+            "--quiet",
+            "--tags",
+            "--prune",
+            "origin",
+            "+refs/heads/*:refs/heads/*",
+        ],
+        cwd=str(mirror_dir),
+        silent=True,
+    )
+
+
+def archive_to_dir(repo_dir: Path, rev: str, path: Path, target_dir: Path):
+    """
+    Export `path` of the repository at `rev` into `target_dir`,
+    streaming `git archive` so no checkout or worktree is needed.
+    """
+    target_dir.mkdir(parents=True, exist_ok=True)
+    process = subprocess.Popen(
+        ["git", "archive", "--format=tar", rev, "--", str(path.as_posix())],
+        cwd=str(repo_dir),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+    assert process.stdout
+    try:
+        with tarfile.open(fileobj=process.stdout, mode="r|") as archive:
+            # The tar filter rejects members outside of the target, but keeps
+            # symlinks as a checkout would, also those pointing out of the recipe
+            if hasattr(tarfile, "tar_filter"):
+                archive.extractall(target_dir, filter="tar")
+            else:
+                archive.extractall(target_dir)
+    except tarfile.ReadError:
+        # A failing `git archive` writes nothing, report its error instead
+        if process.wait() == 0:
+            raise
+    stderr = process.stderr.read() if process.stderr else b""
+    if process.wait() != 0:
+        raise subprocess.CalledProcessError(
+            process.returncode, process.args, stderr=stderr
+        )
+
+
 def sparse_checkout_init(clone_dir: Path) -> int:
     """Initialize sparse checkout."""
     return run_streaming_command(
@@ -172,10 +234,13 @@ def check_rev_is_present(clone_dir: Path, rev: str) -> bool:
     Usually it is used to check if an update is needed
     """
     try:
-        output = run_command(
-            ["git", "cat-file", "-t", rev], cwd=str(clone_dir), silent=True
+        # Peel annotated tags, so they count as present like the commit they point to
+        run_command(
+            ["git", "rev-parse", "--verify", "--quiet", f"{rev}^{{commit}}"],
+            cwd=str(clone_dir),
+            silent=True,
         )
-        return b"commit" in output.stdout
+        return True
     except subprocess.CalledProcessError:
         return False
 
@@ -0,0 +1,76 @@
+import re
+import subprocess
+import sys
+from dataclasses import dataclass
+
+from rich.table import Table
+
+# Format of the lines written by `python -X importtime`
+IMPORT_TIME_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+
+@dataclass
+class ImportTime:
+    module: str
+    # Time spent importing the module itself, in microseconds
+    self_us: int
+    # Time spent importing the module and everything it imported, in microseconds
+    cumulative_us: int
+    # Depth in the import tree, 0 means imported by the entry point
+    depth: int
+
+
+def parse_import_times(stderr: str) -> tuple[list[ImportTime], list[str]]:
+    """Split the stderr of `python -X importtime` in the import times and the other output."""
+    import_times = []
+    other_lines = []
+    for line in stderr.splitlines():
+        match = IMPORT_TIME_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, module = match.groups()
+            import_times.append(
+                ImportTime(
+                    module=module,
+                    self_us=int(self_us),
+                    cumulative_us=int(cumulative_us),
+                    depth=(len(indent) - 1) // 2,
+                )
+            )
+        elif not line.startswith("import time:"):
+            other_lines.append(line)
+    return import_times, other_lines
+
+
+def import_times_table(import_times: list[ImportTime], limit: int = 25) -> Table:
+    """Converts import times to a rich table with the slowest imports first"""
+    total_us = sum(t.cumulative_us for t in import_times if t.depth == 0)
+    table = Table(
+        "Module",
+        "Cumulative (ms)",
+        "Self (ms)",
+        title=f"Slowest imports, {total_us / 1000:.1f} ms in total",
+    )
+    slowest = sorted(import_times, key=lambda t: t.cumulative_us, reverse=True)
+    for import_time in slowest[:limit]:
+        table.add_row(
+            import_time.module,
+            f"{import_time.cumulative_us / 1000:.1f}",
+            f"{import_time.self_us / 1000:.1f}",
+        )
+    return table
+
+
+def profile_imports(args: list[str]) -> tuple[int, Table]:
+    """
+    Run repror with the given arguments in a new interpreter with `-X importtime`,
+    and return its exit code together with a report of where the startup time went.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-m", "repror.repror", *args],
+        stderr=subprocess.PIPE,
+        text=True,
+    )
+    import_times, other_lines = parse_import_times(result.stderr)
+    if other_lines:
+        sys.stderr.write("\n".join(other_lines) + "\n")
+    return result.returncode, import_times_table(import_times)
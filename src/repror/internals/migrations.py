@@ -0,0 +1,111 @@
+"""
+Versioned migrations of the database schema.
+
+`SQLModel.metadata.create_all` creates missing tables, but never alters existing ones.
+Changes to existing tables, like new indexes or columns, are applied here instead.
+The schema version of a database is stored in the `user_version` pragma of sqlite,
+and every migration bumps it by one. Migrations must be idempotent,
+because a new database is created by `create_all` with the latest schema already.
+"""
+
+import logging
+from typing import Callable
+
+from sqlalchemy import Connection, Engine, Table
+from sqlmodel import SQLModel
+
+logger = logging.getLogger(__name__)
+
+Migration = Callable[[Connection], None]
+
+
+def _create_index(connection: Connection, table_name: str, index_name: str):
+    """Create an index declared on the table, if it doesn't exist."""
+    table = SQLModel.metadata.tables[table_name]
+    index = next(index for index in table.indexes if index.name == index_name)
+    index.create(connection, checkfirst=True)
+
+
+def _create_lookup_indexes(connection: Connection):
+    """Create the indexes of the latest build lookups and the statistics."""
+    _create_index(connection, "build", "ix_build_recipe_lookup")
+    _create_index(connection, "build", "ix_build_platform_recipe")
+    _create_index(connection, "rebuild", "ix_rebuild_build_state")
+    _create_index(connection, "v1_rebuild", "ix_v1_rebuild_platform_timestamp")
+    _create_index(connection, "v1_rebuild", "ix_v1_rebuild_timestamp")
+
+
+def _create_timestamp_index(connection: Connection):
+    """Create the index of the builds per day."""
+    _create_index(connection, "build", "ix_build_timestamp")
+
+
+def _add_missing_columns(connection: Connection, table: Table):
+    """Add the nullable columns declared on the table that the database does not have yet."""
+    existing = {
+        row[1] for row in connection.exec_driver_sql(f"PRAGMA table_info({table.name})")
+    }
+    for column in table.columns:
+        if column.name in existing:
+            continue
+        if not column.nullable:
+            raise ValueError(
+                f"Can not add column {table.name}.{column.name}, it is not nullable"
+            )
+        column_type = column.type.compile(dialect=connection.dialect)
+        connection.exec_driver_sql(
+            f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"
+        )
+
+
+def _add_resource_columns(connection: Connection):
+    """Add the resource usage columns to the build and rebuild tables."""
+    for table_name in ["build", "rebuild"]:
+        _add_missing_columns(connection, SQLModel.metadata.tables[table_name])
+
+
+def _fill_latest_builds(connection: Connection):
+    """Point the new latest_build table to the latest builds that already exist."""
+    from repror.internals.db import update_latest_builds
+
+    update_latest_builds(connection)
+
+
+# Append new migrations to the end, never reorder or remove them
+MIGRATIONS: list[Migration] = [
+    _create_lookup_indexes,
+    _create_timestamp_index,
+    _fill_latest_builds,
+    _add_resource_columns,
+]
+
+
+def schema_version(connection: Connection) -> int:
+    """Get the schema version of the database."""
+    return connection.exec_driver_sql("PRAGMA user_version").scalar_one()
+
+
+class DatabaseNotMigratedError(RuntimeError):
+    """The database misses migrations, which can not be applied to a read-only database."""
+
+
+def check_migrated(engine: Engine):
+    """Raise a `DatabaseNotMigratedError` when the database misses migrations."""
+    with engine.connect() as connection:
+        version = schema_version(connection)
+    if version < len(MIGRATIONS):
+        raise DatabaseNotMigratedError(
+            f"The database needs migrating from schema version {version} to "
+            f"{len(MIGRATIONS)}, run a command without --read-only once to migrate it"
+        )
+
+
+def migrate(engine: Engine):
+    """Apply the migrations that are missing in the database."""
+    with engine.begin() as connection:
+        version = schema_version(connection)
+        for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+            logger.info(f"Migrating database to version {number}: {migration.__name__}")
+            migration(connection)
+            # Pragmas do not support bound parameters
+            connection.exec_driver_sql(f"PRAGMA user_version = {number}")
@@ -1,14 +1,38 @@
+from enum import Enum
+from pathlib import Path
+from typing import Optional
+
+
+class PatchFormat(str, Enum):
+    """How patches are written to build_info/, see `patcher.save_patch`."""
+
+    # One JSON file per build or rebuild
+    JSON = "json"
+    # Records appended to one JSON Lines file per recipe and platform
+    JSONL = "jsonl"
+    # Same as JSONL, but gzip compressed
+    JSONL_GZ = "jsonl.gz"
+
+
 class GlobalOptions:
     """Global options for the CLI."""
 
     skip_setup_rattler_build: bool = False
     in_memory_sql: bool = False
+    # Open the database read-only, for commands that only report on it
+    read_only: bool = False
     # This is a global option to skip the output of the command
     # This is useful when we want to run a command and not show the output
     # when generating recipe names that are used to start dynamic jobs
     no_output: bool = False
     # What config file to use for loading
     config_path: str = "config.yaml"
+    # Format of the patches written with --patch
+    patch_format: PatchFormat = PatchFormat.JSON
+    # Where the complete output of builds and rebuilds is kept, see `command_log_path`
+    log_dir: Optional[Path] = None
+    # Seconds after which builds and rebuilds are killed, see `run_streaming_command`
+    command_timeout: Optional[float] = None
 
 
 global_options = GlobalOptions()
@@ -1,42 +1,65 @@
 import subprocess
 
-from repror.internals.db import PROD_DB
+from repror.internals.db import PROD_DB, checkpoint_database
 from repror.internals.print import print
 from repror.internals.patcher import (
-    aggregate_build_patches,
-    load_patch,
+    iter_build_patches,
+    load_patches,
     load_v1_patches,
+    timed_iter,
 )
 
 # Release tag for storing the database
 DB_RELEASE_TAG = "database"
+# Number of patches loaded per transaction, so memory does not grow with the number of patches
+PATCH_BATCH_SIZE = 1000
 
 
-def patch_builds_to_db(build_dir: str = "build_info") -> int:
-    patches = aggregate_build_patches(build_dir)
-    for recipe_name in patches:
-        for platform in patches[recipe_name]:
-            if (
-                "rebuild" in patches[recipe_name][platform]
-                and "build" not in patches[recipe_name][platform]
-            ):
-                raise ValueError(
-                    f"Rebuild patch for {recipe_name} without build patch. Aborting"
-                )
-
-            print(f":running: Writing {recipe_name} to the database")
+def print_timings(timings: dict[str, float]):
+    """Print how long each phase of merging the patches took"""
+    phases = ", ".join(f"{phase} {seconds:.3f}s" for phase, seconds in timings.items())
+    print(f":stopwatch: {phases}")
 
-            patch_for_recipe = patches[recipe_name][platform]
-            load_patch(patch_for_recipe)
 
-    return len(patches)
+def patch_builds_to_db(build_dir: str = "build_info") -> int:
+    """
+    Stream the patches into the database, in transactions of `PATCH_BATCH_SIZE` patches.
+    When merging stops halfway, the patches merged before are skipped the next time.
+    """
+    timings: dict[str, float] = {}
+    total = merged = 0
+    batch: list[dict] = []
+    for recipe_name, patch in timed_iter(
+        iter_build_patches(build_dir), timings, "read"
+    ):
+        if "rebuild" in patch and "build" not in patch:
+            raise ValueError(
+                f"Rebuild patch for {recipe_name} without build patch. Aborting"
+            )
+
+        print(f":running: Writing {recipe_name} to the database")
+        batch.append(patch)
+        total += 1
+        if len(batch) >= PATCH_BATCH_SIZE:
+            merged += load_patches(batch, timings)
+            batch = []
+    if batch:
+        merged += load_patches(batch, timings)
+
+    if merged < total:
+        print(f":recycle: Skipped {total - merged} patches that were merged before")
+    print_timings(timings)
+
+    return merged
 
 
 def patch_v1_rebuilds_to_db(build_dir: str = "build_info/v1") -> int:
     """Patch V1 rebuild results to the database."""
-    count = load_v1_patches(build_dir)
+    timings: dict[str, float] = {}
+    count = load_v1_patches(build_dir, timings)
     if count > 0:
         print(f":package: Loaded {count} V1 rebuild patches to the database")
+        print_timings(timings)
     return count
 
 
@@ -72,6 +95,9 @@ def write_database_to_release():
             check=True,
         )
 
+    # The database is in WAL mode, so move the recent transactions into the file first
+    checkpoint_database()
+
     # Upload/replace the database file
     print(":arrow_up: Uploading repro.db to release")
     subprocess.run(
@@ -88,7 +114,15 @@ def download_database_from_release():
     """
     print(":arrow_down: Downloading database from GitHub Release")
     result = subprocess.run(
-        ["gh", "release", "download", DB_RELEASE_TAG, "--pattern", PROD_DB, "--clobber"],
+        [
+            "gh",
+            "release",
+            "download",
+            DB_RELEASE_TAG,
+            "--pattern",
+            PROD_DB,
+            "--clobber",
+        ],
         capture_output=True,
         text=True,
     )
@@ -1,12 +1,35 @@
 from collections import defaultdict
+from contextlib import contextmanager
 import glob
+import gzip
 import json
+import logging
 import os
 from pathlib import Path
-from typing import Any, Literal
+import time
+import zlib
+from typing import Any, Generator, Iterable, Iterator, Literal, Optional, TypeVar
 
+from sqlalchemy import insert
+from sqlmodel import Session as SqlModelSession, col, select
 
-from repror.internals.db import Build, Rebuild, V1Rebuild, get_session
+from repror.internals.db import (
+    Build,
+    PatchLedger,
+    Rebuild,
+    V1Rebuild,
+    compute_hash,
+    get_session,
+    update_latest_builds,
+)
+from repror.internals.options import PatchFormat, global_options
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Number of digests looked up in the ledger per query, well below sqlite's variable limit
+LEDGER_LOOKUP_CHUNK = 500
 
 
 def find_patches(folder_path: str) -> list[Path]:
@@ -17,38 +40,120 @@ def find_patches(folder_path: str) -> list[Path]:
     return [Path(file) for file in json_files]
 
 
-def aggregate_build_patches(
+def find_patch_logs(folder_path: str) -> list[Path]:
+    """
+    Use glob to find all .jsonl and .jsonl.gz files in the folder
+    """
+    log_files = []
+    for pattern in ["**/*.jsonl", "**/*.jsonl.gz"]:
+        log_files.extend(glob.glob(os.path.join(folder_path, pattern), recursive=True))
+    return [Path(file) for file in sorted(log_files)]
+
+
+def read_patch_log(file_path: Path) -> Iterator[dict[str, Any]]:
+    """
+    Stream the records of a JSON Lines patch file, one line at a time.
+    A line that was only partially written, e.g. by a cancelled job, is skipped,
+    and a truncated gzip file is read up to its last complete record.
+    """
+    opener = gzip.open if file_path.name.endswith(".gz") else open
+    line_number = 0
+    with opener(file_path, "rt", encoding="utf-8") as file:
+        try:
+            for line_number, line in enumerate(file, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    logger.warning(
+                        f"Skipping invalid patch in {file_path}:{line_number}"
+                    )
+        except (EOFError, gzip.BadGzipFile, zlib.error) as e:
+            logger.warning(
+                f"Skipping the truncated end of {file_path} after line {line_number}: {e}"
+            )
+
+
+def _patch_log_recipe_dir(file_path: Path) -> Path:
+    """The recipe folder of the JSON layout, build_info/<platform>/<recipe>, of a patch log"""
+    return file_path.parent / file_path.name[: file_path.name.rindex(".jsonl")]
+
+
+def iter_build_patches(
     folder_path: str,
-) -> dict[str, dict[Literal["build", "rebuild"], dict]]:
+) -> Iterator[tuple[str, dict[Literal["build", "rebuild"], dict]]]:
     """
-    Aggregate all found patches, and return list of what should be saved
+    Yield the patch of every recipe and platform together with its folder, one at a time,
+    so only the records of a single recipe are kept in memory.
+    Patch logs take precedence over JSON files of the same recipe.
     """
-    patches: dict[str, Any] = defaultdict(lambda: defaultdict(dict))
-    json_files = find_patches(folder_path)
+    json_files: dict[Path, list[Path]] = defaultdict(list)
+    for file_path in find_patches(folder_path):
+        json_files[file_path.parent].append(file_path)
+    log_files: dict[Path, list[Path]] = defaultdict(list)
+    for file_path in find_patch_logs(folder_path):
+        log_files[_patch_log_recipe_dir(file_path)].append(file_path)
 
-    for file_path in json_files:
-        with open(file_path, "r") as file:
-            data = json.load(file)
+    for recipe_dir in sorted(json_files.keys() | log_files.keys()):
+        patch: dict[Literal["build", "rebuild"], dict] = {}
+        for file_path in json_files.get(recipe_dir, []):
             patch_type = file_path.stem
-            platform_type = file_path.parent.parent
             assert patch_type in {
                 "build",
                 "rebuild",
             }, f"Invalid patch type {patch_type}"
-            patches[str(file_path.parent)][platform_type][patch_type] = data
+            with open(file_path, "r") as file:
+                patch[patch_type] = json.load(file)
+
+        for file_path in log_files.get(recipe_dir, []):
+            for record in read_patch_log(file_path):
+                patch_type = record["kind"]
+                assert patch_type in {
+                    "build",
+                    "rebuild",
+                }, f"Invalid patch type {patch_type}"
+                patch[patch_type] = record["data"]
 
-    return patches
+        if patch:
+            yield str(recipe_dir), patch
 
 
-def save_patch(model: Build | Rebuild):
+def save_patch(model: Build | Rebuild, patch_format: Optional[PatchFormat] = None):
     """
-    Save the patch to a file
+    Save the patch to a file, by default in the format of the --patch-format option
     """
-    patch_file = f"build_info/{model.platform_name}/{model.recipe_name}/{model.__class__.__name__.lower()}.json"
-    os.makedirs(os.path.dirname(patch_file), exist_ok=True)
+    patch_format = patch_format or global_options.patch_format
+    patch_type = model.__class__.__name__.lower()
+    if patch_format == PatchFormat.JSON:
+        patch_file = (
+            f"build_info/{model.platform_name}/{model.recipe_name}/{patch_type}.json"
+        )
+        os.makedirs(os.path.dirname(patch_file), exist_ok=True)
 
-    with open(patch_file, "w") as file:
-        file.write(model.model_dump_json())
+        with open(patch_file, "w") as file:
+            file.write(model.model_dump_json())
+        return
+
+    # The build and the rebuild of a recipe are appended to the same file
+    patch_file = (
+        f"build_info/{model.platform_name}/{model.recipe_name}.{patch_format.value}"
+    )
+    os.makedirs(os.path.dirname(patch_file), exist_ok=True)
+    record = {
+        "kind": patch_type,
+        "platform": model.platform_name,
+        "recipe": model.recipe_name,
+        "data": model.model_dump(mode="json"),
+    }
+    line = json.dumps(record) + "\n"
+    if patch_format == PatchFormat.JSONL_GZ:
+        # Every append adds a gzip member, which are read back as one stream
+        with gzip.open(patch_file, "at", encoding="utf-8") as file:
+            file.write(line)
+    else:
+        with open(patch_file, "a", encoding="utf-8") as file:
+            file.write(line)
 
 
 def save_v1_patch(model: V1Rebuild):
@@ -62,24 +167,130 @@ def save_v1_patch(model: V1Rebuild):
         file.write(model.model_dump_json())
 
 
-# Load the patch data
-def load_patch(patch_data: dict[Literal["build", "rebuild"], Any]):
-    build = patch_data["build"]
-    build = Build.model_validate(build)
-    build.id = None
+@contextmanager
+def timed(timings: dict[str, float], phase: str) -> Generator[None, None, None]:
+    """Add the time spent in the block to the timings of the phase"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[phase] = timings.get(phase, 0.0) + time.perf_counter() - start
+
+
+def timed_iter(
+    iterable: Iterable[T], timings: dict[str, float], phase: str
+) -> Iterator[T]:
+    """Add the time spent producing the items to the timings of the phase"""
+    iterator = iter(iterable)
+    while True:
+        with timed(timings, phase):
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+        yield item
+
 
+def patch_digest(patch_data: Any) -> str:
+    """Content address of a patch, independent of the formatting of the file"""
+    return compute_hash(json.dumps(patch_data, sort_keys=True, separators=(",", ":")))
+
+
+def _unmerged_patches(
+    session: SqlModelSession, patches: list[Any]
+) -> tuple[list[Any], list[str]]:
+    """
+    Drop the patches that were merged before, or that occur twice,
+    and return the remaining patches with their digests.
+    """
+    digests = [patch_digest(patch_data) for patch_data in patches]
+    merged: set[str] = set()
+    unique_digests = list(set(digests))
+    # Primary key lookups, no scan of the ledger
+    for start in range(0, len(unique_digests), LEDGER_LOOKUP_CHUNK):
+        chunk = unique_digests[start : start + LEDGER_LOOKUP_CHUNK]
+        merged.update(
+            session.exec(
+                select(PatchLedger.digest).where(col(PatchLedger.digest).in_(chunk))
+            ).all()
+        )
+
+    unmerged, unmerged_digests = [], []
+    for patch_data, digest in zip(patches, digests):
+        if digest not in merged:
+            merged.add(digest)
+            unmerged.append(patch_data)
+            unmerged_digests.append(digest)
+    return unmerged, unmerged_digests
+
+
+def _record_merged(session: SqlModelSession, digests: list[str], kind: str):
+    """Add the digests of the merged patches to the ledger"""
+    if digests:
+        session.execute(
+            insert(PatchLedger),
+            [{"digest": digest, "kind": kind} for digest in digests],
+        )
+
+
+def _insert_rows(model: Any) -> dict[str, Any]:
+    """
+    Get the columns to insert for a validated model. Unset values are left out,
+    so the database fills in defaults like the timestamp.
+    """
+    return model.model_dump(exclude={"id", "build_id"}, exclude_none=True)
+
+
+def load_patches(
+    patches: Iterable[dict[Literal["build", "rebuild"], Any]],
+    timings: Optional[dict[str, float]] = None,
+) -> int:
+    """
+    Validate all patches first, and then insert them in a single transaction.
+    Patches that were merged before are skipped.
+    Returns the number of builds inserted, the time per phase is added to `timings`.
+    """
+    timings = timings if timings is not None else {}
     with get_session() as session:
-        session.add(build)
+        with timed(timings, "ledger"):
+            patches, digests = _unmerged_patches(session, list(patches))
+
+        with timed(timings, "validate"):
+            builds = []
+            rebuilds: list[Optional[dict[str, Any]]] = []
+            for patch_data in patches:
+                builds.append(_insert_rows(Build.model_validate(patch_data["build"])))
+                rebuild = patch_data.get("rebuild")
+                rebuilds.append(
+                    _insert_rows(Rebuild.model_validate(rebuild)) if rebuild else None
+                )
+
+        if not builds:
+            return 0
+
+        with timed(timings, "insert"):
+            build_ids = session.scalars(
+                insert(Build).returning(Build.id, sort_by_parameter_order=True),
+                builds,
+            ).all()
+            rebuild_rows = [
+                {**rebuild, "build_id": build_id}
+                for build_id, rebuild in zip(build_ids, rebuilds)
+                if rebuild is not None
+            ]
+            if rebuild_rows:
+                session.execute(insert(Rebuild), rebuild_rows)
+            update_latest_builds(session, build_ids)
+            _record_merged(session, digests, "build")
+        with timed(timings, "commit"):
+            session.commit()
 
-        if "rebuild" in patch_data:
-            rebuild = patch_data["rebuild"]
-            rebuild = Rebuild.model_validate(rebuild)
-            rebuild.id = None
-            rebuild.build_id = None
-            rebuild.build = build
-            session.add(rebuild)
+    return len(builds)
 
-        session.commit()
+
+# Load the patch data
+def load_patch(patch_data: dict[Literal["build", "rebuild"], Any]):
+    load_patches([patch_data])
 
 
 def find_v1_patches(folder_path: str = "build_info/v1") -> list[Path]:
@@ -92,23 +303,38 @@ def find_v1_patches(folder_path: str = "build_info/v1") -> list[Path]:
     return [Path(file) for file in json_files]
 
 
-def load_v1_patches(folder_path: str = "build_info/v1") -> int:
+def load_v1_patches(
+    folder_path: str = "build_info/v1", timings: Optional[dict[str, float]] = None
+) -> int:
     """
-    Load all V1 rebuild patches into the database.
-    Returns the number of patches loaded.
+    Load all V1 rebuild patches into the database, in a single transaction.
+    Patches that were merged before are skipped.
+    Returns the number of patches loaded, the time per phase is added to `timings`.
     """
-    patch_files = find_v1_patches(folder_path)
-    count = 0
+    timings = timings if timings is not None else {}
+    with timed(timings, "read"):
+        patch_files = find_v1_patches(folder_path)
+        patches = []
+        for file_path in patch_files:
+            with open(file_path, "r") as file:
+                patches.append(json.load(file))
+
+    with get_session() as session:
+        with timed(timings, "ledger"):
+            patches, digests = _unmerged_patches(session, patches)
+
+        with timed(timings, "validate"):
+            v1_rebuilds = [
+                _insert_rows(V1Rebuild.model_validate(data)) for data in patches
+            ]
 
-    for file_path in patch_files:
-        with open(file_path, "r") as file:
-            data = json.load(file)
-            v1_rebuild = V1Rebuild.model_validate(data)
-            v1_rebuild.id = None  # Reset ID for new insert
+        if not v1_rebuilds:
+            return 0
 
-            with get_session() as session:
-                session.add(v1_rebuild)
-                session.commit()
-                count += 1
+        with timed(timings, "insert"):
+            session.execute(insert(V1Rebuild), v1_rebuilds)
+            _record_merged(session, digests, "v1")
+        with timed(timings, "commit"):
+            session.commit()
 
-    return count
+    return len(v1_rebuilds)
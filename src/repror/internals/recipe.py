@@ -1,30 +1,98 @@
 import hashlib
+import logging
+import multiprocessing
+import os
+import re
+import shutil
+import sqlite3
+import tempfile
+import threading
 from pathlib import Path
+from typing import NamedTuple, Optional
 
 import yaml
 from repror.internals import git
+from repror.internals.cache import cache_db, cache_dir, stat_signature
+
+logger = logging.getLogger(__name__)
+
+# The LibYAML loader is an order of magnitude faster, but it is not always compiled in
+SafeLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+# Commit hashes never change, other revs like branches are fetched again once per run
+FULL_COMMIT_HASH = re.compile(r"^[0-9a-f]{40}$")
+
+# Mirrors can be shared by threads, but only one of them should clone or fetch it
+_mirror_locks: dict[str, threading.Lock] = {}
+_mirror_locks_lock = threading.Lock()
+# Mirrors fetched during this run
+_fetched_mirrors: set[str] = set()
+
+
+def mirror_dir(url: str) -> Path:
+    """Location of the bare mirror of the repository in the persistent cache."""
+    name = url.rstrip("/").removesuffix(".git").rsplit("/", 1)[-1]
+    url_hash = hashlib.sha256(url.encode()).hexdigest()[:16]
+    return cache_dir() / "git" / f"{name}-{url_hash}.git"
+
+
+def update_mirror(url: str, rev: str) -> Path:
+    """
+    Make sure the bare mirror of the repository contains `rev`,
+    cloning it on first use. Branches are fetched once per run,
+    commits only when they are missing from the mirror.
+    """
+    with _mirror_locks_lock:
+        lock = _mirror_locks.setdefault(url, threading.Lock())
+
+    mirror = mirror_dir(url)
+    with lock:
+        if not mirror.exists():
+            logger.debug(f"Cloning mirror of {url} into {mirror}")
+            mirror.parent.mkdir(parents=True, exist_ok=True)
+            # Clone next to the final location, so an interrupted clone is not used.
+            # The lock only covers this process, other processes clone into their own folder
+            partial_mirror = Path(
+                tempfile.mkdtemp(prefix=f"{mirror.name}.partial-", dir=mirror.parent)
+            )
+            try:
+                git.clone_bare(url, partial_mirror)
+                partial_mirror.rename(mirror)
+            except OSError:
+                # Another process renamed its clone first, which is just as good
+                if not mirror.exists():
+                    raise
+            finally:
+                shutil.rmtree(partial_mirror, ignore_errors=True)
+            _fetched_mirrors.add(url)
+        elif (
+            url not in _fetched_mirrors and not FULL_COMMIT_HASH.match(rev)
+        ) or not git.check_rev_is_present(mirror, rev):
+            logger.debug(f"Fetching {url} into {mirror}")
+            git.fetch_all(mirror)
+            _fetched_mirrors.add(url)
+    return mirror
 
 
 def clone_remote_recipe(
     url: str, rev: str, clone_dir: Path, path_to_recipe_folder: Path
 ) -> Path:
+    """
+    Export the recipe folder of the repository at `rev` into `clone_dir`.
+    The repository itself is kept as a bare mirror in the persistent cache,
+    so all recipes of a repository are served by a single clone or fetch.
+    """
+    # Recipes of the same repository can be at different revs
+    safe_rev = re.sub(r"[^\w.-]", "-", rev)
     repo_dir = clone_dir.joinpath(
-        url.replace(".git", "").replace("/", "").replace("https:", "")
+        url.replace(".git", "").replace("/", "").replace("https:", "") + f"@{safe_rev}"
     )
 
-    # Clone without big files and no checkout,
-    # so that it is a lot faster
-    if not repo_dir.exists():
-        git.clone_no_checkout(url, repo_dir)
-
-    # Check if we have the sparsely checked out folder
     # Even if we have the repo, we might not have the folder
     if not repo_dir.joinpath(path_to_recipe_folder).exists():
-        git.sparse_checkout_init(repo_dir)
-        git.sparse_checkout_set(repo_dir, path_to_recipe_folder)
+        mirror = update_mirror(url, rev)
+        git.archive_to_dir(mirror, rev, path_to_recipe_folder, repo_dir)
 
-    # Checkout the commit
-    git.checkout_branch_or_commit(repo_dir, rev)
     return repo_dir
 
 
@@ -43,10 +111,14 @@ def load_remote_recipe_config(
     return config, raw_config
 
 
+def parse_recipe_config(raw_config: str) -> dict:
+    return yaml.load(raw_config, Loader=SafeLoader)
+
+
 def load_recipe_config(recipe_path: str | Path) -> dict:
     recipe_path = Path(recipe_path) if isinstance(recipe_path, str) else recipe_path
     raw_config = recipe_path.read_text(encoding="utf8")
-    return yaml.safe_load(raw_config)
+    return parse_recipe_config(raw_config)
 
 
 def get_content_hash(content: str) -> str:
@@ -57,15 +129,173 @@ def list_recipe_files(recipe_path: Path) -> list[Path]:
     return list(recipe_path.rglob("*"))
 
 
-def recipe_files_hash(recipe_folder: Path) -> str:
+_RECIPE_HASH_SCHEMA = """
+CREATE TABLE IF NOT EXISTS recipe_hash (
+    folder TEXT PRIMARY KEY,
+    signature TEXT NOT NULL,
+    digest TEXT NOT NULL
+);
+"""
+
+
+def _cached_recipe_hash(folder: str, signature: str) -> Optional[str]:
+    try:
+        with cache_db(_RECIPE_HASH_SCHEMA) as db:
+            row = db.execute(
+                "SELECT digest FROM recipe_hash WHERE folder = ? AND signature = ?",
+                (folder, signature),
+            ).fetchone()
+            return row[0] if row else None
+    except (sqlite3.Error, OSError) as e:
+        logger.debug(f"Could not read recipe hash cache: {e}")
+        return None
+
+
+def _store_recipe_hash(folder: str, signature: str, digest: str):
+    try:
+        with cache_db(_RECIPE_HASH_SCHEMA) as db:
+            db.execute(
+                "INSERT OR REPLACE INTO recipe_hash (folder, signature, digest) VALUES (?, ?, ?)",
+                (folder, signature, digest),
+            )
+    except (sqlite3.Error, OSError) as e:
+        logger.debug(f"Could not write recipe hash cache: {e}")
+
+
+def _recipe_files_hash(recipe_folder: Path, folder_hashes: dict[Path, str]) -> str:
+    # The digest of nested folders is part of the digest of the parent folder,
+    # remember them so that they are computed only once
+    if recipe_folder in folder_hashes:
+        return folder_hashes[recipe_folder]
+
     total_hash = hashlib.sha256()
     for file in list_recipe_files(recipe_folder):
         if file.is_file():
             total_hash.update(file.read_bytes())
         else:
-            total_hash.update(recipe_files_hash(file).encode())
+            total_hash.update(_recipe_files_hash(file, folder_hashes).encode())
+
+    folder_hashes[recipe_folder] = total_hash.hexdigest()
+    return folder_hashes[recipe_folder]
+
+
+def recipe_files_hash(recipe_folder: Path) -> str:
+    """
+    Hash the content of all files in the recipe folder.
+    The digest is cached on disk, keyed on the stat signature of the folder,
+    so the files are only read again when something in the folder changed.
+    """
+    files = list_recipe_files(recipe_folder)
+    folder = str(recipe_folder.resolve())
+    signature = stat_signature(recipe_folder, files)
+
+    digest = _cached_recipe_hash(folder, signature)
+    if digest is None:
+        digest = _recipe_files_hash(recipe_folder, {})
+        _store_recipe_hash(folder, signature, digest)
+
+    return digest
+
+
+_RECIPE_MANIFEST_SCHEMA = """
+CREATE TABLE IF NOT EXISTS recipe_manifest (
+    path TEXT PRIMARY KEY,
+    signature TEXT NOT NULL,
+    name TEXT NOT NULL,
+    raw_config TEXT NOT NULL,
+    content_hash TEXT NOT NULL
+);
+"""
+
+
+# Below this number of changed recipes, starting the processes costs more than it saves
+PROCESS_POOL_THRESHOLD = 32
+
+
+class RecipeManifest(NamedTuple):
+    name: str
+    raw_config: str
+    content_hash: str
+
+
+def _cached_recipe_manifest(path: str, signature: str) -> Optional[RecipeManifest]:
+    try:
+        with cache_db(_RECIPE_MANIFEST_SCHEMA) as db:
+            row = db.execute(
+                "SELECT name, raw_config, content_hash FROM recipe_manifest WHERE path = ? AND signature = ?",
+                (path, signature),
+            ).fetchone()
+            return RecipeManifest(*row) if row else None
+    except (sqlite3.Error, OSError) as e:
+        logger.debug(f"Could not read recipe manifest cache: {e}")
+        return None
+
+
+def _store_recipe_manifests(rows: list[tuple[str, str, RecipeManifest]]):
+    try:
+        with cache_db(_RECIPE_MANIFEST_SCHEMA) as db:
+            db.executemany(
+                "INSERT OR REPLACE INTO recipe_manifest (path, signature, name, raw_config, content_hash) VALUES (?, ?, ?, ?, ?)",
+                [(path, signature, *manifest) for path, signature, manifest in rows],
+            )
+    except (sqlite3.Error, OSError) as e:
+        logger.debug(f"Could not write recipe manifest cache: {e}")
+
+
+def _recipe_manifest_key(recipe_path: Path) -> tuple[str, str]:
+    recipe_folder = recipe_path.parent
+    files = list_recipe_files(recipe_folder)
+    return str(recipe_path.resolve()), stat_signature(recipe_folder, files)
+
+
+def _compute_recipe_manifest(recipe_path: Path) -> RecipeManifest:
+    # Runs in the worker processes, so it should not touch the cache database
+    raw_config = recipe_path.read_text(encoding="utf8")
+    return RecipeManifest(
+        name=get_recipe_name(parse_recipe_config(raw_config)),
+        raw_config=raw_config,
+        content_hash=_recipe_files_hash(recipe_path.parent, {}),
+    )
+
+
+def load_recipe_manifests(
+    recipe_paths: list[Path], processes: Optional[int] = None
+) -> list[RecipeManifest]:
+    """
+    Get the name, raw config and content hash of local recipes, in the given order.
+    The manifests are cached on disk, keyed on the stat signature of the recipe folder,
+    so a recipe is only read and parsed again when something in its folder changed.
+    When many recipes changed, they are parsed and hashed by a pool of processes.
+    """
+    keys = [_recipe_manifest_key(recipe_path) for recipe_path in recipe_paths]
+    manifests = [_cached_recipe_manifest(*key) for key in keys]
+    missing = [index for index, manifest in enumerate(manifests) if manifest is None]
+    if not missing:
+        return manifests
+
+    missing_paths = [recipe_paths[index] for index in missing]
+    if len(missing_paths) >= PROCESS_POOL_THRESHOLD:
+        processes = processes or os.cpu_count() or 1
+        # A few chunks per process, to balance the work without a round trip per recipe
+        chunksize = max(1, len(missing_paths) // (processes * 4))
+        # Spawned rather than forked: the process already runs threads that may hold
+        # locks (thread pools, the sqlite connections of the cache) at fork time
+        with multiprocessing.get_context("spawn").Pool(processes) as pool:
+            computed = pool.map(_compute_recipe_manifest, missing_paths, chunksize)
+    else:
+        computed = [_compute_recipe_manifest(path) for path in missing_paths]
+
+    for index, manifest in zip(missing, computed):
+        manifests[index] = manifest
+    _store_recipe_manifests(
+        [(*keys[index], manifest) for index, manifest in zip(missing, computed)]
+    )
+    return manifests
+
 
-    return total_hash.hexdigest()
+def load_recipe_manifest(recipe_path: Path) -> RecipeManifest:
+    """Get the (cached) name, raw config and content hash of a local recipe."""
+    return load_recipe_manifests([recipe_path])[0]
 
 
 def get_recipe_name(config: dict) -> str:
@@ -0,0 +1,416 @@
+"""
+Persistent cache of conda repodata.
+
+The repodata of a conda-forge subdir is hundreds of megabytes of JSON,
+but only a few fields of the packages of interest are used.
+The response is parsed as a stream and the used fields of every package record
+are stored in a small sqlite database with an index on the package name,
+together with the ETag and Last-Modified headers of the response.
+The next fetch is a conditional request that usually answers 304 Not Modified,
+and only the records of the requested packages are loaded in memory.
+"""
+
+import codecs
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import IO, Any, Iterable, Iterator, NamedTuple, Optional, Sequence
+from urllib.error import HTTPError, URLError
+from urllib.request import Request, urlopen
+
+from repror.internals.cache import cache_db, cache_dir
+from repror.internals.version import version_order
+
+logger = logging.getLogger(__name__)
+
+# The package records of the repodata
+PACKAGE_KEYS = ["packages", "packages.conda"]
+# The fields of a package record that are kept in the cache
+PACKAGE_FIELDS = [
+    "name",
+    "version",
+    "build",
+    "build_number",
+    "sha256",
+    "size",
+    "timestamp",
+]
+
+# Repodata is large, give the server some time
+REPODATA_TIMEOUT = 120
+# Size of the chunks read from the response while parsing it
+STREAM_CHUNK_SIZE = 1024 * 1024
+# Number of records inserted in the cache at once
+INSERT_BATCH_SIZE = 5000
+# Number of names looked up with a single query, sqlite limits the number of parameters
+NAME_LOOKUP_CHUNK = 500
+
+_REPODATA_SCHEMA = """
+CREATE TABLE IF NOT EXISTS repodata (
+    url TEXT PRIMARY KEY,
+    etag TEXT,
+    last_modified TEXT,
+    expires REAL NOT NULL,
+    path TEXT NOT NULL
+);
+"""
+
+# Bump the version when the schema of the records database changes
+RECORDS_VERSION = 2
+_RECORDS_SCHEMA = """
+CREATE TABLE record (
+    key TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    name TEXT,
+    timestamp INTEGER,
+    data TEXT NOT NULL
+);
+"""
+
+MAX_AGE = re.compile(r"max-age=(\d+)")
+WHITESPACE = re.compile(r"[ \t\n\r]*")
+
+
+class PackageRecord(NamedTuple):
+    # `packages` or `packages.conda`
+    key: str
+    filename: str
+    # The fields of the record in `PACKAGE_FIELDS`
+    info: dict
+
+
+@dataclass
+class CachedRepodata:
+    etag: Optional[str]
+    last_modified: Optional[str]
+    # Unix time until which the cached data can be used without asking the server
+    expires: float
+    path: Path
+
+
+class JsonStream:
+    """
+    Incremental reader of a JSON document, that only needs a small part of it in memory.
+    Values are decoded one at a time with the C decoder of the json module.
+    """
+
+    def __init__(self, file: IO[bytes], chunk_size: int = STREAM_CHUNK_SIZE):
+        self._file = file
+        self._chunk_size = chunk_size
+        self._decoder = codecs.getincrementaldecoder("utf-8")()
+        self._json = json.JSONDecoder()
+        self._buffer = ""
+        self._pos = 0
+        self._eof = False
+
+    def _fill(self) -> bool:
+        """Read the next chunk, return False at the end of the stream."""
+        if self._eof:
+            return False
+        chunk = self._file.read(self._chunk_size)
+        self._eof = not chunk
+        # Drop what was consumed, so the buffer stays around the chunk size
+        self._buffer = self._buffer[self._pos :] + self._decoder.decode(
+            chunk, final=self._eof
+        )
+        self._pos = 0
+        return True
+
+    def peek(self) -> str:
+        """The next character that is not whitespace, empty at the end of the stream."""
+        while True:
+            self._pos = WHITESPACE.match(self._buffer, self._pos).end()  # type: ignore[union-attr]
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, char: str):
+        found = self.peek()
+        if found != char:
+            raise ValueError(f"Expected {char!r} in JSON stream, found {found!r}")
+        self._pos += 1
+
+    def value(self) -> Any:
+        """Decode the next complete value."""
+        self.peek()
+        while True:
+            try:
+                value, end = self._json.raw_decode(self._buffer, self._pos)
+            except json.JSONDecodeError:
+                # The value continues in the next chunk
+                if self._fill():
+                    continue
+                raise
+            # A number at the end of the buffer could continue in the next chunk
+            if end == len(self._buffer) and self._fill():
+                continue
+            self._pos = end
+            return value
+
+    def keys(self) -> Iterator[str]:
+        """
+        Iterate over the keys of the next object.
+        The value of every key must be consumed before asking for the next key.
+        """
+        self.expect("{")
+        if self.peek() == "}":
+            self._pos += 1
+            return
+        while True:
+            key = self.value()
+            self.expect(":")
+            yield key
+            separator = self.peek()
+            self._pos += 1
+            if separator == "}":
+                return
+            if separator != ",":
+                raise ValueError(
+                    f"Expected ',' or '}}' in JSON stream, found {separator!r}"
+                )
+
+
+def iter_package_records(file: IO[bytes]) -> Iterator[tuple[str, str, dict]]:
+    """
+    Stream the (key, filename, record) of all packages in a repodata.json,
+    keeping only the used fields of every record.
+    """
+    stream = JsonStream(file)
+    for key in stream.keys():
+        if key not in PACKAGE_KEYS:
+            # Like info or removed, not used
+            stream.value()
+            continue
+        for filename in stream.keys():
+            record = stream.value()
+            yield (
+                key,
+                filename,
+                {field: record[field] for field in PACKAGE_FIELDS if field in record},
+            )
+
+
+def _repodata_path(url: str) -> Path:
+    url_hash = hashlib.sha256(url.encode()).hexdigest()[:16]
+    return cache_dir() / "repodata" / f"{url_hash}-v{RECORDS_VERSION}.db"
+
+
+def _cached_repodata(url: str) -> Optional[CachedRepodata]:
+    try:
+        with cache_db(_REPODATA_SCHEMA) as db:
+            row = db.execute(
+                "SELECT etag, last_modified, expires, path FROM repodata WHERE url = ?",
+                (url,),
+            ).fetchone()
+    except (sqlite3.Error, OSError) as e:
+        logger.debug(f"Could not read repodata cache: {e}")
+        return None
+    if not row:
+        return None
+    etag, last_modified, expires, path = row
+    cached = CachedRepodata(etag, last_modified, expires, Path(path))
+    # Databases with an older schema are fetched again
+    if cached.path != _repodata_path(url) or not cached.path.exists():
+        return None
+    return cached
+
+
+def _store_repodata(url: str, cached: CachedRepodata):
+    try:
+        with cache_db(_REPODATA_SCHEMA) as db:
+            db.execute(
+                "INSERT OR REPLACE INTO repodata (url, etag, last_modified, expires, path) VALUES (?, ?, ?, ?, ?)",
+                (
+                    url,
+                    cached.etag,
+                    cached.last_modified,
+                    cached.expires,
+                    str(cached.path),
+                ),
+            )
+    except (sqlite3.Error, OSError) as e:
+        logger.debug(f"Could not write repodata cache: {e}")
+
+
+def _write_records(path: Path, records: Iterable[tuple[str, str, dict]]):
+    """Store the package records in a new database at `path`."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # Write next to the final location, so readers never see a partial database
+    partial_path = path.with_suffix(f".{os.getpid()}.partial")
+    partial_path.unlink(missing_ok=True)
+    connection = sqlite3.connect(partial_path)
+    try:
+        with connection:
+            connection.executescript(_RECORDS_SCHEMA)
+            batch = []
+            for key, filename, record in records:
+                batch.append(
+                    (
+                        key,
+                        filename,
+                        record.get("name"),
+                        record.get("timestamp"),
+                        json.dumps(record),
+                    )
+                )
+                if len(batch) >= INSERT_BATCH_SIZE:
+                    connection.executemany(
+                        "INSERT INTO record VALUES (?, ?, ?, ?, ?)", batch
+                    )
+                    batch.clear()
+            connection.executemany("INSERT INTO record VALUES (?, ?, ?, ?, ?)", batch)
+            # Creating the indexes after the inserts is faster than maintaining them
+            connection.execute("CREATE INDEX ix_record_name ON record (name)")
+            connection.execute(
+                "CREATE INDEX ix_record_timestamp ON record (key, timestamp)"
+            )
+    except BaseException:
+        connection.close()
+        partial_path.unlink(missing_ok=True)
+        raise
+    connection.close()
+    os.replace(partial_path, path)
+
+
+class RepodataIndex:
+    """
+    The package records of a repodata, in the cache database indexed by
+    package name and timestamp, so lookups do not need to scan all packages.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        # The database is only read, so the connection can be shared by threads
+        self._connection = sqlite3.connect(
+            f"file:{path}?mode=ro", uri=True, check_same_thread=False
+        )
+
+    def _select(self, where: str, params: Sequence) -> list[PackageRecord]:
+        return [
+            PackageRecord(key, filename, json.loads(data))
+            for key, filename, data in self._connection.execute(
+                f"SELECT key, filename, data FROM record WHERE {where}", params
+            )
+        ]
+
+    def records(self, name: str) -> list[PackageRecord]:
+        """All records of the package with the given name."""
+        return self._select("name = ?", (name,))
+
+    def latest(self, name: str) -> Optional[PackageRecord]:
+        """
+        The record with the highest version and build number of a package,
+        preferring `.conda` packages over `.tar.bz2` ones.
+        """
+        latest: Optional[PackageRecord] = None
+        latest_key = None
+        for record in self.records(name):
+            key = (
+                record.key == "packages.conda",
+                version_order(str(record.info.get("version", "0"))),
+                record.info.get("build_number", 0),
+            )
+            if latest_key is None or key > latest_key:
+                latest, latest_key = record, key
+        return latest
+
+    def recent(self, since_ms: int, key: str = "packages.conda") -> list[PackageRecord]:
+        """The records of `key` with a timestamp since `since_ms`, in milliseconds."""
+        return self._select("key = ? AND timestamp >= ?", (key, since_ms))
+
+    def names(self, key: str = "packages.conda") -> set[str]:
+        """The names of all packages in `key`."""
+        return {
+            name
+            for (name,) in self._connection.execute(
+                "SELECT DISTINCT name FROM record WHERE key = ?", (key,)
+            )
+        }
+
+    def count(self, key: str = "packages.conda") -> int:
+        """The number of records in `key`."""
+        return self._connection.execute(
+            "SELECT COUNT(*) FROM record WHERE key = ?", (key,)
+        ).fetchone()[0]
+
+    def to_dict(self, names: Optional[Iterable[str]] = None) -> dict:
+        """The records of the given names, or of all packages, in the repodata.json layout."""
+        repodata: dict[str, dict[str, dict]] = {key: {} for key in PACKAGE_KEYS}
+        if names is None:
+            records = self._select("1", ())
+        else:
+            names = sorted(set(names))
+            records = []
+            for start in range(0, len(names), NAME_LOOKUP_CHUNK):
+                chunk = names[start : start + NAME_LOOKUP_CHUNK]
+                placeholders = ", ".join("?" for _ in chunk)
+                records.extend(self._select(f"name IN ({placeholders})", chunk))
+        for record in records:
+            repodata[record.key][record.filename] = record.info
+        return repodata
+
+    def close(self):
+        self._connection.close()
+
+
+def _expires(cache_control: Optional[str]) -> float:
+    """Until when a response can be used without revalidating it."""
+    match = MAX_AGE.search(cache_control or "")
+    return time.time() + int(match.group(1)) if match else 0.0
+
+
+def fetch_repodata(url: str) -> RepodataIndex:
+    """
+    Fetch the repodata at `url` into an index of its package records,
+    with only the fields in `PACKAGE_FIELDS`.
+
+    The cached copy is used directly while it is fresh according to the
+    Cache-Control header of the server, and revalidated with a conditional
+    request otherwise.
+    """
+    cached = _cached_repodata(url)
+    if cached and cached.expires > time.time():
+        logger.debug(f"Using fresh cached repodata of {url}")
+        return RepodataIndex(cached.path)
+
+    headers = {"User-Agent": "repror/1.0"}
+    if cached:
+        if cached.etag:
+            headers["If-None-Match"] = cached.etag
+        if cached.last_modified:
+            headers["If-Modified-Since"] = cached.last_modified
+
+    path = _repodata_path(url)
+    try:
+        with urlopen(
+            Request(url, headers=headers), timeout=REPODATA_TIMEOUT
+        ) as response:
+            _write_records(path, iter_package_records(response))
+            response_headers = response.headers
+    except HTTPError as e:
+        if e.code != 304 or cached is None:
+            raise RuntimeError(f"Failed to fetch repodata: {e}") from e
+        logger.debug(f"Cached repodata of {url} is not modified")
+        cached.expires = _expires(e.headers.get("Cache-Control"))
+        _store_repodata(url, cached)
+        return RepodataIndex(cached.path)
+    except URLError as e:
+        raise RuntimeError(f"Failed to fetch repodata: {e}") from e
+
+    _store_repodata(
+        url,
+        CachedRepodata(
+            etag=response_headers.get("ETag"),
+            last_modified=response_headers.get("Last-Modified"),
+            expires=_expires(response_headers.get("Cache-Control")),
+            path=path,
+        ),
+    )
+    return RepodataIndex(path)
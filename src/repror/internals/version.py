@@ -0,0 +1,125 @@
+"""
+Ordering of conda package versions, following the `VersionOrder` of conda.
+
+A version is split in an optional epoch (`1!`), the version itself and an optional
+local version (`+local`). Underscores, and dashes when there are no underscores,
+are treated like dots. Every dot separated component is split in runs of digits,
+which compare as numbers, and runs of other characters, which compare as strings.
+Strings sort before numbers, so `1.1a1 < 1.1`, `dev` sorts before any other string
+and `post` after any number. Missing parts compare as zero, so `1.0 == 1`.
+"""
+
+from functools import lru_cache, total_ordering
+from itertools import zip_longest
+import re
+from typing import Union
+
+VersionPart = Union[int, float, str]
+VersionComponents = list[list[VersionPart]]
+
+VERSION_PART = re.compile(r"[0-9]+|[*]+|[^0-9*]+")
+
+# Sorts after every number
+POST = float("inf")
+# Sorts before every other string, which are lowercase
+DEV = "DEV"
+
+
+def _parse_part(part: str) -> VersionPart:
+    if part.isdigit():
+        return int(part)
+    if part == "post":
+        return POST
+    if part == "dev":
+        return DEV
+    return part
+
+
+def _parse_components(version: str) -> VersionComponents:
+    if "-" in version and "_" not in version:
+        version = version.replace("-", "_")
+    if version.endswith("_"):
+        # Openssl like versions, `1.0.1_` sorts after `1.0.1`
+        components = version[:-1].replace("_", ".").split(".")
+        components[-1] += "_"
+    else:
+        components = version.replace("_", ".").split(".")
+
+    parsed = []
+    for component in components:
+        # Invalid for conda, but a version that can not be parsed should not stop us
+        parts = [_parse_part(part) for part in VERSION_PART.findall(component)] or [0]
+        # A component that starts with a string sorts like it starts with 0
+        if not isinstance(parts[0], int):
+            parts.insert(0, 0)
+        parsed.append(parts)
+    return parsed
+
+
+def _canonical(components: VersionComponents) -> tuple:
+    """Drop the trailing zeros, which compare equal to missing parts."""
+    canonical = []
+    for component in components:
+        parts = list(component)
+        while parts and parts[-1] == 0:
+            parts.pop()
+        canonical.append(tuple(parts))
+    while canonical and not canonical[-1]:
+        canonical.pop()
+    return tuple(canonical)
+
+
+def _less_than(left: VersionComponents, right: VersionComponents) -> bool:
+    for left_component, right_component in zip_longest(left, right, fillvalue=[]):
+        for left_part, right_part in zip_longest(
+            left_component, right_component, fillvalue=0
+        ):
+            if left_part == right_part:
+                continue
+            if isinstance(left_part, str) and not isinstance(right_part, str):
+                return True
+            if isinstance(right_part, str) and not isinstance(left_part, str):
+                return False
+            return left_part < right_part  # type: ignore[operator]
+    return False
+
+
+@total_ordering
+class VersionOrder:
+    """A conda version that can be compared with other versions."""
+
+    __slots__ = ("version", "components", "local", "_key")
+
+    def __init__(self, version: str):
+        self.version = version
+        normalized = version.strip().lower()
+        epoch, _, normalized = normalized.rpartition("!")
+        normalized, _, local = normalized.partition("+")
+        # The epoch is the first component, so it is compared first
+        self.components = [[int(epoch) if epoch.isdigit() else 0]]
+        self.components += _parse_components(normalized)
+        self.local = _parse_components(local) if local else []
+        # Equal versions have the same key
+        self._key = (_canonical(self.components), _canonical(self.local))
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, VersionOrder):
+            return NotImplemented
+        return self._key == other._key
+
+    def __hash__(self) -> int:
+        return hash(self._key)
+
+    def __lt__(self, other: "VersionOrder") -> bool:
+        if self._key[0] != other._key[0]:
+            return _less_than(self.components, other.components)
+        return _less_than(self.local, other.local)
+
+    def __repr__(self) -> str:
+        return f"VersionOrder({self.version!r})"
+
+
+@lru_cache(maxsize=65536)
+def version_order(version: str) -> VersionOrder:
+    """The parsed version, cached because the same versions are compared many times."""
+    return VersionOrder(version)
@@ -1,15 +1,31 @@
 from dataclasses import dataclass
+import os
 from pathlib import Path
 import pytest
 from sqlalchemy.orm import sessionmaker
 from repror.cli.utils import platform_name, platform_version
-from repror.internals.db import setup_local_db, Build, Rebuild, BuildState, RemoteRecipe
+from repror.internals.db import (
+    setup_local_db,
+    update_latest_builds,
+    Build,
+    Rebuild,
+    BuildState,
+    RemoteRecipe,
+)
 from sqlmodel import Session
 from datetime import datetime
 from unittest.mock import patch
 from repror.internals.recipe import recipe_files_hash
 
 
+@pytest.fixture(scope="session", autouse=True)
+def cache_dir(tmp_path_factory):
+    """Keep the persistent caches out of the home directory"""
+    directory = tmp_path_factory.mktemp("cache")
+    with patch.dict(os.environ, {"REPRO_CACHE_DIR": str(directory)}):
+        yield directory
+
+
 @pytest.fixture
 def setup_recipe_directory(tmp_path: Path):
     # Create directories
@@ -55,6 +71,8 @@ def seed_db(in_memory_session):
     with in_memory_session() as session:
         seed_build_rebuild(session)
         seed_recipes(session)
+        session.flush()
+        update_latest_builds(session)
         session.commit()
 
 
@@ -1,6 +1,14 @@
-from repror.cli.utils import platform_name
+from datetime import timedelta
+
+from repror.cli.utils import platform_name, platform_version
 from repror.internals.db import (
+    Build,
+    BuildState,
+    Rebuild,
+    V1Rebuild,
+    get_successful_builds_and_rebuilds_series,
     get_total_successful_builds_and_rebuilds,
+    get_v1_rebuild_stats_series,
 )
 
 
@@ -19,3 +27,95 @@ def test_aggregation(db_access):
     assert result.builds == 4
     assert result.rebuilds == 4
     assert result.total_builds == 5
+
+
+def test_successful_builds_and_rebuilds_series(db_access):
+    day = timedelta(days=1)
+    # A recipe that was built successfully and rebuilt, and then replaced by a failed build
+    first_build = Build(
+        recipe_name="replaced",
+        state=BuildState.SUCCESS,
+        build_tool_hash=db_access.build_tool_hash,
+        recipe_hash="replaced1",
+        platform_name=platform_name(),
+        platform_version=platform_version(),
+        timestamp=db_access.build_time_1 + day,
+    )
+    db_access.session.add(first_build)
+    db_access.session.flush()
+    db_access.session.add(
+        Rebuild(
+            build_id=first_build.id,
+            state=BuildState.SUCCESS,
+            timestamp=db_access.build_time_1 + day,
+        )
+    )
+    db_access.session.add(
+        Build(
+            recipe_name="replaced",
+            state=BuildState.FAIL,
+            build_tool_hash=db_access.build_tool_hash,
+            recipe_hash="replaced2",
+            platform_name=platform_name(),
+            platform_version=platform_version(),
+            timestamp=db_access.build_time_1 + 3 * day,
+        )
+    )
+    # Only flushed, so query once: closing the session rolls back the connection
+    db_access.session.flush()
+
+    timestamps = [
+        db_access.build_time_1 - day,
+        db_access.build_time_1,
+        db_access.build_time_1 + day,
+        db_access.build_time_1 + 2 * day,
+        db_access.build_time_1 + 3 * day,
+        db_access.build_time_2,
+    ]
+    series = get_successful_builds_and_rebuilds_series(timestamps)
+
+    assert [
+        (count.builds, count.rebuilds, count.total_builds)
+        for count in series[platform_name()]
+    ] == [
+        (0, 0, 0),
+        # boltons
+        (1, 1, 1),
+        (2, 2, 2),
+        (2, 2, 2),
+        # The failed build replaces the successful one
+        (1, 1, 2),
+        # Recipe2 to Recipe4 and the failed Recipe4Fail
+        (4, 4, 6),
+    ]
+
+
+def test_v1_rebuild_stats_series(db_access):
+    for day, state, rebuild_hash in [
+        (1, BuildState.SUCCESS, "same"),
+        (1, BuildState.FAIL, None),
+        (3, BuildState.SUCCESS, "other"),
+    ]:
+        db_access.session.add(
+            V1Rebuild(
+                package_name="pkg",
+                version="1.0",
+                original_url="url",
+                original_hash="same",
+                rebuild_hash=rebuild_hash,
+                state=state,
+                platform_name="linux",
+                platform_version="1",
+                build_tool_hash="rattler-build",
+                timestamp=db_access.build_time_1 + timedelta(days=day),
+            )
+        )
+    # Only flushed, so query once: closing the session rolls back the connection
+    db_access.session.flush()
+
+    timestamps = [db_access.build_time_1 + timedelta(days=day) for day in range(5)]
+    series = get_v1_rebuild_stats_series(timestamps)
+
+    assert [stats.total for stats in series] == [0, 2, 2, 3, 3]
+    assert [stats.successful for stats in series] == [0, 1, 1, 2, 2]
+    assert [stats.reproducible for stats in series] == [0, 1, 1, 1, 1]
@@ -1,8 +1,15 @@
+import threading
+import time
+
 import pytest
 from typer.testing import CliRunner
 from unittest.mock import Mock, patch
 from repror.repror import app
+from repror.cli.build_recipe import build_and_rebuild_recipes, build_recipes
+from repror.internals.build import BuildInfo, BuildResult, RebuildResult
+from repror.internals.db import Build, BuildState, Rebuild, Recipe
 from pathlib import Path
+from sqlmodel import select
 
 runner = CliRunner()
 
@@ -113,3 +120,171 @@ def test_rebuild_build_boltons(
         catch_exceptions=False,
     )
     assert "Found latest rebuild" in result.stdout
+
+
+@patch("repror.cli.build_recipe.rattler_build_hash", return_value="parallel-hash")
+@patch("repror.cli.build_recipe.build_recipe")
+def test_build_recipes_parallel_collects_failures(
+    build_recipe_mock, _rattler_build_hash_mock, db_access, tmp_path, monkeypatch
+):
+    """A failing build should not abort the other builds running in parallel"""
+    monkeypatch.chdir(tmp_path)
+
+    def fake_build(recipe: Recipe, output_dir: Path, build_info: BuildInfo):
+        state = (
+            BuildState.FAIL if recipe.name == "parallel-fail" else BuildState.SUCCESS
+        )
+        return BuildResult(
+            build=Build(
+                recipe_name=recipe.name,
+                state=state,
+                build_tool_hash=build_info.rattler_build_hash,
+                recipe_hash=recipe.content_hash,
+                platform_name=build_info.platform,
+                platform_version=build_info.platform_version,
+            )
+        )
+
+    build_recipe_mock.side_effect = fake_build
+    recipes = [
+        Recipe(name=name, path=f"{name}/recipe.yaml", raw_config="", content_hash=name)
+        for name in ["parallel-fail", "parallel-ok-1", "parallel-ok-2"]
+    ]
+
+    with pytest.raises(ValueError, match="parallel-fail"):
+        build_recipes(recipes, tmp_path, jobs=3)
+
+    assert build_recipe_mock.call_count == 3
+    saved = db_access.session.exec(
+        select(Build).where(Build.build_tool_hash == "parallel-hash")
+    ).all()
+    assert sorted(build.recipe_name for build in saved) == [
+        "parallel-fail",
+        "parallel-ok-1",
+        "parallel-ok-2",
+    ]
+
+
+@patch("repror.cli.build_recipe.rattler_build_hash", return_value="pipeline-hash")
+@patch("repror.cli.build_recipe.rebuild_package")
+@patch("repror.cli.build_recipe.build_recipe")
+def test_build_and_rebuild_recipes_pipeline(
+    build_recipe_mock,
+    rebuild_package_mock,
+    _rattler_build_hash_mock,
+    db_access,
+    tmp_path,
+    monkeypatch,
+):
+    """The rebuild of the first recipe should run while the second one is still building"""
+    monkeypatch.chdir(tmp_path)
+    first_rebuilt = threading.Event()
+
+    def fake_build(recipe: Recipe, output_dir: Path, build_info: BuildInfo):
+        if recipe.name == "pipeline-2":
+            # Only finishes early when the rebuild of pipeline-1 is overlapping
+            assert first_rebuilt.wait(timeout=10)
+        return BuildResult(
+            build=Build(
+                recipe_name=recipe.name,
+                state=BuildState.SUCCESS,
+                build_tool_hash=build_info.rattler_build_hash,
+                recipe_hash=recipe.content_hash,
+                platform_name=build_info.platform,
+                platform_version=build_info.platform_version,
+                build_loc=str(output_dir / f"{recipe.name}.conda"),
+            )
+        )
+
+    def fake_rebuild(build: Build, recipe: Recipe, tmp_dir: Path, build_info):
+        assert build.id is not None
+        first_rebuilt.set()
+        return RebuildResult(
+            rebuild=Rebuild(
+                build_id=build.id,
+                state=BuildState.SUCCESS,
+                rebuild_hash="hash",
+                build=build,
+            )
+        )
+
+    build_recipe_mock.side_effect = fake_build
+    rebuild_package_mock.side_effect = fake_rebuild
+    recipes = [
+        Recipe(name=name, path=f"{name}/recipe.yaml", raw_config="", content_hash=name)
+        for name in ["pipeline-1", "pipeline-2"]
+    ]
+
+    build_and_rebuild_recipes(recipes, tmp_path, jobs=2)
+
+    assert rebuild_package_mock.call_count == 2
+    rebuilt = db_access.session.exec(
+        select(Build.recipe_name)
+        .join(Rebuild)
+        .where(Build.build_tool_hash == "pipeline-hash")
+    ).all()
+    assert sorted(rebuilt) == ["pipeline-1", "pipeline-2"]
+
+
+@patch("repror.cli.build_recipe.rattler_build_hash", return_value="peak-hash")
+@patch("repror.cli.build_recipe.rebuild_package")
+@patch("repror.cli.build_recipe.build_recipe")
+def test_build_and_rebuild_recipes_pipeline_jobs(
+    build_recipe_mock,
+    rebuild_package_mock,
+    _rattler_build_hash_mock,
+    db_access,
+    tmp_path,
+    monkeypatch,
+):
+    """Builds and rebuilds together never run more than `jobs` at once"""
+    monkeypatch.chdir(tmp_path)
+    lock = threading.Lock()
+    running = 0
+    peak = 0
+
+    def track_running():
+        nonlocal running, peak
+        with lock:
+            running += 1
+            peak = max(peak, running)
+        time.sleep(0.05)
+        with lock:
+            running -= 1
+
+    def fake_build(recipe: Recipe, output_dir: Path, build_info: BuildInfo):
+        track_running()
+        return BuildResult(
+            build=Build(
+                recipe_name=recipe.name,
+                state=BuildState.SUCCESS,
+                build_tool_hash=build_info.rattler_build_hash,
+                recipe_hash=recipe.content_hash,
+                platform_name=build_info.platform,
+                platform_version=build_info.platform_version,
+                build_loc=str(output_dir / f"{recipe.name}.conda"),
+            )
+        )
+
+    def fake_rebuild(build: Build, recipe: Recipe, tmp_dir: Path, build_info):
+        track_running()
+        return RebuildResult(
+            rebuild=Rebuild(
+                build_id=build.id,
+                state=BuildState.SUCCESS,
+                rebuild_hash="hash",
+                build=build,
+            )
+        )
+
+    build_recipe_mock.side_effect = fake_build
+    rebuild_package_mock.side_effect = fake_rebuild
+    recipes = [
+        Recipe(name=name, path=f"{name}/recipe.yaml", raw_config="", content_hash=name)
+        for name in [f"peak-{i}" for i in range(6)]
+    ]
+
+    build_and_rebuild_recipes(recipes, tmp_path, jobs=2)
+
+    assert build_recipe_mock.call_count == rebuild_package_mock.call_count == 6
+    assert peak == 2
@@ -1,11 +1,53 @@
+import asyncio
+import gzip
+import hashlib
+import os
+import sys
+import time
+from dataclasses import asdict
+from pathlib import Path
+
 import pytest
 from typing import List
+from repror.internals.db import BuildState, Rebuild
 from repror.internals.commands import (
+    HASH_CHUNK_SIZE,
+    ResourceUsage,
     StreamType,
+    calculate_digest,
+    calculate_hash,
+    run_async_command,
     run_streaming_command,
     StreamingCmdOutput,
 )
 
+# Writes a lot of output to both streams, more than fits in a pipe buffer
+COMMAND_CHATTY = [
+    "python",
+    "-c",
+    "import sys\n"
+    "for i in range(20000):\n"
+    "    print(f'out {i}')\n"
+    "    print(f'err {i}', file=sys.stderr)",
+]
+
+# Writes every line of both streams in two parts
+COMMAND_PARTIAL_LINES = [
+    "python",
+    "-c",
+    "import sys, time\n"
+    "for i in range(200):\n"
+    "    for stream in (sys.stdout, sys.stderr):\n"
+    "        stream.write(f'{stream.name[4:7]} ')\n"
+    "        stream.flush()\n"
+    "    # Let the halves of the lines be read on their own\n"
+    "    time.sleep(0.001)\n"
+    "    for stream in (sys.stdout, sys.stderr):\n"
+    "        stream.write(f'{i}\\n')\n"
+    "        stream.flush()",
+]
+PARTIAL_LINES = sorted(f"{stream} {i}" for stream in ("out", "err") for i in range(200))
+
 # Example commands and expected outputs
 COMMAND_SUCCESS = ["python", "-c", "print('Hello, World!')"]
 COMMAND_ERROR = ["python", "-c", "import sys; sys.stderr.write('error'); sys.exit(1)"]
@@ -29,3 +71,146 @@ def test_run_streaming_command(
     assert result.return_code == expected_output.return_code
     assert result.stderr == expected_output.stderr
     assert result.stdout == expected_output.stdout
+
+
+def test_run_streaming_command_echoes_both_streams(capsys) -> None:
+    command = [
+        "python",
+        "-c",
+        "import sys; print('out'); print('err', file=sys.stderr)",
+    ]
+    # The chosen stream goes to stdout, the other one to where it belongs
+    run_streaming_command(command, stream_type=StreamType.STDERR)
+    captured = capsys.readouterr()
+    assert sorted(captured.out.splitlines()) == ["err", "out"]
+
+    run_streaming_command(command, stream_type=StreamType.STDOUT)
+    captured = capsys.readouterr()
+    assert (captured.out, captured.err) == ("out\n", "err\n")
+
+
+def test_run_streaming_command_bounded_output(tmp_path: Path) -> None:
+    log_path = tmp_path / "build.log.gz"
+    result = run_streaming_command(
+        COMMAND_CHATTY, stream_type=StreamType.STDERR, tail_size=100, log_path=log_path
+    )
+    assert result.return_code == 0
+    assert result.resource_usage and result.resource_usage.wall_time > 0
+    if os.name == "posix":
+        assert result.resource_usage.max_rss
+    # Only the tail of each stream is kept
+    assert len(result.stdout) == 100
+    assert result.stdout.endswith("out 19999\n")
+    assert len(result.stderr) == 100
+    assert result.stderr.endswith("err 19999\n")
+
+    # The complete output of both streams is in the log
+    log = gzip.decompress(log_path.read_bytes()).decode().splitlines()
+    assert len(log) == 40000
+    assert "out 0" in log and "err 19999" in log
+    # Lines of both streams are not mixed up
+    assert sorted(log) == sorted(
+        f"{stream} {i}" for stream in ("out", "err") for i in range(20000)
+    )
+
+
+def test_run_async_command(capsys, tmp_path: Path) -> None:
+    log_path = tmp_path / "build.log.gz"
+
+    async def run_both():
+        return await asyncio.gather(
+            run_async_command(COMMAND_SUCCESS, prefix="[success] "),
+            run_async_command(COMMAND_ERROR, prefix="[error] "),
+            run_async_command(COMMAND_PARTIAL_LINES, log_path=log_path, silent=True),
+        )
+
+    success, error, partial_lines = asyncio.run(run_both())
+    assert (success.stdout, success.stderr, success.return_code) == (
+        EXPECTED_SUCCESS.stdout,
+        EXPECTED_SUCCESS.stderr,
+        EXPECTED_SUCCESS.return_code,
+    )
+    assert (error.stdout, error.stderr, error.return_code) == (
+        EXPECTED_ERROR.stdout,
+        EXPECTED_ERROR.stderr,
+        EXPECTED_ERROR.return_code,
+    )
+    assert not success.timed_out
+    assert success.resource_usage.wall_time > 0
+    if os.name == "posix":
+        assert success.resource_usage.cpu_time is not None
+        assert success.resource_usage.max_rss
+
+    # Every line is printed with the prefix of its command
+    printed = capsys.readouterr().out.splitlines()
+    assert "[success] Hello, World!" in printed
+    assert "[error] error" in printed
+
+    # Lines of both streams are not mixed up in the log
+    assert partial_lines.return_code == 0
+    log = gzip.decompress(log_path.read_bytes()).decode().splitlines()
+    assert sorted(log) == PARTIAL_LINES
+
+
+# The child keeps the pipes open, so the command only finishes if it is killed too
+COMMAND_WITH_CHILD = [
+    sys.executable,
+    "-c",
+    "import subprocess, sys, time\n"
+    "subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(30)'])\n"
+    "print('started', flush=True)\n"
+    "time.sleep(30)",
+]
+
+
+@pytest.mark.skipif(os.name != "posix", reason="process groups are POSIX only")
+def test_run_streaming_command_timeout_kills_process_group() -> None:
+    start = time.monotonic()
+    result = run_streaming_command(COMMAND_WITH_CHILD, timeout=1)
+    assert time.monotonic() - start < 10
+    assert result.timed_out
+    assert result.return_code != 0
+    assert result.stdout == "started\n"
+
+    assert not run_streaming_command(COMMAND_SUCCESS, timeout=10).timed_out
+
+
+@pytest.mark.skipif(os.name != "posix", reason="process groups are POSIX only")
+def test_run_async_command_timeout_kills_process_group() -> None:
+    start = time.monotonic()
+    result = asyncio.run(run_async_command(COMMAND_WITH_CHILD, timeout=1, silent=True))
+    assert time.monotonic() - start < 10
+    assert result.timed_out
+    assert result.return_code != 0
+    assert result.stdout == "started\n"
+
+
+def test_resource_usage_from_row() -> None:
+    usage = ResourceUsage(wall_time=3.0, user_time=1.5, system_time=0.5, max_rss=1024)
+    rebuild = Rebuild(build_id=1, state=BuildState.SUCCESS, **asdict(usage))
+    assert ResourceUsage.from_row(rebuild) == usage
+    assert ResourceUsage.from_row(rebuild).cpu_time == 2.0
+    # Rebuilds from before the resource usage was recorded
+    assert ResourceUsage.from_row(Rebuild(build_id=1, state=BuildState.FAIL)) is None
+
+
+def test_calculate_digest(tmp_path: Path) -> None:
+    # Larger than a single chunk, and not a multiple of the chunk size
+    content = os.urandom(HASH_CHUNK_SIZE * 2 + 123)
+    conda_file = tmp_path / "package.conda"
+    conda_file.write_bytes(content)
+
+    digest = calculate_digest(conda_file)
+    assert digest.sha256 == hashlib.sha256(content).hexdigest()
+    assert digest.md5 == hashlib.md5(content).hexdigest()
+    assert digest.size == len(content)
+    assert calculate_hash(conda_file) == digest.sha256
+
+
+def test_calculate_digest_empty_file(tmp_path: Path) -> None:
+    conda_file = tmp_path / "empty.conda"
+    conda_file.touch()
+
+    digest = calculate_digest(conda_file)
+    assert digest.sha256 == hashlib.sha256(b"").hexdigest()
+    assert digest.size == 0
@@ -0,0 +1,33 @@
+import pytest
+from sqlalchemy.exc import OperationalError
+from sqlmodel import Session, SQLModel, select
+
+from repror.internals.db import Build, BuildState, create_sqlite_engine
+
+
+def test_sqlite_engine_profile(tmp_path):
+    database = str(tmp_path / "repro.db")
+    engine = create_sqlite_engine(database)
+    SQLModel.metadata.create_all(engine)
+    with engine.connect() as connection:
+        assert connection.exec_driver_sql("PRAGMA journal_mode").scalar() == "wal"
+        assert connection.exec_driver_sql("PRAGMA synchronous").scalar() == 1
+
+    with Session(engine) as session:
+        session.add(
+            Build(
+                recipe_name="boltons",
+                state=BuildState.SUCCESS,
+                build_tool_hash="rattler-build",
+                recipe_hash="hash",
+                platform_name="linux",
+                platform_version="1",
+            )
+        )
+        session.commit()
+
+    read_only_engine = create_sqlite_engine(database, read_only=True)
+    with Session(read_only_engine) as session:
+        assert session.exec(select(Build.recipe_name)).all() == ["boltons"]
+        with pytest.raises(OperationalError, match="readonly|read-only"):
+            session.exec(Build.__table__.delete())
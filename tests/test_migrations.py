@@ -0,0 +1,88 @@
+import pytest
+from sqlalchemy import inspect
+from sqlmodel import SQLModel, create_engine
+
+from repror.internals import db
+from repror.internals.migrations import (
+    MIGRATIONS,
+    DatabaseNotMigratedError,
+    check_migrated,
+    migrate,
+    schema_version,
+)
+
+
+def test_migrate_existing_database(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'repro.db'}")
+    # A database created before the indexes were declared
+    with engine.begin() as connection:
+        connection.exec_driver_sql(
+            "CREATE TABLE build (id INTEGER PRIMARY KEY, recipe_name VARCHAR, "
+            "state VARCHAR, build_tool_hash VARCHAR, recipe_hash VARCHAR, "
+            "platform_name VARCHAR, platform_version VARCHAR, timestamp DATETIME)"
+        )
+        connection.exec_driver_sql(
+            "CREATE TABLE rebuild (id INTEGER PRIMARY KEY, build_id INTEGER, "
+            "state VARCHAR, timestamp DATETIME)"
+        )
+        connection.exec_driver_sql(
+            "CREATE TABLE v1_rebuild (id INTEGER PRIMARY KEY, "
+            "platform_name VARCHAR, timestamp DATETIME)"
+        )
+        connection.exec_driver_sql("CREATE TABLE remoterecipe (id INTEGER PRIMARY KEY)")
+        connection.exec_driver_sql(
+            "INSERT INTO build (id, recipe_name, platform_name, timestamp) VALUES "
+            "(1, 'boltons', 'linux', '2023-01-01 12:00:00.000000'), "
+            "(2, 'boltons', 'linux', '2023-06-01 12:00:00.000000'), "
+            "(3, 'boltons', 'darwin', '2023-01-01 12:00:00.000000')"
+        )
+
+    # Same as `create_db_and_tables`
+    SQLModel.metadata.create_all(engine)
+    migrate(engine)
+
+    indexes = {index["name"] for index in inspect(engine).get_indexes("build")}
+    columns = {column["name"] for column in inspect(engine).get_columns("rebuild")}
+    assert {"wall_time", "max_rss", "artifact_size"} <= columns
+    assert {
+        "ix_build_recipe_lookup",
+        "ix_build_platform_recipe",
+        "ix_build_timestamp",
+    } <= indexes
+    with engine.connect() as connection:
+        assert schema_version(connection) == len(MIGRATIONS)
+        latest_builds = connection.exec_driver_sql(
+            "SELECT platform_name, build_id FROM latest_build ORDER BY platform_name"
+        ).all()
+        assert latest_builds == [("darwin", 3), ("linux", 2)]
+
+    # Migrating again is a no-op
+    migrate(engine)
+
+
+def test_migrations_are_distinct():
+    # Every schema version is one named change
+    assert len({migration.__name__ for migration in MIGRATIONS}) == len(MIGRATIONS)
+
+
+def test_read_only_engine_on_old_schema(tmp_path, monkeypatch):
+    database = tmp_path / "repro.db"
+    engine = create_engine(f"sqlite:///{database}")
+    # A database from before the migrations, at user_version 0
+    with engine.begin() as connection:
+        connection.exec_driver_sql(
+            "CREATE TABLE build (id INTEGER PRIMARY KEY, recipe_name VARCHAR, "
+            "state VARCHAR, build_tool_hash VARCHAR, recipe_hash VARCHAR, "
+            "platform_name VARCHAR, platform_version VARCHAR, timestamp DATETIME)"
+        )
+
+    monkeypatch.setattr(db, "engine", None)
+    monkeypatch.setenv("REPRO_DB_NAME", str(database))
+    # A read-only engine can not migrate, so it refuses to open the database
+    with pytest.raises(DatabaseNotMigratedError, match="needs migrating"):
+        db.setup_engine(read_only=True)
+    assert db.engine is None
+
+    SQLModel.metadata.create_all(engine)
+    migrate(engine)
+    check_migrated(db.create_sqlite_engine(str(database), read_only=True))
@@ -0,0 +1,165 @@
+import gzip
+import json
+from pathlib import Path
+import time
+from unittest.mock import patch
+
+import pytest
+from sqlmodel import func, select
+
+from repror.internals.db import (
+    Build,
+    BuildState,
+    Rebuild,
+    V1Rebuild,
+    get_rebuild_data,
+    setup_local_db,
+)
+from repror.internals.options import PatchFormat
+from repror.internals import patch_database
+from repror.internals.patch_database import patch_builds_to_db
+from repror.internals.patcher import (
+    iter_build_patches,
+    load_patches,
+    load_v1_patches,
+    save_patch,
+)
+
+
+def write_build_patches(build_info, count: int, prefix: str = "recipe"):
+    for index in range(count):
+        build = Build(
+            recipe_name=f"{prefix}-{index}",
+            state=BuildState.SUCCESS,
+            build_tool_hash="rattler-build",
+            recipe_hash="hash",
+            platform_name="linux",
+            platform_version="1",
+            build_hash=f"hash-{index}",
+        )
+        recipe_dir = build_info / "linux" / build.recipe_name
+        recipe_dir.mkdir(parents=True)
+        (recipe_dir / "build.json").write_text(build.model_dump_json())
+        # Every other recipe is rebuilt as well
+        if index % 2 == 0:
+            rebuild = Rebuild(
+                build_id=0, state=BuildState.SUCCESS, rebuild_hash=f"hash-{index}"
+            )
+            (recipe_dir / "rebuild.json").write_text(rebuild.model_dump_json())
+
+
+def test_patch_builds_to_db(tmp_path):
+    build_info = tmp_path / "build_info"
+    write_build_patches(build_info, 1000)
+
+    session = setup_local_db()
+    session.kw["bind"].echo = False
+    with (
+        patch("repror.internals.db.get_session", side_effect=session),
+        patch("repror.internals.patcher.get_session", side_effect=session),
+        patch.object(patch_database, "PATCH_BATCH_SIZE", 300),
+        patch.object(patch_database, "load_patches", wraps=load_patches) as load,
+    ):
+        start = time.perf_counter()
+        assert patch_builds_to_db(str(build_info)) == 1000
+        assert time.perf_counter() - start < 5
+        # The patches are streamed into the database in batches
+        assert [len(call.args[0]) for call in load.call_args_list] == [
+            300,
+            300,
+            300,
+            100,
+        ]
+
+        builds = {build.recipe_name: build for build in get_rebuild_data()}
+
+    assert len(builds) == 1000
+    assert builds["recipe-0"].timestamp is not None
+    assert builds["recipe-0"].rebuilds[0].rebuild_hash == "hash-0"
+    assert builds["recipe-1"].rebuilds == []
+
+
+def test_merge_patches_twice(tmp_path):
+    build_info = tmp_path / "build_info"
+    write_build_patches(build_info, 3)
+
+    session = setup_local_db()
+    session.kw["bind"].echo = False
+    with (
+        patch("repror.internals.db.get_session", side_effect=session),
+        patch("repror.internals.patcher.get_session", side_effect=session),
+    ):
+        assert patch_builds_to_db(str(build_info)) == 3
+        # A new patch is merged, the ones merged before are skipped
+        write_build_patches(build_info / "next", 1, prefix="next")
+        assert patch_builds_to_db(str(build_info)) == 1
+        assert patch_builds_to_db(str(build_info)) == 0
+
+    with session() as db_session:
+        assert db_session.exec(select(func.count(Build.id))).one() == 4
+        assert db_session.exec(select(func.count(Rebuild.id))).one() == 3
+
+
+def test_load_v1_patches(tmp_path):
+    v1_dir = tmp_path / "v1" / "linux"
+    v1_dir.mkdir(parents=True)
+    for name in ["boltons", "numpy"]:
+        v1_rebuild = V1Rebuild(
+            package_name=name,
+            version="1.0",
+            original_url="url",
+            original_hash="hash",
+            state=BuildState.SUCCESS,
+            platform_name="linux",
+            platform_version="1",
+            build_tool_hash="rattler-build",
+        )
+        (v1_dir / f"{name}.json").write_text(json.dumps(v1_rebuild.model_dump()))
+
+    session = setup_local_db()
+    session.kw["bind"].echo = False
+    timings = {}
+    with patch("repror.internals.patcher.get_session", side_effect=session):
+        assert load_v1_patches(str(tmp_path / "v1"), timings) == 2
+
+    assert set(timings) == {"read", "ledger", "validate", "insert", "commit"}
+    with patch("repror.internals.patcher.get_session", side_effect=session):
+        assert load_v1_patches(str(tmp_path / "v1")) == 0
+    with session() as db_session:
+        assert db_session.exec(select(func.count(V1Rebuild.id))).one() == 2
+
+
+@pytest.mark.parametrize("patch_format", [PatchFormat.JSONL, PatchFormat.JSONL_GZ])
+def test_patch_log_formats(tmp_path, monkeypatch, patch_format):
+    monkeypatch.chdir(tmp_path)
+    build = Build(
+        recipe_name="boltons",
+        state=BuildState.SUCCESS,
+        build_tool_hash="rattler-build",
+        recipe_hash="hash",
+        platform_name="linux",
+        platform_version="1",
+        build_hash="hash",
+    )
+    rebuild = Rebuild(build_id=0, state=BuildState.SUCCESS, rebuild_hash="hash")
+    rebuild.build = build
+    # Written by separate processes in CI, appended to the same file
+    save_patch(build, patch_format)
+    save_patch(rebuild, patch_format)
+    assert [path.name for path in Path("build_info/linux").iterdir()] == [
+        f"boltons.{patch_format.value}"
+    ]
+
+    if patch_format == PatchFormat.JSONL_GZ:
+        # A job that was cancelled while appending leaves a truncated gzip member
+        patch_file = Path("build_info/linux/boltons.jsonl.gz")
+        member = gzip.compress(b'{"kind": "build", "platform": "linux"}\n')
+        patch_file.write_bytes(patch_file.read_bytes() + member[: len(member) // 2])
+
+    patches = list(iter_build_patches("build_info"))
+    assert [recipe_dir for recipe_dir, _ in patches] == [
+        str(Path("build_info/linux/boltons"))
+    ]
+    _, patch_for_recipe = patches[0]
+    assert patch_for_recipe["build"]["build_hash"] == "hash"
+    assert patch_for_recipe["rebuild"]["rebuild_hash"] == "hash"
@@ -1,9 +1,21 @@
+import hashlib
+import os
+import subprocess
 from repror.internals.config import load_all_recipes
 from pathlib import Path
 from typer.testing import CliRunner
+from unittest.mock import patch
 
 
 from repror.internals.db import RemoteRecipe
+from repror.internals import git
+from repror.internals.recipe import (
+    clone_remote_recipe,
+    load_recipe_manifest,
+    mirror_dir,
+    load_recipe_manifests,
+    recipe_files_hash,
+)
 
 
 runner = CliRunner()
@@ -19,14 +31,157 @@ def test_load_all_recipes_test():
         assert Path(local_path).exists()
 
 
-# def test_recipe_files_hash(setup_recipe_directory: Path):
-#     initial_content_hash = recipe_files_hash(setup_recipe_directory)
+def _uncached_recipe_files_hash(recipe_folder: Path) -> str:
+    """Reference implementation, the cache should never change the digest"""
+    total_hash = hashlib.sha256()
+    for file in recipe_folder.rglob("*"):
+        if file.is_file():
+            total_hash.update(file.read_bytes())
+        else:
+            total_hash.update(_uncached_recipe_files_hash(file).encode())
+    return total_hash.hexdigest()
 
-#     # modify build script
-#     build_script = setup_recipe_directory / "subfolder" / "script.sh"
-#     build_script.write_text("echo hellooo\n echo this is test")
 
-#     # Calculate the hash using the recipe_files_hash function
-#     modified_hash = recipe_files_hash(setup_recipe_directory)
+def test_recipe_files_hash(setup_recipe_directory: Path):
+    initial_content_hash = recipe_files_hash(setup_recipe_directory)
+    assert initial_content_hash == _uncached_recipe_files_hash(setup_recipe_directory)
 
-#     assert initial_content_hash != modified_hash
+    # modify build script
+    build_script = setup_recipe_directory / "subfolder" / "script.sh"
+    build_script.write_text("echo hellooo\n echo this is test")
+
+    # Calculate the hash using the recipe_files_hash function
+    modified_hash = recipe_files_hash(setup_recipe_directory)
+
+    assert initial_content_hash != modified_hash
+    assert modified_hash == _uncached_recipe_files_hash(setup_recipe_directory)
+
+
+def test_recipe_files_hash_is_cached(setup_recipe_directory: Path):
+    content_hash = recipe_files_hash(setup_recipe_directory)
+
+    # Nothing changed on disk, so no file should be read again
+    with patch.object(Path, "read_bytes", side_effect=AssertionError("file read")):
+        assert recipe_files_hash(setup_recipe_directory) == content_hash
+
+
+def test_recipe_manifest_is_cached(setup_recipe_directory: Path):
+    recipe_path = setup_recipe_directory / "recipe.yaml"
+    manifest = load_recipe_manifest(recipe_path)
+    assert manifest.name == "boltons"
+    assert manifest.raw_config == recipe_path.read_text(encoding="utf8")
+    assert manifest.content_hash == recipe_files_hash(setup_recipe_directory)
+
+    # Nothing changed on disk, so the recipe should not be read or parsed again
+    with patch.object(Path, "read_text", side_effect=AssertionError("file read")):
+        assert load_recipe_manifest(recipe_path) == manifest
+
+    recipe_path.write_text(recipe_path.read_text().replace("boltons", "boltons-new"))
+    modified = load_recipe_manifest(recipe_path)
+    assert modified.name == "boltons-new"
+    assert modified.content_hash != manifest.content_hash
+
+
+def test_recipe_manifests_in_process_pool(setup_recipe_directory: Path, tmp_path: Path):
+    recipe = (setup_recipe_directory / "recipe.yaml").read_text()
+    recipe_paths = []
+    for index in range(6):
+        recipe_path = tmp_path / f"recipe_{index}" / "recipe.yaml"
+        recipe_path.parent.mkdir()
+        recipe_path.write_text(recipe.replace("boltons", f"boltons-{index}"))
+        recipe_paths.append(recipe_path)
+
+    with patch("repror.internals.recipe.PROCESS_POOL_THRESHOLD", 2):
+        manifests = load_recipe_manifests(recipe_paths, processes=2)
+
+    # The results keep the order of the recipes
+    assert [manifest.name for manifest in manifests] == [
+        f"boltons-{index}" for index in range(6)
+    ]
+    assert manifests == [load_recipe_manifest(path) for path in recipe_paths]
+
+
+def _git(repo: Path, *args: str) -> str:
+    return subprocess.run(
+        ["git", *args], cwd=repo, check=True, capture_output=True, text=True
+    ).stdout.strip()
+
+
+def _commit_recipe(repo: Path, name: str, version: str) -> str:
+    recipe_dir = repo / "recipes" / name
+    recipe_dir.mkdir(parents=True, exist_ok=True)
+    (recipe_dir / "recipe.yaml").write_text(
+        f"package:\n  name: {name}\n  version: {version}\n"
+    )
+    _git(repo, "add", ".")
+    _git(repo, "commit", "-q", "-m", f"{name} {version}")
+    return _git(repo, "rev-parse", "HEAD")
+
+
+def test_clone_remote_recipe_uses_mirror(tmp_path: Path):
+    origin = tmp_path / "origin"
+    origin.mkdir()
+    _git(origin, "init", "-q")
+    _git(origin, "config", "user.email", "repror@example.com")
+    _git(origin, "config", "user.name", "repror")
+    _commit_recipe(origin, "boltons", "1.0")
+    rev = _commit_recipe(origin, "pip", "1.0")
+    url = origin.as_uri()
+
+    with patch("repror.internals.git.clone_bare", wraps=git.clone_bare) as clone:
+        for recipe in ["boltons", "pip", "boltons"]:
+            repo_dir = clone_remote_recipe(
+                url, rev, tmp_path / recipe, Path("recipes") / recipe
+            )
+            assert (repo_dir / "recipes" / recipe / "recipe.yaml").exists()
+        # All recipes are exported from a single clone
+        assert clone.call_count == 1
+
+    # A new commit is fetched into the existing mirror
+    (origin / "recipes" / "boltons" / "shared.sh").symlink_to("../../../shared.sh")
+    new_rev = _commit_recipe(origin, "boltons", "2.0")
+    with patch("repror.internals.git.fetch_all", wraps=git.fetch_all) as fetch:
+        repo_dir = clone_remote_recipe(
+            url, new_rev, tmp_path / "new", Path("recipes/boltons")
+        )
+        assert fetch.call_count == 1
+    recipe = (repo_dir / "recipes/boltons/recipe.yaml").read_text()
+    assert "version: 2.0" in recipe
+    assert not (repo_dir / "recipes/pip").exists()
+    # Symlinks are kept, also when they point out of the repository
+    assert os.readlink(repo_dir / "recipes/boltons/shared.sh") == "../../../shared.sh"
+
+    # Every rev of a repository is exported on its own
+    old_dir = clone_remote_recipe(url, rev, tmp_path / "new", Path("recipes/boltons"))
+    assert old_dir != repo_dir
+    assert "version: 1.0" in (old_dir / "recipes/boltons/recipe.yaml").read_text()
+
+    # An annotated tag is fetched once, and then found in the mirror
+    _git(origin, "tag", "-a", "v2", "-m", "v2")
+    with patch("repror.internals.git.fetch_all", wraps=git.fetch_all) as fetch:
+        for export in ["tag", "tag-again"]:
+            clone_remote_recipe(url, "v2", tmp_path / export, Path("recipes/boltons"))
+        assert fetch.call_count == 1
+
+
+def test_clone_mirror_concurrently(tmp_path: Path):
+    origin = tmp_path / "origin"
+    origin.mkdir()
+    _git(origin, "init", "-q")
+    _git(origin, "config", "user.email", "repror@example.com")
+    _git(origin, "config", "user.name", "repror")
+    rev = _commit_recipe(origin, "boltons", "1.0")
+    url = origin.as_uri()
+    mirror = mirror_dir(url)
+    original_clone_bare = git.clone_bare
+
+    def clone_bare(repo_url: str, partial_mirror: Path):
+        # Another process finishes its clone while this one is cloning
+        original_clone_bare(repo_url, mirror)
+        return original_clone_bare(repo_url, partial_mirror)
+
+    with patch("repror.internals.git.clone_bare", side_effect=clone_bare):
+        repo_dir = clone_remote_recipe(url, rev, tmp_path, Path("recipes/boltons"))
+    assert (repo_dir / "recipes/boltons/recipe.yaml").exists()
+    # The clone that lost the race is removed
+    assert not list(mirror.parent.glob(f"{mirror.name}.partial-*"))
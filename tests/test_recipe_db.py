@@ -1,6 +1,67 @@
-from repror.internals.db import get_total_unique_recipes
+from datetime import datetime
+from unittest.mock import patch
+
+from sqlalchemy import event
+
+from repror.internals.db import (
+    Build,
+    Rebuild,
+    get_rebuild_data,
+    get_total_unique_recipes,
+    save,
+    setup_local_db,
+)
 
 
 # Use the db_access fixture
 def test_recipe_db(db_access):
     assert get_total_unique_recipes(db_access.session) == 2
+
+
+def test_rebuild_data_loads_latest_rebuild(db_access):
+    # A second, newer rebuild of boltons
+    newest_rebuild = Rebuild(build_id=1, state="fail", rebuild_hash="rbhash5")
+    db_access.session.add(newest_rebuild)
+    db_access.session.flush()
+
+    statements = []
+    engine = db_access.session.get_bind()
+    listener = lambda *args: statements.append(args[2])  # noqa: E731
+    event.listen(engine, "before_cursor_execute", listener)
+    try:
+        builds = get_rebuild_data()
+        rebuilds = {build.recipe_name: build.rebuilds for build in builds}
+    finally:
+        event.remove(engine, "before_cursor_execute", listener)
+
+    # The rebuilds are loaded in the same query as the builds
+    assert len(statements) == 1
+    assert [rebuild.id for rebuild in rebuilds["boltons"]] == [newest_rebuild.id]
+    assert rebuilds["Recipe4Fail"] == []
+    assert rebuilds["boltons"][0].recipe_name == "boltons"
+
+
+def test_save_updates_latest_build():
+    session = setup_local_db()
+    with patch("repror.internals.db.get_session", side_effect=session):
+
+        def build(name: str, timestamp: datetime) -> Build:
+            return Build(
+                recipe_name=name,
+                state="success",
+                build_tool_hash="rattler-build",
+                recipe_hash="hash",
+                platform_name="linux",
+                platform_version="1",
+                timestamp=timestamp,
+            )
+
+        newer = build("boltons", datetime(2023, 6, 1))
+        save(newer)
+        # An older build, e.g. from a late patch, does not replace the latest one
+        save(build("boltons", datetime(2023, 1, 1)))
+        other = build("other", datetime(2023, 1, 1))
+        save(other)
+
+        latest = {build.recipe_name: build.id for build in get_rebuild_data()}
+        assert latest == {"boltons": newer.id, "other": other.id}
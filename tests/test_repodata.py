@@ -0,0 +1,182 @@
+import io
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from repror.cli.v1_sampler import find_package_in_repodata
+from repror.internals.repodata import JsonStream, fetch_repodata, iter_package_records
+
+REPODATA = {
+    "info": {"subdir": "linux-64"},
+    "packages": {
+        "boltons-24.0.0-pyhd8ed1ab_0.tar.bz2": {
+            "name": "boltons",
+            "version": "24.0.0",
+            "build": "pyhd8ed1ab_0",
+            "build_number": 0,
+            "depends": ["python >=3.7"],
+        }
+    },
+    "packages.conda": {
+        "pip-24.2-pyh8b19718_1.conda": {
+            "name": "pip",
+            "version": "24.2",
+            "build": "pyh8b19718_1",
+            "build_number": 1,
+            "depends": ["python >=3.8", "setuptools", "wheel"],
+        },
+        "boltons-24.1.0-pyhd8ed1ab_0.conda": {
+            "name": "boltons",
+            "version": "24.1.0",
+            "build": "pyhd8ed1ab_0",
+            "build_number": 0,
+            "sha256": "abc",
+            "size": 123,
+            "timestamp": 1700000000000,
+            "depends": ["python >=3.8"],
+            "license": "BSD-3-Clause",
+        },
+        "boltons-24.10.0-pyhd8ed1ab_0.conda": {
+            "name": "boltons",
+            "version": "24.10.0",
+            "build": "pyhd8ed1ab_0",
+            "build_number": 0,
+        },
+    },
+}
+
+
+class RepodataServer(ThreadingHTTPServer):
+    """Local stand-in for the conda channel, which counts the requests it gets."""
+
+    etag = '"v1"'
+    cache_control = "public, max-age=0"
+    requests: list[str]
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), RepodataHandler)
+        self.requests = []
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}/linux-64/repodata.json"
+
+
+class RepodataHandler(BaseHTTPRequestHandler):
+    server: RepodataServer
+
+    def do_GET(self):
+        if self.headers.get("If-None-Match") == self.server.etag:
+            self.server.requests.append("not modified")
+            self.send_response(304)
+            self.send_header("Cache-Control", self.server.cache_control)
+            self.end_headers()
+            return
+        self.server.requests.append("full")
+        body = json.dumps(REPODATA).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", self.server.etag)
+        self.send_header("Cache-Control", self.server.cache_control)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def repodata_server():
+    server = RepodataServer()
+    thread = threading.Thread(
+        target=server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True
+    )
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_fetch_repodata_revalidates(repodata_server: RepodataServer):
+    repodata = fetch_repodata(repodata_server.url).to_dict()
+    # Only the used fields are kept
+    assert repodata["packages.conda"]["boltons-24.1.0-pyhd8ed1ab_0.conda"] == {
+        "name": "boltons",
+        "version": "24.1.0",
+        "build": "pyhd8ed1ab_0",
+        "build_number": 0,
+        "sha256": "abc",
+        "size": 123,
+        "timestamp": 1700000000000,
+    }
+    assert "info" not in repodata
+
+    # The cached copy is revalidated, and not transferred again
+    assert fetch_repodata(repodata_server.url).to_dict() == repodata
+    assert repodata_server.requests == ["full", "not modified"]
+
+    # A changed repodata is transferred again
+    repodata_server.etag = '"v2"'
+    assert fetch_repodata(repodata_server.url).to_dict() == repodata
+    assert repodata_server.requests == ["full", "not modified", "full"]
+
+
+def test_fetch_repodata_fresh_cache(repodata_server: RepodataServer):
+    repodata_server.cache_control = "public, max-age=600"
+    repodata = fetch_repodata(repodata_server.url).to_dict()
+
+    # While the response is fresh, the server is not asked again
+    assert fetch_repodata(repodata_server.url).to_dict() == repodata
+    assert repodata_server.requests == ["full"]
+
+
+def test_repodata_index(repodata_server: RepodataServer):
+    index = fetch_repodata(repodata_server.url)
+    assert [record.filename for record in index.records("pip")] == [
+        "pip-24.2-pyh8b19718_1.conda"
+    ]
+    assert index.records("unknown") == []
+    assert index.names() == {"pip", "boltons"}
+    assert index.names("packages") == {"boltons"}
+    assert index.count() == 3
+
+    repodata = index.to_dict(names=["pip", "unknown"])
+    assert list(repodata["packages.conda"]) == ["pip-24.2-pyh8b19718_1.conda"]
+    assert repodata["packages"] == {}
+
+    # Only packages with a timestamp since the cutoff
+    assert [record.filename for record in index.recent(1600000000000)] == [
+        "boltons-24.1.0-pyhd8ed1ab_0.conda"
+    ]
+    assert index.recent(1800000000000) == []
+
+    # The .conda package with the highest version is preferred
+    package = find_package_in_repodata("boltons", index, "linux-64")
+    assert package and package.filename == "boltons-24.10.0-pyhd8ed1ab_0.conda"
+    latest = index.latest("boltons")
+    assert latest and latest.filename == "boltons-24.10.0-pyhd8ed1ab_0.conda"
+    assert index.latest("unknown") is None
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 1024])
+def test_json_stream(chunk_size: int):
+    document = json.dumps({"number": 12345, "nested": {"a": [1, {"b": "}"}]}})
+    stream = JsonStream(io.BytesIO(document.encode()), chunk_size=chunk_size)
+    values = {key: stream.value() for key in stream.keys()}
+    assert values == json.loads(document)
+    assert stream.peek() == ""
+
+
+def test_iter_package_records():
+    file = io.BytesIO(json.dumps(REPODATA, indent=2).encode())
+    records = list(iter_package_records(file))
+    assert [(key, filename) for key, filename, _ in records] == [
+        ("packages", "boltons-24.0.0-pyhd8ed1ab_0.tar.bz2"),
+        ("packages.conda", "pip-24.2-pyh8b19718_1.conda"),
+        ("packages.conda", "boltons-24.1.0-pyhd8ed1ab_0.conda"),
+        ("packages.conda", "boltons-24.10.0-pyhd8ed1ab_0.conda"),
+    ]
+    assert all("depends" not in record for _, _, record in records)
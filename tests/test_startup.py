@@ -0,0 +1,64 @@
+import subprocess
+import sys
+
+from typer.testing import CliRunner
+
+from repror.cli.cli import app
+from repror.internals.import_profile import parse_import_times
+
+# Importing the CLI should not run any subprocess or import modules
+# that are only needed by a few commands
+CHECK_IMPORT = """
+import subprocess
+import sys
+
+def fail(*args, **kwargs):
+    raise AssertionError(f"subprocess started at import time: {args}")
+
+subprocess.run = subprocess.Popen = fail
+
+import repror.repror
+
+lazy_modules = {
+    "requests",
+    "sqlalchemy",
+    "sqlmodel",
+    "jinja2",
+    "yaml",
+    "repror.cli.v1_sampler",
+}
+assert not lazy_modules & set(sys.modules), lazy_modules & set(sys.modules)
+"""
+
+
+def test_cli_import_has_no_side_effects():
+    result = subprocess.run(
+        [sys.executable, "-c", CHECK_IMPORT], capture_output=True, text=True
+    )
+    assert result.returncode == 0, result.stderr
+
+
+def test_lazy_subgroup_help():
+    result = CliRunner().invoke(app, ["--in-memory-sql", "v1", "--help"])
+    assert result.exit_code == 0, result.output
+    assert "sample" in result.output
+    # Only the top level command offers shell completion
+    assert "--install-completion" not in result.output
+
+
+def test_parse_import_times():
+    stderr = "\n".join(
+        [
+            "import time: self [us] | cumulative | imported package",
+            "import time:       100 |        100 |   yaml.error",
+            "import time:       250 |        350 | yaml",
+            "Running on repro.local.db",
+        ]
+    )
+    import_times, other_lines = parse_import_times(stderr)
+
+    assert [(t.module, t.cumulative_us, t.depth) for t in import_times] == [
+        ("yaml.error", 100, 1),
+        ("yaml", 350, 0),
+    ]
+    assert other_lines == ["Running on repro.local.db"]
@@ -0,0 +1,191 @@
+import dataclasses
+import hashlib
+import shutil
+import threading
+from pathlib import Path
+
+import pytest
+
+from repror.cli import v1_sampler
+from repror.cli.v1_sampler import (
+    DownloadedPackage,
+    OriginalBuildInfo,
+    PackageInfo,
+    V1RebuildResult,
+    download_v1_package,
+    rebuild_v1_packages,
+)
+from repror.internals.commands import StreamingCmdOutput
+from repror.internals.db import BuildState
+
+
+def package_info(name: str) -> PackageInfo:
+    return PackageInfo(
+        name=name,
+        version="1.0",
+        build="h0_0",
+        build_number=0,
+        subdir="linux-64",
+        filename=f"{name}-1.0-h0_0.conda",
+        url=f"https://conda.anaconda.org/conda-forge/linux-64/{name}-1.0-h0_0.conda",
+        sha256="",
+        size=0,
+    )
+
+
+def test_rebuild_v1_packages_pipeline(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    packages = [package_info(name) for name in ["a", "b", "c", "d", "missing"]]
+    lock = threading.Lock()
+    third_download_started = threading.Event()
+    downloaded_names: list[str] = []
+    in_flight: set[str] = set()
+    max_in_flight = 0
+    saved: list[str] = []
+
+    def download(pkg_info: PackageInfo, work_dir: Path):
+        nonlocal max_in_flight
+        with lock:
+            downloaded_names.append(pkg_info.name)
+            in_flight.add(pkg_info.name)
+            max_in_flight = max(max_in_flight, len(in_flight))
+            if len(downloaded_names) == 3:
+                third_download_started.set()
+        if pkg_info.name == "missing":
+            return None
+        original_file = work_dir / pkg_info.filename
+        original_file.write_bytes(b"package")
+        return DownloadedPackage(
+            pkg_info=pkg_info,
+            original_file=original_file,
+            original_hash="hash",
+            build_info=OriginalBuildInfo("rattler-build", "0.30.0"),
+        )
+
+    def rebuild(downloaded: DownloadedPackage, *args):
+        assert downloaded.original_file.exists()
+        # Later packages are downloaded while the first one rebuilds
+        if downloaded.pkg_info.name == "a":
+            assert third_download_started.wait(timeout=10)
+        with lock:
+            in_flight.discard(downloaded.pkg_info.name)
+        return V1RebuildResult(
+            package_name=downloaded.pkg_info.name,
+            version="1.0",
+            original_url=downloaded.pkg_info.url,
+            download_success=True,
+            rebuild_success=True,
+            reproducible=True,
+        )
+
+    def save(v1_rebuild, patch=False):
+        with lock:
+            saved.append(v1_rebuild.package_name)
+            in_flight.discard(v1_rebuild.package_name)
+
+    monkeypatch.setattr(v1_sampler, "download_v1_package", download)
+    monkeypatch.setattr(v1_sampler, "rebuild_downloaded_v1_package", rebuild)
+    monkeypatch.setattr(v1_sampler, "_save_v1_result", save)
+
+    results = {
+        pkg_info.name: result
+        for pkg_info, result in rebuild_v1_packages(
+            packages, tmp_path, "linux", "6.0", download_jobs=2, rebuild_jobs=1
+        )
+    }
+
+    assert set(results) == {"a", "b", "c", "d", "missing"}
+    assert all(
+        result and result.rebuild_success
+        for name, result in results.items()
+        if name != "missing"
+    )
+    missing = results["missing"]
+    assert missing and not missing.download_success
+    assert saved == ["missing"]
+    # Downloads only run ahead of the rebuilds by a bounded number of packages
+    assert max_in_flight <= 3
+    # Downloads are removed once their package is rebuilt
+    assert not list(tmp_path.glob("*.conda"))
+
+
+def test_rebuild_v1_packages_same_package(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+):
+    # The same package twice, and a package whose rebuild raises
+    packages = [package_info("a"), package_info("a"), package_info("broken")]
+    downloads = iter(range(len(packages)))
+    both_rebuilding = threading.Barrier(2, timeout=10)
+    saved = []
+
+    def download_package(pkg_info: PackageInfo, dest_dir: Path):
+        original_file = dest_dir / pkg_info.filename
+        # Every download differs, so a rebuild compared to another one is noticed
+        original_file.write_text(f"download {next(downloads)}")
+        return original_file
+
+    def rebuild_package(package_file: Path, output_dir: Path, rattler_build_path):
+        if package_file.name.startswith("broken"):
+            raise RuntimeError("rattler-build crashed")
+        both_rebuilding.wait()
+        shutil.copy(package_file, output_dir)
+        return StreamingCmdOutput(stdout="", stderr="", return_code=0)
+
+    monkeypatch.setattr(v1_sampler, "download_package", download_package)
+    monkeypatch.setattr(
+        v1_sampler,
+        "extract_build_info_from_conda",
+        lambda _: OriginalBuildInfo("rattler-build"),
+    )
+    monkeypatch.setattr(v1_sampler, "rebuild_package", rebuild_package)
+    monkeypatch.setattr(
+        v1_sampler,
+        "_save_v1_result",
+        lambda v1_rebuild, patch=False: saved.append(v1_rebuild),
+    )
+
+    results = [
+        result
+        for _, result in rebuild_v1_packages(
+            packages, tmp_path, "linux", "6.0", download_jobs=3, rebuild_jobs=2
+        )
+    ]
+
+    # Both rebuilds of the same package ran at once, each compared to its own download
+    reproducible = [r for r in results if r and r.package_name == "a"]
+    assert [r.reproducible for r in reproducible] == [True, True]
+    # The raised rebuild is saved as a failure
+    broken = next(r for r in results if r and r.package_name == "broken")
+    assert not broken.rebuild_success
+    assert broken.error_message == "Rebuild failed: rattler-build crashed"
+    failed = [v1 for v1 in saved if v1.state == BuildState.FAIL]
+    assert [(v1.package_name, v1.reason) for v1 in failed] == [
+        ("broken", "Rebuild failed: rattler-build crashed")
+    ]
+
+
+def test_download_v1_package_checks_repodata(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+):
+    content = b"package"
+
+    def download_package(pkg_info: PackageInfo, dest_dir: Path):
+        original_file = dest_dir / pkg_info.filename
+        original_file.write_bytes(content)
+        return original_file
+
+    monkeypatch.setattr(v1_sampler, "download_package", download_package)
+    monkeypatch.setattr(
+        v1_sampler,
+        "extract_build_info_from_conda",
+        lambda _: OriginalBuildInfo("rattler-build"),
+    )
+    sha256 = hashlib.sha256(content).hexdigest()
+    pkg_info = dataclasses.replace(package_info("a"), sha256=sha256, size=len(content))
+
+    downloaded = download_v1_package(pkg_info, tmp_path)
+    assert downloaded and downloaded.original_hash == sha256
+    # A download that does not match the repodata is rejected and removed
+    for mismatch in [{"sha256": "0" * 64}, {"size": len(content) + 1}]:
+        pkg_info_mismatch = dataclasses.replace(pkg_info, **mismatch)
+        assert download_v1_package(pkg_info_mismatch, tmp_path) is None
+    assert len(list(tmp_path.glob("downloads/*/*.conda"))) == 1
@@ -0,0 +1,64 @@
+import random
+
+import pytest
+
+from repror.internals.version import VersionOrder, version_order
+
+# The example of the conda documentation, every group is lower than the next one
+# and the versions within a group are equal
+ORDERED_VERSIONS = [
+    ["0.4", "0.4.0"],
+    ["0.4.1.rc", "0.4.1.RC"],
+    ["0.4.1"],
+    ["0.5a1"],
+    ["0.5b3"],
+    ["0.5C1"],
+    ["0.5"],
+    ["0.9.6"],
+    ["0.960923"],
+    ["1.0"],
+    ["1.1dev1"],
+    ["1.1_"],
+    ["1.1a1"],
+    ["1.1.0dev1", "1.1.dev1"],
+    ["1.1.a1"],
+    ["1.1.0rc1"],
+    ["1.1.0", "1.1"],
+    ["1.1.0post1", "1.1.post1"],
+    ["1.1post1"],
+    ["1996.07.12"],
+    ["1!0.4.1"],
+    ["1!3.1.1.6"],
+    ["2!0.4.1"],
+]
+
+
+def test_version_order():
+    groups = [
+        [VersionOrder(version) for version in group] for group in ORDERED_VERSIONS
+    ]
+    for group in groups:
+        assert len(set(group)) == 1
+    for lower, higher in zip(groups, groups[1:]):
+        assert lower[0] < higher[0]
+        assert not higher[0] < lower[0]
+
+    versions = [version for group in groups for version in group]
+    shuffled = list(versions)
+    random.Random(42).shuffle(shuffled)
+    assert sorted(shuffled) == versions
+
+
+@pytest.mark.parametrize(
+    "lower, higher",
+    [
+        ("1.9", "1.10"),
+        ("1.0-1", "1.0-2"),
+        ("1.0+1", "1.0+2"),
+        ("2023.9.1", "2023.10.1"),
+        ("1.0dev0", "1.0a0"),
+    ],
+)
+def test_version_order_numbers(lower: str, higher: str):
+    assert version_order(lower) < version_order(higher)
+    assert version_order(higher) > version_order(lower)